@@ -0,0 +1,90 @@
+"""
+Per-request authentication overhead of get_current_user: JWT decode plus the users
+lookup on every request (no cache) vs helpers.user_cache, sequentially and with
+concurrent requests for the same token (single-flight).
+
+Against the real database (SUPABASE_URL / SUPABASE_KEY / JWT_SECRET):
+    python -m app.benchmarks.auth_overhead --email user@example.com --user-id <uuid> [--requests 200]
+Offline, with the users lookup simulated as --latency-ms of network wait:
+    python -m app.benchmarks.auth_overhead --latency-ms 30
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.helpers import security
+from app.helpers.user_cache import UserCache
+
+
+class CountingLookup:
+    """get_user_by_email, or a simulated one, counting the round-trips"""
+
+    def __init__(self, latency: float, user_id: str):
+        self.latency = latency
+        self.user_id = user_id
+        self.calls = 0
+        self._real = security.get_user_by_email
+
+    def __call__(self, email: str):
+        self.calls += 1
+        if not self.latency:
+            return self._real(email)
+        time.sleep(self.latency)
+        return {"id": self.user_id, "email": email}
+
+
+class NoCache:
+    """The previous behaviour: every request reads the users table"""
+
+    def get(self, key, load):
+        return load()
+
+    def invalidate(self, key):
+        pass
+
+
+def run(credentials, requests: int, concurrency: int) -> list:
+    def one(_):
+        started = time.perf_counter()
+        security.get_current_user(credentials)
+        return time.perf_counter() - started
+
+    if concurrency == 1:
+        return [one(i) for i in range(requests)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", default="benchmark@example.com")
+    parser.add_argument("--user-id", default="00000000-0000-0000-0000-000000000000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="simulate the users lookup instead of querying the database")
+    args = parser.parse_args()
+
+    token = security.create_persistent_token(args.email, args.user_id)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    lookup = CountingLookup(args.latency_ms / 1000, args.user_id)
+    security.get_user_by_email = lookup
+
+    for name, make_cache in [("no cache", NoCache), ("user cache", UserCache)]:
+        for concurrency in (1, args.concurrency):
+            # A cold cache per run, so the concurrent run shows the single-flight misses
+            security.user_cache = make_cache()
+            lookup.calls = 0
+            started = time.perf_counter()
+            timings = sorted(run(credentials, args.requests, concurrency))
+            elapsed = time.perf_counter() - started
+            print(f"{name:<11} x{concurrency:<3} p50 {statistics.median(timings) * 1000:7.2f} ms  "
+                  f"p99 {timings[int(len(timings) * 0.99) - 1] * 1000:7.2f} ms  "
+                  f"{args.requests / elapsed:8.1f} req/s  {lookup.calls} users lookups")
+
+
+if __name__ == "__main__":
+    main()
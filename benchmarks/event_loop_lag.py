@@ -0,0 +1,120 @@
+"""
+Event-loop lag under concurrent requests: the synchronous supabase client (what the
+async handlers used to call) vs helpers.repository.
+
+Each of --concurrency coroutines runs --requests subscription lookups, as create_pretest does,
+while a probe coroutine sleeps --probe-ms at a time and records how late it wakes up.
+With the blocking client every round-trip stalls the whole loop, so lag grows with
+concurrency; with the repository it should stay flat.
+
+Against the real database (SUPABASE_URL / SUPABASE_KEY):
+    python -m app.benchmarks.event_loop_lag --user-id <uuid> [--concurrency 1 8 32 64] [--requests 10]
+Offline, with each round-trip simulated as --latency-ms of network wait:
+    python -m app.benchmarks.event_loop_lag --latency-ms 40
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+from app.helpers.repository import Repository
+
+
+def sync_lookup(latency: float):
+    """One blocking round-trip, made from inside a coroutine"""
+    if latency:
+        def lookup(user_id: str):
+            time.sleep(latency)
+    else:
+        from app.helpers.db import supabase
+
+        def lookup(user_id: str):
+            supabase.table("subscriptions").select("tier, status, end_date").eq("user_id", user_id) \
+                .eq("status", "active").order("created_at", desc=True).limit(1).execute()
+
+    async def run(user_id: str):
+        lookup(user_id)
+    return run
+
+
+def _repository(latency: float, max_connections: int) -> Repository:
+    if not latency:
+        return Repository(max_connections=max_connections)
+
+    async def respond(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return httpx.Response(200, content=json.dumps([{"tier": "starter", "status": "active", "end_date": None}]))
+    return Repository("http://postgrest.invalid", "benchmark", max_connections, transport=httpx.MockTransport(respond))
+
+
+def async_lookup(latency: float, max_connections: int):
+    repository = _repository(latency, max_connections)
+
+    async def run(user_id: str):
+        await repository.get_active_subscription(user_id)
+    return run, repository
+
+
+async def measure(lookup, user_id: str, concurrency: int, requests: int, probe: float) -> dict:
+    lags = []
+    done = asyncio.Event()
+
+    async def probe_loop():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(probe)
+            lags.append(time.perf_counter() - started - probe)
+
+    async def worker():
+        for _ in range(requests):
+            await lookup(user_id)
+
+    prober = asyncio.create_task(probe_loop())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await prober
+
+    lags = sorted(lags) or [0.0]
+    return {
+        "p50": statistics.median(lags),
+        "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+        "max": lags[-1],
+        "rps": concurrency * requests / elapsed,
+    }
+
+
+async def run(args):
+    latency = args.latency_ms / 1000
+    probe = args.probe_ms / 1000
+    for concurrency in args.concurrency:
+        print(f"\nconcurrency {concurrency} x {args.requests} requests")
+        implementations = [("sync client", sync_lookup(latency))]
+        repository_lookup, repository = async_lookup(latency, max(concurrency, 1))
+        implementations.append(("repository", repository_lookup))
+        for name, lookup in implementations:
+            result = await measure(lookup, args.user_id, concurrency, args.requests, probe)
+            print(f"  {name:<12} lag p50 {result['p50'] * 1000:7.1f} ms  p99 {result['p99'] * 1000:7.1f} ms  "
+                  f"max {result['max'] * 1000:7.1f} ms  {result['rps']:7.1f} req/s")
+        await repository.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", default="00000000-0000-0000-0000-000000000000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--probe-ms", type=float, default=10)
+    parser.add_argument("--latency-ms", type=float, default=0,
+                        help="simulate each round-trip instead of querying the database")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
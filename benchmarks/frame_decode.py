@@ -0,0 +1,100 @@
+"""
+Per-video frame decode time: the previous seek-per-frame samplers vs helpers.frame_decoder.
+
+Usage (from the directory containing the app package):
+    python -m app.benchmarks.frame_decode video1.mp4 [video2.mp4 ...] [--frames 8] [--repeat 3]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from app.helpers import frame_decoder
+
+
+def seek_per_frame_in_memory(video_path: str, max_frames: int, max_width: int = None) -> int:
+    """Previous _extract_frames_with_base64 / _extract_smart_frames strategy"""
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    count = 0
+    for frame_idx in np.linspace(0, total_frames - 1, max_frames, dtype=int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+        ret, frame = cap.read()
+        if ret:
+            height, width = frame.shape[:2]
+            if max_width and width > max_width:
+                frame = cv2.resize(frame, (max_width, int(height * max_width / width)))
+            success, _ = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            count += int(success)
+    cap.release()
+    return count
+
+
+def seek_per_frame_via_disk(video_path: str, max_frames: int, max_width: int = None) -> int:
+    """Previous _extract_frames_optimized / extract_frames_fast strategy"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        count = 0
+        for i, frame_idx in enumerate(np.linspace(0, total_frames - 1, max_frames, dtype=int)):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ret, frame = cap.read()
+            if ret:
+                height, width = frame.shape[:2]
+                if max_width and width > max_width:
+                    frame = cv2.resize(frame, (max_width, int(height * max_width / width)))
+                frame_filename = os.path.join(temp_dir, f"frame_{i:03d}.jpg")
+                cv2.imwrite(frame_filename, frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+                with open(frame_filename, 'rb') as f:
+                    f.read()
+                count += 1
+        cap.release()
+    return count
+
+
+def single_pass(video_path: str, max_frames: int, max_width: int = None) -> int:
+    frames, _ = frame_decoder.sample_frames(video_path, max_frames=max_frames, max_width=max_width)
+    return len(frames)
+
+
+def time_it(fn, video_path: str, max_frames: int, max_width: int, repeat: int):
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn(video_path, max_frames, max_width)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--max-width", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    implementations = [
+        ("seek + imencode", seek_per_frame_in_memory),
+        ("seek + imwrite", seek_per_frame_via_disk),
+        ("single pass", single_pass),
+    ]
+
+    for video_path in args.videos:
+        metadata = frame_decoder.probe(video_path)
+        print(f"\n{os.path.basename(video_path)}: {metadata['duration_seconds']}s, "
+              f"{metadata['total_frames']} frames @ {metadata['fps']} fps")
+        baseline = None
+        for name, fn in implementations:
+            elapsed, count = time_it(fn, video_path, args.frames, args.max_width, args.repeat)
+            baseline = baseline or elapsed
+            print(f"  {name:<18} {elapsed * 1000:8.1f} ms  ({count} frames, {baseline / elapsed:4.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
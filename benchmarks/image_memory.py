@@ -0,0 +1,118 @@
+"""
+Peak memory of one multi-image request: downloaded images held as bytes and sent as
+base64 strings (the previous pipeline) vs helpers.blob handles materialized by the gateway.
+
+Each mode runs in a fresh interpreter so ru_maxrss is the peak of that request alone.
+The request goes through LLMGateway and the real OpenAI client; httpx.MockTransport
+answers it, so nothing leaves the machine.
+
+Usage (from the directory containing the app package):
+    python -m app.benchmarks.image_memory [--images 8] [--width 4000] [--height 3000]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import httpx
+import numpy as np
+from openai import AsyncOpenAI
+from PIL import Image
+
+from app.helpers import image_budget
+from app.helpers.blob import Blob
+from app.helpers.llm_gateway import LLMGateway
+
+MODES = ("bytes", "blob")
+
+COMPLETION = {
+    "id": "chatcmpl-benchmark", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{}"}}],
+    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+}
+
+
+def write_images(directory: str, count: int, width: int, height: int) -> list:
+    """Noise JPEGs, which compress poorly and so stand in for large creatives"""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"creative_{i}.jpg")
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(path, quality=95)
+        paths.append(path)
+    return paths
+
+
+def load_images(mode: str, paths: list) -> list:
+    """What the download step hands to image preparation"""
+    if mode == "blob":
+        return [Blob.from_file(path, "image/jpeg") for path in paths]
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def image_parts(mode: str, images: list) -> list:
+    parts = image_budget.prepare_images(images, [image_budget.PRIORITY_IMAGE] * len(images), "pro", len(images))
+    if mode == "bytes":
+        # The previous encode() returned a data URL, carried in the messages for the whole call
+        parts = [{**part, "url": part["url"].data_url()} for part in parts if part]
+    return [{"type": "image_url", "image_url": part} for part in parts if part]
+
+
+async def send(parts: list):
+    gateway = LLMGateway()
+    gateway._client = AsyncOpenAI(
+        api_key="benchmark", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, json=COMPLETION))),
+    )
+    messages = [{"role": "user", "content": [{"type": "text", "text": "Analyze these creatives"}, *parts]}]
+    await gateway.chat("benchmark", model="gpt-4o", messages=messages)
+    await gateway.client.close()
+
+
+def _peak_rss_mb() -> float:
+    """ru_maxrss is in KB on Linux"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, paths: list):
+    imported = _peak_rss_mb()
+    images = load_images(mode, paths)
+    asyncio.run(send(image_parts(mode, images)))
+    print(imported, _peak_rss_mb())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args.mode, args.paths)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_images(directory, args.images, args.width, args.height)
+        size_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+        print(f"{args.images} images, {args.width}x{args.height}, {size_mb:.0f}MB on disk")
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "app.benchmarks.image_memory", "--mode", mode, "--paths", *paths],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            imported, peak = (float(value) for value in output.split()[-2:])
+            print(f"  {mode:<6} peak RSS {peak:7.1f} MB ({peak - imported:+.1f} MB over the interpreter after imports)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Lets the suite run from the checkout itself (pytest tests). The code imports itself as the
+app package, which normally means running from the directory above a checkout named app;
+here the checkout is registered as app whatever its directory is called.
+"""
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+if "app" not in sys.modules:
+    spec = importlib.machinery.ModuleSpec("app", None, is_package=True)
+    spec.submodule_search_locations = [ROOT]
+    sys.modules["app"] = importlib.util.module_from_spec(spec)
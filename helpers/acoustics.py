@@ -0,0 +1,198 @@
+import logging
+import os
+import subprocess
+from typing import Iterator
+
+import ffmpeg
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+N_FFT = 1024
+HOP_LENGTH = 512
+# Tempo search range and the prior librosa uses (log-normal around 120 BPM)
+MIN_BPM = 30
+MAX_BPM = 240
+START_BPM = 120
+# Fraction of the mean frame energy under which a frame counts as silent
+SILENCE_THRESHOLD = 0.1
+# Tempo is estimated from the onset envelope of (at most) the first few minutes
+TEMPO_WINDOW_SECONDS = 300
+# Streaming decodes and analyses the audio this many seconds at a time
+ACOUSTICS_BLOCK_SECONDS = float(os.getenv("ACOUSTICS_BLOCK_SECONDS", "10"))
+ACOUSTICS_STREAMING = os.getenv("ACOUSTICS_STREAMING", "true").lower() == "true"
+
+EMPTY_FEATURES = {
+    "duration_seconds": 0, "sample_rate": 0, "total_samples": 0,
+    "tempo_bpm": 0, "average_energy": 0, "energy_variance": 0,
+    "spectral_centroid_mean": 0, "zero_crossing_rate": 0,
+    "silence_ratio": 0, "estimated_pause_count": 0
+}
+
+
+def decode_mono(audio_path: str, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode any ffmpeg-readable file straight to mono float32 PCM at sample_rate"""
+    out, _ = (
+        ffmpeg
+        .input(audio_path)
+        .output("pipe:", format="f32le", ac=1, ar=sample_rate)
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, dtype=np.float32)
+
+
+def stream_mono(audio_path: str, sample_rate: int = SAMPLE_RATE,
+                block_seconds: float = ACOUSTICS_BLOCK_SECONDS) -> Iterator[np.ndarray]:
+    """Decode like decode_mono, yielding fixed-size blocks of samples piped from ffmpeg"""
+    args = ffmpeg.input(audio_path).output("pipe:", format="f32le", ac=1, ar=sample_rate).compile()
+    block_bytes = int(block_seconds * sample_rate) * 4
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes)
+            if not chunk:
+                break
+            usable = len(chunk) - len(chunk) % 4
+            yield np.frombuffer(chunk[:usable], dtype=np.float32)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {audio_path} (exit code {process.returncode})")
+
+
+def frame_features(frames: np.ndarray, previous_log_spectrum=None):
+    """
+    Per-frame energy, zero-crossing rate, spectral centroid and onset strength from one
+    shared windowed magnitude spectrogram. Returns those plus the last frame's log
+    spectrum, so consecutive blocks of frames can be chained for the onset flux.
+    """
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / N_FFT
+
+    window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+    magnitude = np.abs(np.fft.rfft(frames * window, axis=1)).astype(np.float32)
+    freqs = np.fft.rfftfreq(N_FFT, d=1.0 / SAMPLE_RATE)
+    total = magnitude.sum(axis=1)
+    centroid = np.divide(magnitude @ freqs, total, out=np.zeros(len(total)), where=total > 0)
+
+    # Onset strength: half-wave rectified spectral flux of the log-compressed spectrogram
+    log_spectrum = np.log1p(1000.0 * magnitude)
+    if previous_log_spectrum is None:
+        previous_log_spectrum = log_spectrum[:1]
+    flux = np.diff(np.vstack([previous_log_spectrum, log_spectrum]), axis=0)
+    onset = np.maximum(flux, 0.0).mean(axis=1)
+
+    return rms, zcr, centroid, onset, log_spectrum[-1:]
+
+
+def estimate_tempo(onset: np.ndarray, frame_rate: float) -> float:
+    """Tempo (BPM) from the autocorrelation of the onset envelope, weighted towards START_BPM"""
+    onset = onset - onset.mean()
+    if len(onset) < 4 or not np.any(onset):
+        return 0.0
+    size = 1 << int(np.ceil(np.log2(2 * len(onset))))
+    spectrum = np.fft.rfft(onset, n=size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), n=size)[:len(onset)]
+
+    min_lag = max(1, int(frame_rate * 60 / MAX_BPM))
+    max_lag = min(len(onset) - 1, int(frame_rate * 60 / MIN_BPM))
+    if max_lag <= min_lag:
+        return 0.0
+    lags = np.arange(min_lag, max_lag + 1)
+    bpm = 60.0 * frame_rate / lags
+    prior = np.exp(-0.5 * np.square(np.log2(bpm / START_BPM)))
+    weighted = autocorrelation[lags] * prior
+    peak = int(np.argmax(weighted))
+    lag = float(lags[peak])
+    if 0 < peak < len(weighted) - 1:
+        # Parabolic interpolation between lags: at a 32 ms hop, whole lags are ~4 BPM apart near 120
+        left, centre, right = weighted[peak - 1:peak + 2]
+        denominator = left - 2 * centre + right
+        if denominator < 0:
+            lag += 0.5 * (left - right) / denominator
+    return float(60.0 * frame_rate / lag)
+
+
+class AcousticAccumulator:
+    """
+    Running acoustic features over audio fed in blocks of any size. Frames are cut
+    HOP_LENGTH apart across block boundaries, so the result does not depend on how
+    the signal was split. Besides the current block, only per-frame energy (4 bytes
+    per 32 ms, needed for the silence threshold) and a capped onset envelope are kept.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.total_samples = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._previous_log_spectrum = None
+        self._rms = []
+        self._zcr_sum = 0.0
+        self._centroid_sum = 0.0
+        self._frame_count = 0
+        self._onset = []
+        self._onset_frames = 0
+        self._max_onset_frames = int(TEMPO_WINDOW_SECONDS * sample_rate / HOP_LENGTH)
+
+    def add(self, block: np.ndarray):
+        self.total_samples += len(block)
+        buffer = np.concatenate([self._pending, block]) if len(self._pending) else block
+        n_frames = 1 + (len(buffer) - N_FFT) // HOP_LENGTH if len(buffer) >= N_FFT else 0
+        if n_frames:
+            self._consume(np.lib.stride_tricks.sliding_window_view(buffer, N_FFT)[::HOP_LENGTH][:n_frames])
+        # Copy, so the rest of the block can be freed
+        self._pending = buffer[n_frames * HOP_LENGTH:].copy()
+
+    def _consume(self, frames: np.ndarray):
+        rms, zcr, centroid, onset, self._previous_log_spectrum = frame_features(frames, self._previous_log_spectrum)
+        self._rms.append(rms.astype(np.float32))
+        self._zcr_sum += float(zcr.sum())
+        self._centroid_sum += float(centroid.sum())
+        self._frame_count += len(frames)
+        if self._onset_frames < self._max_onset_frames:
+            onset = onset[:self._max_onset_frames - self._onset_frames]
+            self._onset.append(onset)
+            self._onset_frames += len(onset)
+
+    def result(self) -> dict:
+        """The feature dict reported to the prompts"""
+        if self.total_samples == 0:
+            raise ValueError("No audio decoded")
+        if self._frame_count == 0:
+            # Shorter than one frame: analyse it zero-padded
+            self._consume(np.pad(self._pending, (0, N_FFT - len(self._pending)))[np.newaxis, :])
+
+        rms = np.concatenate(self._rms).astype(np.float64)
+        silent = rms < np.mean(rms) * SILENCE_THRESHOLD
+        return {
+            "duration_seconds": float(self.total_samples / self.sample_rate),
+            "sample_rate": int(self.sample_rate),
+            "total_samples": int(self.total_samples),
+            "tempo_bpm": estimate_tempo(np.concatenate(self._onset), self.sample_rate / HOP_LENGTH),
+            "average_energy": float(np.mean(rms)),
+            "energy_variance": float(np.var(rms)),
+            "spectral_centroid_mean": self._centroid_sum / self._frame_count,
+            "zero_crossing_rate": self._zcr_sum / self._frame_count,
+            "silence_ratio": float(np.mean(silent)),
+            "estimated_pause_count": int(np.sum(np.diff(silent.astype(int)) == 1)),
+        }
+
+
+def analyze_acoustics(audio_path: str, streaming: bool = ACOUSTICS_STREAMING) -> dict:
+    """
+    Tempo, energy, spectral and pause features for the pretest and simulation prompts.
+    The file is decoded once to 16 kHz mono and every feature comes from a single
+    framing / STFT pass. When streaming, the audio is decoded and analysed
+    ACOUSTICS_BLOCK_SECONDS at a time, so memory does not grow with the duration;
+    otherwise the whole waveform is decoded first. Both give the same features.
+    Raises on failure.
+    """
+    accumulator = AcousticAccumulator()
+    if streaming:
+        for block in stream_mono(audio_path):
+            accumulator.add(block)
+    else:
+        accumulator.add(decode_mono(audio_path))
+    return accumulator.result()
@@ -0,0 +1,119 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_STORE_PATH = os.getenv(
+    "ARTIFACT_STORE_PATH", os.path.join(tempfile.gettempdir(), "creative_artifacts.sqlite3")
+)
+
+
+class ArtifactStore:
+    """
+    Persistent store for the outputs of the media stage (frames, transcripts,
+    acoustic features). Entries are keyed by (asset id, content hash,
+    extractor, extractor version), so an unchanged creative never goes
+    through ffmpeg / OpenCV / Whisper twice, and bumping an extractor version
+    invalidates only that extractor's results.
+    """
+
+    def __init__(self, db_path: str = ARTIFACT_STORE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS artifacts (
+                        asset_id TEXT NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        extractor TEXT NOT NULL,
+                        version TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        PRIMARY KEY (asset_id, content_hash, extractor, version)
+                    )"""
+                )
+            self._initialized = True
+
+    def get(self, asset_id, content_hash: str, extractor: str, version: str) -> Optional[Any]:
+        """Return the stored artifact or None."""
+        self._ensure_initialized()
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT payload FROM artifacts
+                   WHERE asset_id = ? AND content_hash = ? AND extractor = ? AND version = ?""",
+                (str(asset_id or ""), content_hash, extractor, version),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, asset_id, content_hash: str, extractor: str, version: str, value: Any):
+        """Store a JSON-serialisable artifact, replacing any previous one for the same key."""
+        self._ensure_initialized()
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO artifacts
+                   (asset_id, content_hash, extractor, version, payload, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (str(asset_id or ""), content_hash, extractor, version, json.dumps(value), time.time()),
+            )
+
+    def get_or_compute(self, asset_id, content_hash: str, extractor: str, version: str,
+                       compute: Callable[[], Any], cacheable: Callable[[Any], bool] = bool) -> Any:
+        """
+        Return the stored artifact, or run compute() and store its result.
+        Results rejected by cacheable (by default: empty ones, which is what the
+        extractors return on failure) are returned but not persisted.
+        """
+        cached = self.lookup(asset_id, content_hash, extractor, version)
+        if cached is not None:
+            return cached
+
+        value = compute()
+        if cacheable(value):
+            self.save(asset_id, content_hash, extractor, version, value)
+        return value
+
+    def lookup(self, asset_id, content_hash: str, extractor: str, version: str) -> Optional[Any]:
+        """get() that counts hits / misses and treats a store failure as a miss"""
+        try:
+            cached = self.get(asset_id, content_hash, extractor, version)
+        except Exception as e:
+            logger.warning(f"Artifact store lookup failed: {str(e)}")
+            cached = None
+
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info(f"Artifact hit: {extractor} for asset {asset_id} ({content_hash[:12]})")
+        return cached
+
+    def save(self, asset_id, content_hash: str, extractor: str, version: str, value: Any):
+        """put() that logs instead of raising: a lost artifact only costs a recomputation"""
+        try:
+            self.put(asset_id, content_hash, extractor, version, value)
+        except Exception as e:
+            logger.warning(f"Artifact store write failed: {str(e)}")
+
+
+artifact_store = ArtifactStore()
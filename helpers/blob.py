@@ -0,0 +1,118 @@
+import base64
+import hashlib
+import io
+import mmap
+import os
+from typing import Optional, Union
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file object over a memoryview, so decoders can read a blob without copying it"""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = max(0, min(len(buffer), len(self._view) - self._position))
+        buffer[:n] = self._view[self._position:self._position + n]
+        self._position += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class Blob:
+    """
+    Opaque handle for a binary payload (downloaded creative, re-encoded image)
+    passed by reference through the pipeline instead of as base64 text.
+    It is base64-encoded only when a request body is built (data_url(), called
+    by the LLM gateway), and hashed at most once (digest, used by the LLM cache).
+    """
+
+    __slots__ = ("_view", "mime_type", "_digest")
+
+    def __init__(self, data: Union[bytes, bytearray, memoryview, mmap.mmap], mime_type: str = "application/octet-stream"):
+        self._view = memoryview(data).toreadonly()
+        self.mime_type = mime_type.split(";")[0].strip()
+        self._digest = None
+
+    @classmethod
+    def from_file(cls, path: str, mime_type: str = "application/octet-stream") -> "Blob":
+        """
+        Memory-map a file. Pages are read on demand and shared with the page cache, and the
+        mapping stays valid if the file is later evicted from the media cache.
+        """
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"", mime_type)
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), mime_type)
+
+    @property
+    def nbytes(self) -> int:
+        return self._view.nbytes
+
+    @property
+    def digest(self) -> str:
+        """sha256 of the content"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._view).hexdigest()
+        return self._digest
+
+    def reader(self) -> io.BufferedReader:
+        """Independent file object over the content, e.g. for PIL.Image.open"""
+        return io.BufferedReader(_BufferReader(self._view))
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self._view).decode('ascii')}"
+
+    def __len__(self) -> int:
+        return self._view.nbytes
+
+    def __repr__(self) -> str:
+        return f"<Blob {self.mime_type} {self.nbytes} bytes>"
+
+
+def materialize(messages: Optional[list]) -> Optional[list]:
+    """
+    Chat messages with Blob image URLs replaced by data URLs, for sending.
+    Only the messages that hold a blob are copied; the originals are left untouched
+    so the encoded text is dropped as soon as the request has been sent.
+    """
+    if not messages:
+        return messages
+    materialized = []
+    for message in messages:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list) and any(_blob_part(part) for part in content):
+            content = [
+                {**part, "image_url": {**part["image_url"], "url": part["image_url"]["url"].data_url()}}
+                if _blob_part(part) else part
+                for part in content
+            ]
+            message = {**message, "content": content}
+        materialized.append(message)
+    return materialized
+
+
+def _blob_part(part) -> bool:
+    return (
+        isinstance(part, dict)
+        and part.get("type") == "image_url"
+        and isinstance((part.get("image_url") or {}).get("url"), Blob)
+    )
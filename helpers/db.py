@@ -1,5 +1,6 @@
 from supabase import create_client, Client
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +14,12 @@ if not supabase_url or not supabase_key:
 
 supabase: Client = create_client(supabase_url, supabase_key)
 
+# For the Postgres functions in sql/, which only service_role may execute
+supabase_service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase_service: Optional[Client] = (
+    create_client(supabase_url, supabase_service_role_key) if supabase_service_role_key else None
+)
+
 def get_user_by_email(email: str):
     """Fetch a single user by email."""
     response = supabase.table("users").select("*").eq("email", email).execute()
@@ -0,0 +1,263 @@
+import base64
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Past this many frames between two targets a keyframe seek is cheaper than decoding every frame in between
+SEEK_GAP_FRAMES = 250
+
+EMPTY_METADATA = {"duration_seconds": 0, "fps": 0, "total_frames": 0}
+
+# Representative frame selection
+CANDIDATES_PER_FRAME = 4      # candidates decoded per requested frame
+SIGNAL_WIDTH = 160            # signals are computed on thumbnails this wide
+BLACK_LUMA = 16               # mean luminance at or below this is a black / fade frame
+WHITE_LUMA = 240              # mean luminance at or above this is a flash / blank frame
+BLUR_RATIO = 0.15             # Laplacian variance below this fraction of the median counts as blurred
+TEMPORAL_WEIGHT = 0.15        # how much distance in time adds to visual distance (keeps coverage)
+MIN_DISTINCTNESS = 0.08       # stop adding frames once the best candidate is this close to a chosen one
+
+
+def probe(video_path: str) -> dict:
+    """Duration, fps and frame count of a video without decoding any frame"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video file: {video_path}")
+    try:
+        return _metadata(cap)
+    finally:
+        cap.release()
+
+
+def _metadata(cap) -> dict:
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration = total_frames / fps if fps > 0 else 0
+    return {
+        "duration_seconds": round(duration, 2),
+        "fps": round(fps, 2),
+        "total_frames": total_frames
+    }
+
+
+def evenly_spaced_indices(total_frames: int, max_frames: int) -> List[int]:
+    """First frame, last frame and evenly spaced frames in between"""
+    if total_frames <= 0 or max_frames <= 0:
+        return []
+    if total_frames <= max_frames:
+        return list(range(total_frames))
+    return sorted(set(np.linspace(0, total_frames - 1, max_frames, dtype=int).tolist()))
+
+
+def _downscale(frame: np.ndarray, max_width: Optional[int]) -> np.ndarray:
+    if not max_width:
+        return frame
+    height, width = frame.shape[:2]
+    if width <= max_width:
+        return frame
+    new_height = int(height * max_width / width)
+    return cv2.resize(frame, (max_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+def _seek_gap(video_path: str) -> int:
+    # Over HTTP every skipped frame costs bytes on the wire, so always seek (a Range request to the keyframe)
+    return 0 if "://" in video_path else SEEK_GAP_FRAMES
+
+
+def _decode_indexed(cap, indices: Sequence[int], max_width: Optional[int] = None,
+                    seek_gap: int = SEEK_GAP_FRAMES) -> List[Tuple[int, np.ndarray]]:
+    """
+    Decode the requested frame indices in one forward pass over an open capture.
+    Frames that are not needed are only grab()bed (no colour conversion / copy);
+    a seek is used only when the next target is more than seek_gap frames ahead.
+    Each retrieved frame is downscaled immediately so full-resolution frames are never held.
+    """
+    frames = []
+    position = 0
+    for target in sorted(set(indices)):
+        if target - position > seek_gap:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            position = target
+        while position < target:
+            if not cap.grab():
+                return frames
+            position += 1
+        if not cap.grab():
+            return frames
+        position += 1
+        ret, frame = cap.retrieve()
+        if ret:
+            frames.append((target, _downscale(frame, max_width)))
+        else:
+            logger.warning(f"Failed to retrieve frame at index {target}")
+    return frames
+
+
+def decode_frames(cap, indices: Sequence[int], max_width: Optional[int] = None,
+                  seek_gap: int = SEEK_GAP_FRAMES) -> List[np.ndarray]:
+    """Decode the requested frame indices in one forward pass (see _decode_indexed)"""
+    return [frame for _, frame in _decode_indexed(cap, indices, max_width, seek_gap)]
+
+
+def encode_jpeg(frame: np.ndarray, quality: int = 70) -> Optional[bytes]:
+    """Encode a frame to JPEG bytes in memory"""
+    success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if success else None
+
+
+def sample_frames(video_path: str, max_frames: int = 8, max_width: Optional[int] = None,
+                  jpeg_quality: int = 70, indices: Optional[Sequence[int]] = None) -> Tuple[List[bytes], dict]:
+    """
+    Decode evenly spaced (or the given) frames and return them as JPEG bytes together with
+    the video metadata. Nothing is written to disk.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video file: {video_path}")
+    try:
+        metadata = _metadata(cap)
+        if indices is None:
+            indices = evenly_spaced_indices(metadata["total_frames"], max_frames)
+        frames = decode_frames(cap, indices, max_width=max_width, seek_gap=_seek_gap(video_path))
+    finally:
+        cap.release()
+
+    encoded = [jpeg for jpeg in (encode_jpeg(frame, jpeg_quality) for frame in frames) if jpeg]
+    return encoded, metadata
+
+
+def sample_frames_base64(video_path: str, max_frames: int = 8, max_width: Optional[int] = None,
+                         jpeg_quality: int = 70, indices: Optional[Sequence[int]] = None) -> Tuple[List[str], dict]:
+    """Same as sample_frames, with frames base64 encoded for the OpenAI image_url payload"""
+    encoded, metadata = sample_frames(video_path, max_frames, max_width, jpeg_quality, indices)
+    return [base64.b64encode(jpeg).decode('utf-8') for jpeg in encoded], metadata
+
+
+def frame_signals(thumbnails: List[np.ndarray]) -> dict:
+    """
+    Cheap per-frame signals computed on a stack of equally sized BGR thumbnails:
+    mean luminance (black / blank frames), Laplacian variance (blur),
+    a 64-bin colour histogram and its change from the previous candidate (scene cuts).
+    """
+    stack = np.stack(thumbnails)
+    n = stack.shape[0]
+
+    gray = stack[..., 0] * 0.114 + stack[..., 1] * 0.587 + stack[..., 2] * 0.299
+    luminance = gray.mean(axis=(1, 2))
+
+    laplacian = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:]
+                 - 4 * gray[:, 1:-1, 1:-1])
+    sharpness = laplacian.var(axis=(1, 2))
+
+    levels = (stack >> 6).astype(np.int64)
+    bins = (levels[..., 0] * 16 + levels[..., 1] * 4 + levels[..., 2]).reshape(n, -1)
+    bins += np.arange(n)[:, None] * 64
+    histogram = np.bincount(bins.ravel(), minlength=n * 64).reshape(n, 64).astype(np.float64)
+    histogram /= histogram.sum(axis=1, keepdims=True)
+
+    scene_change = np.zeros(n)
+    scene_change[1:] = 0.5 * np.abs(np.diff(histogram, axis=0)).sum(axis=1)
+    scene_change[0] = 1.0  # the opening shot always starts a scene
+
+    return {
+        "luminance": luminance,
+        "sharpness": sharpness,
+        "histogram": histogram,
+        "scene_change": scene_change
+    }
+
+
+def select_distinct_frames(signals: dict, positions: np.ndarray, max_frames: int) -> List[int]:
+    """
+    Pick up to max_frames candidates (indices into the signal arrays) that are not black,
+    blank or blurred and are as different from each other as possible.
+    Greedy farthest-point selection over histogram distance plus a temporal term;
+    stops early when only near-duplicates are left, so static videos cost fewer images.
+    """
+    luminance = signals["luminance"]
+    sharpness = signals["sharpness"]
+    histogram = signals["histogram"]
+
+    usable = (luminance > BLACK_LUMA) & (luminance < WHITE_LUMA)
+    if usable.any():
+        usable &= sharpness >= BLUR_RATIO * np.median(sharpness[usable])
+    if not usable.any():
+        return []
+
+    distance = 0.5 * np.abs(histogram[:, None, :] - histogram[None, :, :]).sum(axis=2)
+    distance += TEMPORAL_WEIGHT * np.abs(positions[:, None] - positions[None, :])
+
+    quality = 0.5 + 0.5 * np.clip(sharpness / (sharpness[usable].max() or 1.0), 0, 1)
+
+    seed_score = np.where(usable, quality + signals["scene_change"], -np.inf)
+    selected = [int(np.argmax(seed_score))]
+
+    while len(selected) < max_frames:
+        distinctness = distance[:, selected].min(axis=1)
+        score = np.where(usable, distinctness * quality, -np.inf)
+        score[selected] = -np.inf
+        best = int(np.argmax(score))
+        if not np.isfinite(score[best]) or distinctness[best] < MIN_DISTINCTNESS:
+            break
+        selected.append(best)
+
+    return sorted(selected)
+
+
+def sample_representative_frames(video_path: str, max_frames: int = 8, max_width: Optional[int] = None,
+                                 jpeg_quality: int = 70) -> Tuple[List[bytes], dict]:
+    """
+    Like sample_frames, but instead of fixed positions returns the most distinct,
+    non-degenerate frames among max_frames * CANDIDATES_PER_FRAME evenly spaced candidates.
+    Falls back to evenly spaced frames when no candidate is usable.
+    metadata["frame_timestamps"] holds the time in seconds of each returned frame.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video file: {video_path}")
+    try:
+        metadata = _metadata(cap)
+        total_frames = metadata["total_frames"]
+        candidates = _decode_indexed(
+            cap, evenly_spaced_indices(total_frames, max_frames * CANDIDATES_PER_FRAME),
+            max_width=SIGNAL_WIDTH, seek_gap=_seek_gap(video_path)
+        )
+    finally:
+        cap.release()
+
+    indices = []
+    if candidates:
+        positions = np.array([index for index, _ in candidates], dtype=np.float64) / max(total_frames - 1, 1)
+        signals = frame_signals([thumbnail for _, thumbnail in candidates])
+        indices = [candidates[i][0] for i in select_distinct_frames(signals, positions, max_frames)]
+        logger.info(f"Selected {len(indices)} distinct frames out of {len(candidates)} candidates")
+
+    if not indices:
+        indices = evenly_spaced_indices(total_frames, max_frames)
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        decoded = _decode_indexed(cap, indices, max_width=max_width, seek_gap=_seek_gap(video_path))
+    finally:
+        cap.release()
+
+    encoded, timestamps = [], []
+    for index, frame in decoded:
+        jpeg = encode_jpeg(frame, jpeg_quality)
+        if jpeg:
+            encoded.append(jpeg)
+            timestamps.append(round(index / metadata["fps"], 2) if metadata["fps"] else 0)
+    # Frames are no longer evenly spaced, so callers need the actual position of each one
+    metadata["frame_timestamps"] = timestamps
+    return encoded, metadata
+
+
+def sample_representative_frames_base64(video_path: str, max_frames: int = 8, max_width: Optional[int] = None,
+                                        jpeg_quality: int = 70) -> Tuple[List[str], dict]:
+    """Same as sample_representative_frames, with frames base64 encoded"""
+    encoded, metadata = sample_representative_frames(video_path, max_frames, max_width, jpeg_quality)
+    return [base64.b64encode(jpeg).decode('utf-8') for jpeg in encoded], metadata
@@ -0,0 +1,160 @@
+import base64
+import binascii
+import logging
+import math
+import os
+from io import BytesIO
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from app.helpers import metrics
+from app.helpers.blob import Blob
+
+logger = logging.getLogger(__name__)
+
+# GPT-4o vision pricing: a low detail image costs a flat 85 tokens. A high detail image is
+# fitted into 2048x2048, scaled so its short side is at most 768px, and costs 85 tokens
+# plus 170 per 512px tile. Anything sent above those sizes is downscaled by the API anyway.
+LOW_DETAIL_TOKENS = 85
+HIGH_DETAIL_BASE_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIZE = 512
+MAX_SIDE = 2048
+MAX_SHORT_SIDE = 768
+LOW_DETAIL_SIDE = 512
+
+IMAGE_ENCODE_FORMAT = os.getenv("IMAGE_ENCODE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_ENCODE_QUALITY = int(os.getenv("IMAGE_ENCODE_QUALITY", "82"))
+
+# Image tokens per request: (per asset, per minute of video, cap)
+TIER_IMAGE_BUDGETS = {
+    "free": (600, 400, 2500),
+    "starter": (900, 600, 4500),
+    "professional": (1400, 1000, 9000),
+    "agency": (1800, 1400, 14000),
+    "enterprise": (2200, 1800, 20000),
+}
+
+# Stand-alone images are the creative itself; video frames only sample it
+PRIORITY_IMAGE = 0
+PRIORITY_FRAME = 1
+
+ImageData = Union[Blob, bytes, str]
+
+
+def high_detail_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the API scales an image to before tiling it at high detail"""
+    scale = min(1.0, MAX_SIDE / max(width, height))
+    scale *= min(1.0, MAX_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def image_tokens(width: int, height: int, detail: str) -> int:
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    w, h = high_detail_size(width, height)
+    return HIGH_DETAIL_BASE_TOKENS + TILE_TOKENS * math.ceil(w / TILE_SIZE) * math.ceil(h / TILE_SIZE)
+
+
+def token_budget(tier: Optional[str], asset_count: int, video_seconds: float = 0) -> int:
+    """Image tokens one request may spend, from the user's tier and the size of the campaign"""
+    per_asset, per_video_minute, cap = TIER_IMAGE_BUDGETS.get((tier or "free").lower(), TIER_IMAGE_BUDGETS["free"])
+    return min(cap, per_asset * max(1, asset_count) + int(per_video_minute * video_seconds / 60))
+
+
+def plan_detail(sizes: List[Tuple[int, int]], priorities: List[int], budget: int) -> List[str]:
+    """
+    detail per image: everything starts at low, then images are upgraded to high
+    by priority (and, within a priority, cheapest first) while the budget allows.
+    """
+    details = ["low"] * len(sizes)
+    spent = LOW_DETAIL_TOKENS * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: (priorities[i], image_tokens(*sizes[i], "high")))
+    for i in order:
+        extra = image_tokens(*sizes[i], "high") - LOW_DETAIL_TOKENS
+        if spent + extra <= budget:
+            details[i] = "high"
+            spent += extra
+    return details
+
+
+def _open(data: ImageData) -> Image.Image:
+    if isinstance(data, Blob):
+        image = Image.open(data.reader())
+    else:
+        if isinstance(data, str):
+            data = base64.b64decode(data.strip())
+        image = Image.open(BytesIO(data))
+    image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def encode(image: Image.Image, detail: str) -> Blob:
+    """Resize to what the model will actually look at and re-encode"""
+    if detail == "low":
+        target = (LOW_DETAIL_SIDE, LOW_DETAIL_SIDE)
+        image = image.copy()
+        image.thumbnail(target, Image.LANCZOS)
+    else:
+        target = high_detail_size(*image.size)
+        if target != image.size:
+            image = image.resize(target, Image.LANCZOS)
+
+    if image.mode not in ("RGB", "L"):
+        # Flatten transparency onto white rather than letting it turn black
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        rgba = image.convert("RGBA")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+
+    buffer = BytesIO()
+    if IMAGE_ENCODE_FORMAT == "WEBP":
+        image.save(buffer, format="WEBP", quality=IMAGE_ENCODE_QUALITY, method=4)
+        mime_type = "image/webp"
+    else:
+        image.save(buffer, format="JPEG", quality=IMAGE_ENCODE_QUALITY, optimize=True)
+        mime_type = "image/jpeg"
+    return Blob(buffer.getbuffer(), mime_type)
+
+
+def prepare_image(data: ImageData, detail: str = "high") -> Optional[dict]:
+    """image_url payload for a single image sent on its own, or None if it cannot be decoded"""
+    with metrics.span("image_prep"):
+        try:
+            image = _open(data)
+        except (OSError, ValueError, binascii.Error) as e:
+            logger.warning(f"Skipping undecodable image: {str(e)}")
+            return None
+        return {"url": encode(image, detail), "detail": detail}
+
+
+def prepare_images(images: List[ImageData], priorities: List[int], tier: Optional[str],
+                   asset_count: int, video_seconds: float = 0) -> List[Optional[dict]]:
+    """
+    image_url payloads ({"url": Blob, "detail"}) for raw or base64 images, in order, with
+    detail chosen within the request's token budget. Images that cannot be decoded
+    come back as None. CPU-bound: call from an executor.
+    """
+    with metrics.span("image_prep"):
+        opened = []
+        for data in images:
+            try:
+                opened.append(_open(data))
+            except (OSError, ValueError, binascii.Error) as e:
+                logger.warning(f"Skipping undecodable image: {str(e)}")
+                opened.append(None)
+
+        usable = [i for i, image in enumerate(opened) if image is not None]
+        budget = token_budget(tier, asset_count, video_seconds)
+        details = plan_detail([opened[i].size for i in usable], [priorities[i] for i in usable], budget)
+
+        parts: List[Optional[dict]] = [None] * len(images)
+        for i, detail in zip(usable, details):
+            parts[i] = {"url": encode(opened[i], detail), "detail": detail}
+
+        logger.info(
+            f"Prepared {len(usable)} images within a {budget}-token budget: "
+            f"{details.count('high')} high / {details.count('low')} low detail"
+        )
+        return parts
@@ -0,0 +1,78 @@
+import json
+import logging
+from typing import Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TopLevelSectionParser:
+    """
+    Incremental parser for a JSON object arriving in arbitrary text chunks.
+    feed() returns the (key, value) pairs of the top-level members that were
+    completed by the chunk, so each section can be used as soon as the model
+    has finished writing it instead of after the whole document.
+    Only string/bracket nesting is tracked while scanning; each completed
+    member is decoded with json.loads.
+    """
+
+    def __init__(self):
+        self._data = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._position = 0
+        self.sections_emitted = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        self._data += chunk
+        for char in chunk:
+            position = self._position
+            self._position += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._value_start is None:
+                        self._key = json.loads(self._data[self._key_start:position + 1])
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._key_start = position
+                continue
+
+            if char in "{[":
+                self._depth += 1
+                continue
+
+            if char == ":" and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = position + 1
+                continue
+
+            if char in ",}]" and self._depth == 1 and self._value_start is not None:
+                completed.extend(self._emit(position))
+
+            if char in "}]":
+                self._depth -= 1
+
+        return completed
+
+    def _emit(self, end: int) -> List[Tuple[str, Any]]:
+        key, raw = self._key, self._data[self._value_start:end]
+        self._key = self._key_start = self._value_start = None
+        try:
+            value = json.loads(raw)
+        except ValueError as e:
+            logger.warning(f"Skipping unparseable streamed section {key}: {str(e)}")
+            return []
+        self.sections_emitted += 1
+        return [(key, value)]
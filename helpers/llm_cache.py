@@ -0,0 +1,246 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.helpers.blob import Blob
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" (memory LRU in front of an on-disk table), "memory", or "off"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "creative_llm_cache.sqlite3"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+# Bump to orphan every stored response, e.g. after a change in how responses are post-processed
+LLM_CACHE_VERSION = "1"
+
+# Request parameters that do not change the completion and stay out of the key
+NON_SEMANTIC_PARAMS = {"timeout", "stream", "user", "extra_headers"}
+
+
+def _normalize_content(content: Any) -> Any:
+    """Message content with inline images replaced by the digest of their decoded bytes"""
+    if isinstance(content, str):
+        return content.strip()
+    if not isinstance(content, list):
+        return content
+
+    parts = []
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            image = part.get("image_url") or {}
+            url = image.get("url", "")
+            if isinstance(url, Blob):
+                parts.append({"type": "image", "media": f"data:{url.mime_type};base64", "sha256": url.digest, "detail": image.get("detail")})
+            elif url.startswith("data:"):
+                header, _, data = url.partition(",")
+                try:
+                    digest = hashlib.sha256(base64.b64decode(data)).hexdigest()
+                except (ValueError, TypeError):
+                    digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+                parts.append({"type": "image", "media": header, "sha256": digest, "detail": image.get("detail")})
+            else:
+                parts.append({"type": "image", "url": url, "detail": image.get("detail")})
+        elif isinstance(part, dict) and part.get("type") == "text":
+            parts.append({"type": "text", "text": (part.get("text") or "").strip()})
+        else:
+            parts.append(part)
+    return parts
+
+
+def cache_key(model: str, messages: list, params: dict, tier: Optional[str] = None) -> str:
+    """Stable hash of the model, semantic parameters, normalized messages and tier"""
+    normalized = {
+        "version": LLM_CACHE_VERSION,
+        "model": model,
+        "tier": (tier or "").lower(),
+        "params": {k: v for k, v in sorted(params.items()) if k not in NON_SEMANTIC_PARAMS},
+        "messages": [
+            {"role": m.get("role"), "content": _normalize_content(m.get("content"))}
+            for m in messages
+        ],
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """Bounded in-process LRU"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, call_site: str, value: dict, ttl_seconds: int):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, call_site, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, call_site: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [k for k, (_, site, _) in self._entries.items() if call_site is None or site == call_site]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+
+class SQLiteBackend:
+    """Responses shared by the API and worker processes on the same host"""
+
+    def __init__(self, db_path: str = LLM_CACHE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS llm_responses (
+                        key TEXT PRIMARY KEY,
+                        call_site TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS llm_responses_expires ON llm_responses (expires_at)")
+            self._initialized = True
+
+    def get(self, key: str) -> Optional[dict]:
+        self._ensure_initialized()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload FROM llm_responses WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, call_site: str, value: dict, ttl_seconds: int):
+        self._ensure_initialized()
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO llm_responses (key, call_site, payload, created_at, expires_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (key, call_site, json.dumps(value), now, now + ttl_seconds),
+            )
+            conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,))
+
+    def delete(self, key: str):
+        self._ensure_initialized()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+
+    def clear(self, call_site: Optional[str] = None) -> int:
+        self._ensure_initialized()
+        with self._connect() as conn:
+            if call_site is None:
+                return conn.execute("DELETE FROM llm_responses").rowcount
+            return conn.execute("DELETE FROM llm_responses WHERE call_site = ?", (call_site,)).rowcount
+
+
+class LLMCache:
+    """
+    Response cache for chat completions. A small in-memory LRU sits in front
+    of an optional persistent backend; any object with the same
+    get / set / delete / clear methods can be plugged in as that backend.
+    Lookups and writes never fail the request: backend errors are logged and
+    treated as misses.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: int = LLM_CACHE_TTL_SECONDS, enabled: bool = True):
+        self.memory = MemoryBackend()
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except Exception as e:
+                logger.warning(f"LLM cache lookup failed: {str(e)}")
+            if value is not None:
+                self.memory.set(key, "", value, self.ttl_seconds)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, call_site: str, value: dict, ttl_seconds: Optional[int] = None):
+        if not self.enabled:
+            return
+        ttl_seconds = ttl_seconds or self.ttl_seconds
+        self.memory.set(key, call_site, value, ttl_seconds)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, call_site, value, ttl_seconds)
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {str(e)}")
+
+    def invalidate(self, key: str):
+        """Drop one cached response"""
+        self.memory.delete(key)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self, call_site: Optional[str] = None) -> int:
+        """Drop every cached response, or only those of one call site"""
+        if self.backend is None:
+            return self.memory.clear(call_site)
+        # Entries promoted from the backend don't carry their call site, so memory is flushed whole
+        self.memory.clear()
+        return self.backend.clear(call_site)
+
+
+def _default_cache() -> LLMCache:
+    if LLM_CACHE_BACKEND == "off":
+        return LLMCache(enabled=False)
+    if LLM_CACHE_BACKEND == "memory":
+        return LLMCache()
+    return LLMCache(backend=SQLiteBackend())
+
+
+llm_cache = _default_cache()
@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from app.helpers import blob, metrics
+from app.helpers import usage as usage_ledger
+from app.helpers.llm_cache import llm_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "180"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_SECONDS = 1.0
+LLM_BACKOFF_MAX_SECONDS = 30.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    asyncio.TimeoutError,
+)
+
+
+class LLMGateway:
+    """
+    Single async entry point for OpenAI calls: one pooled AsyncOpenAI client,
+    a process-wide concurrency limit, retries with jittered exponential backoff
+    on 429 / 5xx / connection errors, per-call timeouts, and per-call-site
+    usage and latency accounting. Chat calls made with cache=True are served
+    from the LLM response cache when an identical request was answered before,
+    and identical requests in flight at the same time share one API call.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client = None
+        self._semaphore = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        self._inflight = {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,  # retries are handled here, with backoff shared across call sites
+                timeout=self.timeout,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency * 2,
+                        max_keepalive_connections=self.max_concurrency
+                    )
+                ),
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        # Full jitter so concurrent callers hitting the same 429 don't retry in lockstep
+        delay = random.uniform(delay / 2, delay)
+        return max(delay, retry_after or 0)
+
+    def _record(self, call_site: str, latency: float, token_usage=None, error: bool = False, retries: int = 0,
+                cache_hit: bool = False, request: Optional[dict] = None, audio_seconds: float = 0.0):
+        if not cache_hit:
+            metrics.record("llm", latency)
+        if not error:
+            request = request or {}
+            usage_ledger.record_call(
+                call_site,
+                model=request.get("model"),
+                prompt_tokens=getattr(token_usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(token_usage, "completion_tokens", 0) or 0,
+                audio_seconds=audio_seconds,
+                images=usage_ledger.count_images(request.get("messages")),
+                latency_seconds=latency,
+                cached=cache_hit,
+            )
+        with self._stats_lock:
+            stats = self._stats.setdefault(call_site, {
+                "calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+                "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_seconds_total": 0.0, "latency_seconds_max": 0.0,
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["retries"] += retries
+            stats["cache_hits"] += int(cache_hit)
+            stats["latency_seconds_total"] += latency
+            stats["latency_seconds_max"] = max(stats["latency_seconds_max"], latency)
+            if token_usage is not None:
+                stats["prompt_tokens"] += getattr(token_usage, "prompt_tokens", 0) or 0
+                stats["completion_tokens"] += getattr(token_usage, "completion_tokens", 0) or 0
+
+    async def _call(self, call_site: str, create, timeout: Optional[float], **kwargs):
+        timeout = timeout or self.timeout
+        started = time.perf_counter()
+        attempt = 0
+        # Blob images are base64-encoded here, once per call, and the text is dropped with the request
+        request = {**kwargs, "messages": blob.materialize(kwargs["messages"])} if "messages" in kwargs else kwargs
+        while True:
+            try:
+                async with self.semaphore:
+                    response = await asyncio.wait_for(create(**request), timeout=timeout)
+                latency = time.perf_counter() - started
+                token_usage = getattr(response, "usage", None)
+                # Whisper is billed by the minute; verbose_json responses carry the duration
+                audio_seconds = getattr(response, "duration", 0) or 0
+                self._record(call_site, latency, token_usage, retries=attempt, request=kwargs, audio_seconds=audio_seconds)
+                logger.info(
+                    f"LLM call {call_site}: {latency:.2f}s, attempts={attempt + 1}, "
+                    f"prompt_tokens={getattr(token_usage, 'prompt_tokens', None)}, "
+                    f"completion_tokens={getattr(token_usage, 'completion_tokens', None)}"
+                )
+                return response
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    self._record(call_site, time.perf_counter() - started, error=True, retries=attempt)
+                    logger.error(f"LLM call {call_site} failed after {attempt + 1} attempts: {str(e)}")
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"LLM call {call_site} attempt {attempt + 1} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+            except Exception:
+                self._record(call_site, time.perf_counter() - started, error=True, retries=attempt)
+                raise
+
+    async def chat(self, call_site: str, timeout: Optional[float] = None, cache: bool = False,
+                   cache_tier: Optional[str] = None, cache_ttl: Optional[int] = None, **kwargs):
+        """
+        chat.completions.create through the gateway; call_site names the caller in logs and stats.
+        With cache=True the response is looked up / stored under a key built from the model,
+        parameters, message text, image digests and cache_tier.
+        """
+        if not cache or not llm_cache.enabled:
+            return await self._call(call_site, self.client.chat.completions.create, timeout, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        params = {k: v for k, v in kwargs.items() if k not in ("model", "messages")}
+        key = await loop.run_in_executor(None, cache_key, kwargs.get("model"), kwargs.get("messages") or [], params, cache_tier)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            logger.info(f"LLM call {call_site}: joining identical in-flight request")
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._cached_chat(call_site, key, timeout, cache_ttl, kwargs))
+        self._inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    async def _cached_chat(self, call_site: str, key: str, timeout: Optional[float], cache_ttl: Optional[int], kwargs: dict):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        cached = await loop.run_in_executor(None, llm_cache.get, key)
+        if cached is not None:
+            try:
+                response = ChatCompletion.model_validate(cached)
+                self._record(call_site, time.perf_counter() - started, cache_hit=True, request=kwargs)
+                logger.info(f"LLM call {call_site}: served from cache ({key[:12]})")
+                return response
+            except Exception as e:
+                logger.warning(f"Discarding unreadable cached response for {call_site}: {str(e)}")
+
+        response = await self._call(call_site, self.client.chat.completions.create, timeout, **kwargs)
+        if self._cacheable(response, kwargs):
+            await loop.run_in_executor(None, llm_cache.put, key, call_site, response.model_dump(mode="json"), cache_ttl)
+        return response
+
+    async def chat_stream(self, call_site: str, timeout: Optional[float] = None, cache: bool = False,
+                          cache_tier: Optional[str] = None, cache_ttl: Optional[int] = None, **kwargs):
+        """
+        Streaming chat completion: an async generator of content deltas.
+        Failures before the first delta are retried like chat(); later ones are raised.
+        With cache=True a cached answer is replayed as a single delta, and a completed
+        stream is stored under the same key chat() would use for the request.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        key = None
+        if cache and llm_cache.enabled:
+            params = {k: v for k, v in kwargs.items() if k not in ("model", "messages")}
+            key = await loop.run_in_executor(None, cache_key, kwargs.get("model"), kwargs.get("messages") or [], params, cache_tier)
+            cached = await loop.run_in_executor(None, llm_cache.get, key)
+            if cached is not None:
+                try:
+                    content = ChatCompletion.model_validate(cached).choices[0].message.content
+                    self._record(call_site, 0.0, cache_hit=True, request=kwargs)
+                    logger.info(f"LLM stream {call_site}: served from cache ({key[:12]})")
+                    yield content
+                    return
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable cached response for {call_site}: {str(e)}")
+
+        started = time.perf_counter()
+        attempt = 0
+        request = {**kwargs, "messages": blob.materialize(kwargs.get("messages"))}
+        content, refusal = [], []
+        completion = {"id": "", "created": int(time.time()), "model": kwargs.get("model"), "finish_reason": None, "usage": None}
+        while True:
+            try:
+                async with self.semaphore:
+                    deadline = loop.time() + timeout
+                    stream = await asyncio.wait_for(
+                        self.client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request),
+                        timeout=timeout,
+                    )
+                    iterator = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                        except StopAsyncIteration:
+                            break
+                        completion["id"], completion["model"] = chunk.id, chunk.model or completion["model"]
+                        if chunk.usage is not None:
+                            completion["usage"] = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        choice = chunk.choices[0]
+                        completion["finish_reason"] = choice.finish_reason or completion["finish_reason"]
+                        if getattr(choice.delta, "refusal", None):
+                            refusal.append(choice.delta.refusal)
+                        if choice.delta.content:
+                            content.append(choice.delta.content)
+                            yield choice.delta.content
+                break
+            except RETRYABLE_ERRORS as e:
+                if content or attempt >= self.max_retries:
+                    self._record(call_site, time.perf_counter() - started, error=True, retries=attempt)
+                    logger.error(f"LLM stream {call_site} failed after {attempt + 1} attempts: {str(e)}")
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"LLM stream {call_site} attempt {attempt + 1} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+            except Exception:
+                self._record(call_site, time.perf_counter() - started, error=True, retries=attempt)
+                raise
+
+        latency = time.perf_counter() - started
+        token_usage = completion["usage"]
+        self._record(call_site, latency, token_usage, retries=attempt, request=kwargs)
+        logger.info(
+            f"LLM stream {call_site}: {latency:.2f}s, attempts={attempt + 1}, "
+            f"prompt_tokens={getattr(token_usage, 'prompt_tokens', None)}, "
+            f"completion_tokens={getattr(token_usage, 'completion_tokens', None)}"
+        )
+        if refusal:
+            logger.error(f"LLM stream {call_site} was refused: {''.join(refusal)}")
+
+        if key is not None:
+            response = ChatCompletion.model_validate({
+                "id": completion["id"],
+                "object": "chat.completion",
+                "created": completion["created"],
+                "model": completion["model"],
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": completion["finish_reason"] or "stop",
+                    "message": {"role": "assistant", "content": "".join(content) or None, "refusal": "".join(refusal) or None},
+                }],
+                "usage": token_usage.model_dump() if token_usage is not None else None,
+            })
+            if self._cacheable(response, kwargs):
+                await loop.run_in_executor(None, llm_cache.put, key, call_site, response.model_dump(mode="json"), cache_ttl)
+
+    @staticmethod
+    def _cacheable(response, kwargs: dict) -> bool:
+        """Only complete, non-refused answers (valid JSON when JSON was requested) are worth replaying"""
+        if not response or not response.choices:
+            return False
+        choice = response.choices[0]
+        if choice.finish_reason != "stop" or choice.message.refusal or not choice.message.content:
+            return False
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(choice.message.content)
+            except ValueError:
+                return False
+        return True
+
+    async def transcribe(self, call_site: str, timeout: Optional[float] = None, **kwargs):
+        """audio.transcriptions.create through the gateway"""
+        return await self._call(call_site, self.client.audio.transcriptions.create, timeout, **kwargs)
+
+    def stats(self) -> dict:
+        """Per-call-site usage and latency since process start"""
+        with self._stats_lock:
+            return {
+                call_site: {
+                    **stats,
+                    "latency_seconds_avg": round(stats["latency_seconds_total"] / stats["calls"], 3) if stats["calls"] else 0.0,
+                }
+                for call_site, stats in self._stats.items()
+            }
+
+
+llm_gateway = LLMGateway()
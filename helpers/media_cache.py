@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+import requests
+
+from app.helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "creative_media_cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# How long a source URL is trusted without revalidating it against the origin
+MEDIA_CACHE_TTL_SECONDS = int(os.getenv("MEDIA_CACHE_TTL_SECONDS", str(24 * 3600)))
+# Entries touched this recently are never evicted, so a path handed to a caller stays readable
+MEDIA_CACHE_MIN_RESIDENCY_SECONDS = 300
+
+CONTENT_TYPE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/mp4": "m4a",
+    "audio/m4a": "m4a",
+    "video/mp4": "mp4",
+    "video/webm": "webm",
+}
+
+
+class MediaCache:
+    """
+    Content-addressed on-disk cache for downloaded creatives.
+    Blobs are stored once per sha256 digest; source URLs (plus the download
+    variant, e.g. a yt-dlp format profile) index into them together with the
+    ETag / Last-Modified validators returned by the origin.
+    """
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES,
+                 ttl_seconds: int = MEDIA_CACHE_TTL_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.objects_dir = os.path.join(root, "objects")
+        self.scratch_dir = os.path.join(root, "scratch")
+        self.db_path = os.path.join(root, "index.sqlite3")
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.bytes_evicted = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(self.objects_dir, exist_ok=True)
+            os.makedirs(self.scratch_dir, exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS blobs (
+                        digest TEXT PRIMARY KEY,
+                        path TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        content_type TEXT,
+                        last_access REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS sources (
+                        url TEXT NOT NULL,
+                        variant TEXT NOT NULL DEFAULT '',
+                        digest TEXT NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        validated_at REAL NOT NULL,
+                        PRIMARY KEY (url, variant)
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access)")
+            self._initialized = True
+
+    # ----------------- Index -----------------
+
+    def _lookup_source(self, url: str, variant: str) -> Optional[sqlite3.Row]:
+        self._ensure_initialized()
+        with self._connect() as conn:
+            row = conn.execute(
+                """SELECT s.digest, s.etag, s.last_modified, s.validated_at, b.path, b.content_type
+                   FROM sources s JOIN blobs b ON b.digest = s.digest
+                   WHERE s.url = ? AND s.variant = ?""",
+                (url, variant),
+            ).fetchone()
+        if row and not os.path.exists(row["path"]):
+            self._forget_blob(row["digest"])
+            return None
+        return row
+
+    def _touch(self, digest: str, validated: bool = False, url: str = None, variant: str = ""):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE blobs SET last_access = ? WHERE digest = ?", (now, digest))
+            if validated and url is not None:
+                conn.execute(
+                    "UPDATE sources SET validated_at = ? WHERE url = ? AND variant = ?",
+                    (now, url, variant),
+                )
+
+    def _forget_blob(self, digest: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sources WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+
+    def lookup(self, url: str, variant: str = "") -> Optional[Tuple[str, Optional[str]]]:
+        """Return (path, content_type) for a fresh cached copy of url, without touching the network."""
+        row = self._lookup_source(url, variant)
+        if row is None or time.time() - row["validated_at"] > self.ttl_seconds:
+            return None
+        self._touch(row["digest"])
+        return row["path"], row["content_type"]
+
+    def digest_for(self, path: str) -> str:
+        """sha256 of a file; free for paths handed out by this cache since they are named by digest."""
+        if os.path.dirname(os.path.dirname(os.path.abspath(path))) == os.path.abspath(self.objects_dir):
+            stem = os.path.splitext(os.path.basename(path))[0]
+            if len(stem) == 64:
+                return stem
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    # ----------------- Storage -----------------
+
+    def put_file(self, url: str, src_path: str, content_type: Optional[str] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 variant: str = "") -> str:
+        """Move a downloaded file into the store and index it under url. Returns the cached path."""
+        self._ensure_initialized()
+        sha = hashlib.sha256()
+        with open(src_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        ext = os.path.splitext(src_path)[1] or (
+            f".{CONTENT_TYPE_EXTENSIONS[content_type]}" if content_type in CONTENT_TYPE_EXTENSIONS else ""
+        )
+        shard_dir = os.path.join(self.objects_dir, digest[:2])
+        os.makedirs(shard_dir, exist_ok=True)
+        final_path = os.path.join(shard_dir, f"{digest}{ext}")
+
+        # Content seen before under another extension keeps its file, so no second copy is orphaned
+        with self._connect() as conn:
+            known = conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if known and os.path.exists(known["path"]):
+            final_path = known["path"]
+        if os.path.exists(final_path):
+            os.remove(src_path)
+        else:
+            shutil.move(src_path, final_path)
+
+        size = os.path.getsize(final_path)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                """INSERT INTO blobs (digest, path, size, content_type, last_access) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(digest) DO UPDATE SET path = excluded.path, last_access = excluded.last_access""",
+                (digest, final_path, size, content_type, now),
+            )
+            conn.execute(
+                """INSERT INTO sources (url, variant, digest, etag, last_modified, validated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(url, variant) DO UPDATE SET digest = excluded.digest, etag = excluded.etag,
+                   last_modified = excluded.last_modified, validated_at = excluded.validated_at""",
+                (url, variant, digest, etag, last_modified, now),
+            )
+
+        self._evict()
+        return final_path
+
+    def put_bytes(self, url: str, data: bytes, content_type: Optional[str] = None,
+                  etag: Optional[str] = None, last_modified: Optional[str] = None,
+                  variant: str = "") -> str:
+        """Store an in-memory download and index it under url. Returns the cached path."""
+        self._ensure_initialized()
+        ext = CONTENT_TYPE_EXTENSIONS.get((content_type or "").split(";")[0].strip(), "bin")
+        fd, tmp_path = tempfile.mkstemp(dir=self.scratch_dir, suffix=f".{ext}")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self.put_file(url, tmp_path, content_type, etag, last_modified, variant)
+
+    def _evict(self):
+        """Drop least-recently-used blobs until the store fits in max_bytes."""
+        with self._lock, self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            cutoff = time.time() - MEDIA_CACHE_MIN_RESIDENCY_SECONDS
+            candidates = conn.execute(
+                "SELECT digest, path, size FROM blobs WHERE last_access < ? ORDER BY last_access ASC",
+                (cutoff,),
+            ).fetchall()
+            for row in candidates:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(row["path"])
+                except FileNotFoundError:
+                    pass
+                conn.execute("DELETE FROM sources WHERE digest = ?", (row["digest"],))
+                conn.execute("DELETE FROM blobs WHERE digest = ?", (row["digest"],))
+                total -= row["size"]
+                self.evictions += 1
+                self.bytes_evicted += row["size"]
+                metrics.MEDIA_CACHE_EVICTIONS.inc()
+                metrics.MEDIA_CACHE_EVICTED_BYTES.inc(row["size"])
+                logger.info(f"Media cache evicted {row['digest'][:12]} ({row['size']} bytes)")
+
+    # ----------------- Fetching -----------------
+
+    def get_or_fetch(self, url: str, fetch: Callable[[str, str], Optional[str]], variant: str = "") -> Optional[str]:
+        """
+        Return a cached path for url, calling fetch(url, scratch_dir) -> path on a miss.
+        Used for sources without HTTP validators (yt-dlp extractions).
+        """
+        cached = self.lookup(url, variant)
+        if cached:
+            self.hits += 1
+            metrics.MEDIA_CACHE_HITS.labels("false").inc()
+            logger.info(f"Media cache hit for {url}")
+            return cached[0]
+
+        self.misses += 1
+        metrics.MEDIA_CACHE_MISSES.inc()
+        self._ensure_initialized()
+        with tempfile.TemporaryDirectory(dir=self.scratch_dir) as scratch:
+            downloaded = fetch(url, scratch)
+            if not downloaded or not os.path.exists(downloaded):
+                return None
+            return self.put_file(url, downloaded, variant=variant)
+
+    def fetch_http(self, url: str, session: Optional[requests.Session] = None,
+                   timeout: int = 30, default_ext: str = "bin") -> Tuple[str, Optional[str]]:
+        """
+        Return (path, content_type) for a plain HTTP(S) resource.
+        Stale entries are revalidated with If-None-Match / If-Modified-Since.
+        """
+        http = session or requests
+        row = self._lookup_source(url, "")
+
+        if row is not None and time.time() - row["validated_at"] <= self.ttl_seconds:
+            self.hits += 1
+            metrics.MEDIA_CACHE_HITS.labels("false").inc()
+            self._touch(row["digest"])
+            return row["path"], row["content_type"]
+
+        headers = {}
+        if row is not None:
+            if row["etag"]:
+                headers["If-None-Match"] = row["etag"]
+            if row["last_modified"]:
+                headers["If-Modified-Since"] = row["last_modified"]
+
+        response = http.get(url, timeout=timeout, headers=headers, stream=True)
+        try:
+            if row is not None and response.status_code == 304:
+                self.hits += 1
+                self.revalidations += 1
+                metrics.MEDIA_CACHE_HITS.labels("true").inc()
+                self._touch(row["digest"], validated=True, url=url)
+                return row["path"], row["content_type"]
+
+            response.raise_for_status()
+            self.misses += 1
+            metrics.MEDIA_CACHE_MISSES.inc()
+            content_type = response.headers.get("content-type")
+            self._ensure_initialized()
+            ext = CONTENT_TYPE_EXTENSIONS.get((content_type or "").split(";")[0].strip(), default_ext)
+            fd, tmp_path = tempfile.mkstemp(dir=self.scratch_dir, suffix=f".{ext}")
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+        finally:
+            response.close()
+
+        path = self.put_file(
+            url, tmp_path, content_type,
+            etag=response.headers.get("etag"),
+            last_modified=response.headers.get("last-modified"),
+        )
+        return path, content_type
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters for this process plus the current size of the store.
+        The same counters are exported to Prometheus through helpers.metrics.
+        """
+        self._ensure_initialized()
+        with self._connect() as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "bytes_evicted": self.bytes_evicted,
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+media_cache = MediaCache()
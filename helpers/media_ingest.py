@@ -0,0 +1,173 @@
+import base64
+import logging
+import re
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import ffmpeg
+import numpy as np
+
+from app.helpers import frame_decoder
+
+logger = logging.getLogger(__name__)
+
+# Frames wider than this are never needed: image_budget scales high-detail images to a 768px short side
+INGEST_MAX_WIDTH = 1366
+# Whisper-ready audio: mono 16 kHz MP3, ~0.35 MB per minute
+AUDIO_SAMPLE_RATE = 16000
+AUDIO_BITRATE = "48k"
+
+_PTS_TIME = re.compile(r"pts_time:\s*(-?[\d.]+)")
+
+
+def _probe(video_path: str) -> Tuple[dict, dict, bool]:
+    """(video stream, metadata, has audio) from the container header; no frame is decoded"""
+    info = ffmpeg.probe(video_path)
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise ValueError(f"No video stream in {video_path}")
+    has_audio = any(s.get("codec_type") == "audio" for s in streams)
+
+    numerator, _, denominator = (video.get("avg_frame_rate") or "0/1").partition("/")
+    fps = float(numerator) / float(denominator) if float(denominator or 0) else 0.0
+    duration = float(video.get("duration") or info.get("format", {}).get("duration") or 0)
+    total_frames = int(video.get("nb_frames") or round(duration * fps))
+    metadata = {
+        "duration_seconds": round(duration, 2),
+        "fps": round(fps, 2),
+        "total_frames": total_frames,
+    }
+    return video, metadata, has_audio
+
+
+def _rotation(video: dict) -> int:
+    """Display rotation in degrees, from the display matrix side data or the legacy rotate tag"""
+    for side_data in video.get("side_data_list") or []:
+        if "rotation" in side_data:
+            return int(float(side_data["rotation"]))
+    return int(float((video.get("tags") or {}).get("rotate") or 0))
+
+
+def _output_size(video: dict, max_width: Optional[int]) -> Tuple[int, int]:
+    """Scale target for the frames as ffmpeg hands them to the filters, i.e. after autorotation"""
+    width, height = int(video["width"]), int(video["height"])
+    if _rotation(video) % 180 == 90:
+        width, height = height, width
+    out_width = min(width, max_width or INGEST_MAX_WIDTH)
+    out_height = max(2, int(round(height * out_width / width / 2)) * 2)
+    return out_width - out_width % 2, out_height
+
+
+def ingest_video(video_path: str, audio_path: Optional[str] = None, max_frames: int = 8,
+                 max_width: Optional[int] = None, jpeg_quality: int = 70,
+                 on_audio: Optional[Callable[[str], None]] = None,
+                 timeout: Optional[float] = None) -> Tuple[List[str], dict]:
+    """
+    Ingest a local video in a single ffmpeg pass. The same demux/decode writes the
+    audio track to audio_path (mono 16 kHz MP3, ready for Whisper) and pipes
+    max_frames * CANDIDATES_PER_FRAME evenly timed, downscaled candidate frames.
+    on_audio(audio_path) is called as soon as the pass ends, before frames are
+    selected and encoded, so transcription can start right away. It is not called
+    when audio_path is None or the video has no audio track. ffmpeg is killed and
+    TimeoutError raised if the pass takes longer than timeout seconds.
+    CPU-bound; services run it through media_worker.ingest_video.
+    Returns the most distinct candidates as base64 JPEGs plus the video metadata,
+    with metadata["frame_timestamps"] holding the time of each returned frame.
+    """
+    video, metadata, has_audio = _probe(video_path)
+    duration = metadata["duration_seconds"]
+    width, height = _output_size(video, max_width)
+    frame_bytes = width * height * 3
+    n_candidates = max(1, max_frames * frame_decoder.CANDIDATES_PER_FRAME)
+    interval = duration / n_candidates if duration > 0 else 1.0
+
+    source = ffmpeg.input(video_path)
+    frames_out = (
+        source.video
+        .filter("select", f"isnan(prev_selected_t)+gte(t-prev_selected_t,{interval:.4f})")
+        .filter("scale", width, height)
+        .filter("showinfo")
+        .output("pipe:", format="rawvideo", pix_fmt="bgr24", vsync="vfr")
+    )
+    write_audio = bool(audio_path) and has_audio
+    outputs = [frames_out]
+    if write_audio:
+        outputs.append(source.audio.output(audio_path, ac=1, ar=AUDIO_SAMPLE_RATE, audio_bitrate=AUDIO_BITRATE))
+
+    process = ffmpeg.merge_outputs(*outputs).overwrite_output().run_async(pipe_stdout=True, pipe_stderr=True)
+
+    # showinfo logs each selected frame's timestamp; stderr is drained on its own thread so ffmpeg never blocks on it
+    stderr_lines = []
+    stderr_reader = threading.Thread(
+        target=lambda: stderr_lines.extend(process.stderr.read().decode("utf-8", errors="ignore").splitlines()),
+        daemon=True,
+    )
+    stderr_reader.start()
+
+    # A wedged ffmpeg is killed after timeout seconds, which ends the reads below
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        process.kill()
+
+    watchdog = threading.Timer(timeout, expire) if timeout else None
+    if watchdog is not None:
+        watchdog.daemon = True
+        watchdog.start()
+
+    # Candidates are kept as a JPEG plus a small thumbnail for the selection signals,
+    # never as full frames
+    candidates = []
+    try:
+        while len(candidates) < n_candidates:
+            raw = process.stdout.read(frame_bytes)
+            if len(raw) < frame_bytes:
+                break
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 3)
+            thumbnail = cv2.resize(
+                frame, (frame_decoder.SIGNAL_WIDTH, max(1, height * frame_decoder.SIGNAL_WIDTH // width)),
+                interpolation=cv2.INTER_AREA,
+            )
+            candidates.append((frame_decoder.encode_jpeg(frame, jpeg_quality), thumbnail))
+        # Drain anything past the last candidate so ffmpeg can finish writing the audio
+        while process.stdout.read(1 << 20):
+            pass
+        returncode = process.wait()
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+        stderr_reader.join()
+    if timed_out.is_set():
+        raise TimeoutError(f"ffmpeg ingest of {video_path} timed out after {timeout}s")
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg ingest failed for {video_path}: {' '.join(stderr_lines[-3:])}")
+
+    if write_audio and on_audio is not None:
+        on_audio(audio_path)
+
+    timestamps = [float(t) for line in stderr_lines if "Parsed_showinfo" in line for t in _PTS_TIME.findall(line)]
+    timestamps = (timestamps + [i * interval for i in range(len(timestamps), len(candidates))])[:len(candidates)]
+
+    selected = []
+    if candidates:
+        positions = np.array(timestamps, dtype=np.float64) / max(duration, 1e-6)
+        signals = frame_decoder.frame_signals([thumbnail for _, thumbnail in candidates])
+        selected = frame_decoder.select_distinct_frames(signals, positions, max_frames)
+        logger.info(f"Selected {len(selected)} distinct frames out of {len(candidates)} candidates")
+    if not selected:
+        selected = frame_decoder.evenly_spaced_indices(len(candidates), max_frames)
+
+    frames, frame_timestamps = [], []
+    for i in selected:
+        jpeg = candidates[i][0]
+        if jpeg:
+            frames.append(base64.b64encode(jpeg).decode("utf-8"))
+            frame_timestamps.append(round(timestamps[i], 2))
+    metadata["frame_timestamps"] = frame_timestamps
+    return frames, metadata
@@ -0,0 +1,246 @@
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import ffmpeg
+
+from app.helpers import acoustics, frame_decoder, media_ingest
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKER_PROCESSES = int(os.getenv("MEDIA_WORKER_PROCESSES", str(os.cpu_count() or 2)))
+# Per-task timeouts (seconds)
+PROBE_TIMEOUT = 30
+EXTRACT_FRAMES_TIMEOUT = int(os.getenv("MEDIA_EXTRACT_FRAMES_TIMEOUT", "120"))
+EXTRACT_AUDIO_TIMEOUT = int(os.getenv("MEDIA_EXTRACT_AUDIO_TIMEOUT", "300"))
+ACOUSTIC_FEATURES_TIMEOUT = int(os.getenv("MEDIA_ACOUSTIC_FEATURES_TIMEOUT", "180"))
+INGEST_TIMEOUT = int(os.getenv("MEDIA_INGEST_TIMEOUT", "300"))
+# Extra time the worker gives a task that enforces its own timeout, so the task's cleanup can run first
+TASK_TIMEOUT_GRACE = 10
+
+# Pipe back to the parent, set in worker processes only
+_parent_conn = None
+
+
+class MediaWorkerError(Exception):
+    """A media task failed, timed out or took its worker process down"""
+
+
+# ----------------- Task functions (run in the worker processes) -----------------
+
+def _probe(video_path: str) -> dict:
+    return frame_decoder.probe(video_path)
+
+
+def _extract_frames(video_path: str, max_frames: int, max_width: Optional[int], jpeg_quality: int) -> Tuple[List[str], dict]:
+    return frame_decoder.sample_representative_frames_base64(
+        video_path, max_frames=max_frames, max_width=max_width, jpeg_quality=jpeg_quality
+    )
+
+
+def _extract_audio(video_path: str, output_path: str, sample_rate: int, bitrate: Optional[str]) -> str:
+    output_kwargs = {"ac": 1, "ar": sample_rate}
+    if bitrate:
+        output_kwargs["audio_bitrate"] = bitrate
+    (
+        ffmpeg
+        .input(video_path)
+        .output(output_path, **output_kwargs)
+        .run(overwrite_output=True, quiet=True)
+    )
+    if not os.path.exists(output_path):
+        raise MediaWorkerError("Audio extraction failed")
+    return output_path
+
+
+def _acoustic_features(audio_path: str) -> dict:
+    return acoustics.analyze_acoustics(audio_path)
+
+
+def _ingest(video_path: str, audio_path: Optional[str], max_frames: int, max_width: Optional[int],
+            jpeg_quality: int, timeout: int) -> Tuple[List[str], dict]:
+    return media_ingest.ingest_video(
+        video_path, audio_path=audio_path, max_frames=max_frames, max_width=max_width,
+        jpeg_quality=jpeg_quality, on_audio=report_progress, timeout=timeout,
+    )
+
+
+def report_progress(value):
+    """Send an intermediate result of the running task to the caller's on_progress (no-op outside a worker)"""
+    if _parent_conn is not None:
+        _parent_conn.send(("progress", value))
+
+
+def _worker_main(conn):
+    """
+    Worker process loop: run (fn, args) messages one at a time. The task may send
+    ("progress", value) messages; it ends with ("result", ok, result or exception).
+    """
+    global _parent_conn
+    _parent_conn = conn
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        fn, args = message
+        try:
+            reply = ("result", True, fn(*args))
+        except BaseException as e:
+            try:
+                pickle.dumps(e)
+                reply = ("result", False, e)
+            except Exception:
+                reply = ("result", False, MediaWorkerError(f"{type(e).__name__}: {e}"))
+        conn.send(reply)
+
+
+# ----------------- Worker -----------------
+
+class _WorkerProcess:
+    """One long-lived worker process and the parent end of its pipe"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(5)
+        self.kill()
+
+
+class MediaWorker:
+    """
+    Worker processes for CPU-bound OpenCV / numpy / ffmpeg work, shared by every service.
+    The blocking calls are meant to be made from the services' I/O thread pools: the GIL-bound
+    work runs in separate processes, so throughput scales with cores and the event loop stays free.
+    Each task has a process to itself while it runs; at most `processes` run at once and the rest
+    wait for one to come free. A task's timeout starts when its process picks it up. A task that
+    times out or crashes has only its own process killed (and replaced on next use); the caller
+    gets MediaWorkerError, and every other task carries on.
+    """
+
+    def __init__(self, processes: int = MEDIA_WORKER_PROCESSES):
+        self.processes = processes
+        # spawn: never fork a process that holds the event loop, HTTP clients and threads
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(processes)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _WorkerProcess:
+        """An idle live worker, or a new one; the caller holds a slot"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+        return _WorkerProcess(self._context)
+
+    def _checkin(self, worker: _WorkerProcess, healthy: bool):
+        if healthy:
+            with self._lock:
+                self._idle.append(worker)
+        else:
+            worker.kill()
+
+    def _run(self, fn, *args, timeout: int, on_progress: Optional[Callable] = None):
+        with self._slots:
+            worker = self._checkout()
+            healthy = False
+            try:
+                try:
+                    worker.conn.send((fn, args))
+                except (OSError, EOFError):
+                    # Died while idle: start over on a fresh process
+                    worker.kill()
+                    worker = _WorkerProcess(self._context)
+                    worker.conn.send((fn, args))
+
+                deadline = time.monotonic() + timeout
+                while True:
+                    if not worker.conn.poll(max(0.0, deadline - time.monotonic())):
+                        logger.error(f"Media task {fn.__name__} timed out after {timeout}s, killing its worker process")
+                        raise MediaWorkerError(f"{fn.__name__} timed out after {timeout}s")
+                    try:
+                        message = worker.conn.recv()
+                    except (OSError, EOFError):
+                        logger.error(f"Media worker process crashed during {fn.__name__}")
+                        raise MediaWorkerError(f"{fn.__name__} crashed its worker process")
+                    if message[0] == "result":
+                        break
+                    if on_progress is not None:
+                        on_progress(message[1])
+                _, ok, value = message
+                healthy = True
+            finally:
+                self._checkin(worker, healthy)
+
+        if ok:
+            return value
+        raise value
+
+    # ----------------- Typed task API -----------------
+
+    def probe(self, video_path: str, timeout: int = PROBE_TIMEOUT) -> dict:
+        """Duration, fps and frame count"""
+        return self._run(_probe, video_path, timeout=timeout)
+
+    def extract_frames(self, video_path: str, max_frames: int = 8, max_width: Optional[int] = None,
+                       jpeg_quality: int = 70, timeout: int = EXTRACT_FRAMES_TIMEOUT) -> Tuple[List[str], dict]:
+        """Representative frames as base64 JPEGs plus video metadata"""
+        return self._run(_extract_frames, video_path, max_frames, max_width, jpeg_quality, timeout=timeout)
+
+    def extract_audio(self, video_path: str, output_path: str, sample_rate: int = 16000,
+                      bitrate: Optional[str] = None, timeout: int = EXTRACT_AUDIO_TIMEOUT) -> str:
+        """Mono audio track written to output_path (format from the extension)"""
+        return self._run(_extract_audio, video_path, output_path, sample_rate, bitrate, timeout=timeout)
+
+    def acoustic_features(self, audio_path: str, timeout: int = ACOUSTIC_FEATURES_TIMEOUT) -> dict:
+        """Tempo, energy, spectral and pause features (see acoustics.analyze_acoustics)"""
+        return self._run(_acoustic_features, audio_path, timeout=timeout)
+
+    def ingest_video(self, video_path: str, audio_path: Optional[str] = None, max_frames: int = 8,
+                     max_width: Optional[int] = None, jpeg_quality: int = 70,
+                     on_audio: Optional[Callable[[str], None]] = None,
+                     timeout: int = INGEST_TIMEOUT) -> Tuple[List[str], dict]:
+        """
+        Frames, metadata and (optionally) the audio track from one ffmpeg pass (see
+        media_ingest.ingest_video). on_audio is called in the calling process as soon as the
+        audio track is written; ffmpeg itself is killed if the pass outlives timeout.
+        """
+        return self._run(
+            _ingest, video_path, audio_path, max_frames, max_width, jpeg_quality, timeout,
+            timeout=timeout + TASK_TIMEOUT_GRACE, on_progress=on_audio,
+        )
+
+    def shutdown(self):
+        """Stop the idle worker processes; busy ones are stopped when their task returns them"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+media_worker = MediaWorker()
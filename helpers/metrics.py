@@ -0,0 +1,105 @@
+import contextvars
+import functools
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "creative_pipeline_stage_seconds",
+    "Duration of pretest / simulation pipeline stages",
+    ["pipeline", "stage", "asset_type", "tier"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+
+# Media cache activity, scraped from the API and from each job worker (MediaCache.stats only sees its own process)
+MEDIA_CACHE_HITS = Counter("creative_media_cache_hits_total", "Media cache lookups served from disk", ["revalidated"])
+MEDIA_CACHE_MISSES = Counter("creative_media_cache_misses_total", "Media cache lookups that downloaded the source")
+MEDIA_CACHE_EVICTIONS = Counter("creative_media_cache_evictions_total", "Blobs evicted from the media cache")
+MEDIA_CACHE_EVICTED_BYTES = Counter("creative_media_cache_evicted_bytes_total", "Bytes evicted from the media cache")
+
+# The pipeline run (pretest / simulation job, or an API request) spans are attributed to
+_trace: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("pipeline_trace", default=None)
+_asset_type: contextvars.ContextVar[str] = contextvars.ContextVar("pipeline_asset_type", default="all")
+
+
+def start_trace(pipeline: str, tier: Optional[str] = None) -> dict:
+    """
+    Start collecting spans for the current context (job or request).
+    The returned dict is live: its "spans" fill up as stages finish, and
+    "tier" may be set once it is known.
+    """
+    trace = {"pipeline": pipeline, "tier": tier or "unknown", "spans": []}
+    _trace.set(trace)
+    return trace
+
+
+def set_tier(tier: str):
+    """Label the rest of the current trace with the user's tier once it is known"""
+    trace = _trace.get()
+    if trace is not None:
+        trace["tier"] = tier
+
+
+def record(stage: str, seconds: float, asset_type: Optional[str] = None):
+    """Observe a finished stage in the histogram and on the current trace"""
+    trace = _trace.get()
+    asset_type = asset_type or _asset_type.get()
+    pipeline = trace["pipeline"] if trace else "none"
+    tier = trace["tier"] if trace else "none"
+    try:
+        STAGE_SECONDS.labels(pipeline, stage, asset_type, tier).observe(seconds)
+    except Exception as e:
+        logger.warning(f"Failed to record stage {stage}: {str(e)}")
+    if trace is not None:
+        trace["spans"].append({"stage": stage, "asset_type": asset_type, "seconds": round(seconds, 4)})
+
+
+@contextmanager
+def span(stage: str, asset_type: Optional[str] = None):
+    """Time the enclosed block as one pipeline stage; also usable inside async functions"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, asset_type)
+
+
+def set_asset_type(asset_type: str):
+    """
+    Label spans recorded from here on in the current context (and in work bound
+    from it) with an asset type. Assets are processed in their own asyncio tasks,
+    each with its own context, so this does not leak between assets.
+    """
+    _asset_type.set(asset_type)
+
+
+def bind(fn):
+    """
+    fn wrapped to run in a copy of the current context. Executor threads do not
+    inherit context variables, so work handed to them must be bound to keep its
+    spans on the current trace. Each bound callable must be called only once.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def summarize(spans: list) -> list:
+    """Total seconds per stage, in the order stages first occurred"""
+    totals = {}
+    for s in spans or []:
+        totals[s["stage"]] = totals.get(s["stage"], 0.0) + s["seconds"]
+    return [{"stage": stage, "seconds": round(seconds, 4)} for stage, seconds in totals.items()]
+
+
+def server_timing(spans: list) -> str:
+    """Server-Timing header value: one metric per stage, durations in milliseconds"""
+    # Stages that ran in parallel (several assets) are summed, so the total can exceed wall time
+    return ", ".join(
+        f"{re.sub(r'[^A-Za-z0-9_-]', '_', s['stage'])};dur={s['seconds'] * 1000:.1f}"
+        for s in summarize(spans)
+    )
@@ -0,0 +1,102 @@
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from app.helpers.db import supabase_service
+from app.helpers.repository import repository
+
+logger = logging.getLogger(__name__)
+
+PRETESTS = "pretests_count"
+PROJECTS = "projects_count"
+
+
+class QuotaExceeded(Exception):
+    """The user has used count of their limit"""
+
+    def __init__(self, counter: str, count: int, limit: int):
+        super().__init__(f"{counter} limit reached: {count} of {limit}")
+        self.counter = counter
+        self.count = count
+        self.limit = limit
+
+
+def _reserve_params(user_id: str, counter: str, limit: Optional[int]) -> dict:
+    return {"p_user_id": str(user_id), "p_counter": counter, "p_limit": limit}
+
+
+def _client():
+    """Service-role client: the quota functions are executable by service_role only"""
+    if supabase_service is None:
+        raise RuntimeError("SUPABASE_SERVICE_ROLE_KEY must be set for quota updates")
+    return supabase_service
+
+
+def _granted(result: Optional[dict], user_id: str, counter: str, limit: Optional[int]) -> int:
+    result = result or {}
+    if result.get("user_found") is False:
+        logger.error(f"User {user_id} not found; {counter} not counted")
+        return 0
+    if not result.get("granted"):
+        raise QuotaExceeded(counter, result.get("count") or 0, limit)
+    return result["count"]
+
+
+class QuotaService:
+    """
+    Usage quotas on users, changed in one atomic round-trip each by the functions in
+    sql/quota.sql. reserve() checks the limit and counts the use together, so
+    concurrent requests can neither lose an increment nor overshoot the limit; the
+    reservation stands (is committed) unless release() gives it back because the work
+    it paid for failed. limit=None reserves without a limit (unlimited plans are still
+    counted). The reservation() context managers commit on success and release on error.
+    Sync methods use the service-role supabase client (sync routes); a-prefixed ones the
+    async repository, whose rpc also uses the service-role key.
+    """
+
+    def reserve(self, user_id: str, counter: str, limit: Optional[int]) -> int:
+        """New count (0 for a user without a users row, who is let through); raises QuotaExceeded"""
+        response = _client().rpc("reserve_quota", _reserve_params(user_id, counter, limit)).execute()
+        return _granted(response.data, user_id, counter, limit)
+
+    async def areserve(self, user_id: str, counter: str, limit: Optional[int]) -> int:
+        result = await repository.rpc("reserve_quota", _reserve_params(user_id, counter, limit))
+        return _granted(result, user_id, counter, limit)
+
+    def release(self, user_id: str, counter: str):
+        """Give back one reservation; logs instead of raising, since the caller is already handling a failure"""
+        try:
+            _client().rpc("release_quota", {"p_user_id": str(user_id), "p_counter": counter}).execute()
+        except Exception as e:
+            logger.error(f"Failed to release {counter} for user {user_id}: {str(e)}")
+
+    async def arelease(self, user_id: str, counter: str):
+        try:
+            await repository.rpc("release_quota", {"p_user_id": str(user_id), "p_counter": counter})
+        except Exception as e:
+            logger.error(f"Failed to release {counter} for user {user_id}: {str(e)}")
+
+    def reset(self, user_id: str, counter: str):
+        _client().rpc("reset_quota", {"p_user_id": str(user_id), "p_counter": counter}).execute()
+
+    @contextmanager
+    def reservation(self, user_id: str, counter: str, limit: Optional[int]):
+        """Reserve, yield the new count, and release if the block raises"""
+        count = self.reserve(user_id, counter, limit)
+        try:
+            yield count
+        except BaseException:
+            self.release(user_id, counter)
+            raise
+
+    @asynccontextmanager
+    async def areservation(self, user_id: str, counter: str, limit: Optional[int]):
+        count = await self.areserve(user_id, counter, limit)
+        try:
+            yield count
+        except BaseException:
+            await self.arelease(user_id, counter)
+            raise
+
+
+quota = QuotaService()
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+# How long a resolved stream URL (and its metadata) is reused; signed CDN / googlevideo URLs expire after a few hours
+RESOLVE_TTL_SECONDS = int(os.getenv("RANGE_FETCH_RESOLVE_TTL_SECONDS", "1800"))
+RANGE_FETCH_ENABLED = os.getenv("RANGE_FETCH_ENABLED", "true").lower() == "true"
+DIRECT_VIDEO_EXTENSIONS = {".mp4", ".m4v", ".mov", ".webm", ".mkv"}
+
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def is_remote(path: str) -> bool:
+    return "://" in path
+
+
+def _content_key(*parts) -> str:
+    return "remote-" + hashlib.sha256("|".join(str(p or "") for p in parts).encode("utf-8")).hexdigest()
+
+
+def _resolve_direct(url: str) -> Optional[dict]:
+    """
+    A plain video file whose server honours Range requests and sends a validator.
+    Without ETag or Last-Modified the URL and size cannot tell a replaced file from the
+    old one, so such sources are downloaded and keyed on their content instead.
+    """
+    if os.path.splitext(urlparse(url).path)[1].lower() not in DIRECT_VIDEO_EXTENSIONS:
+        return None
+    response = requests.get(url, headers={"Range": "bytes=0-0"}, timeout=10, stream=True, allow_redirects=True)
+    try:
+        if response.status_code != 206:
+            return None
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if not etag and not last_modified:
+            logger.info(f"No ETag or Last-Modified for {url}; downloading it instead")
+            return None
+        total = (response.headers.get("content-range") or "").rpartition("/")[2]
+        return {
+            "video_url": response.url,
+            "audio_url": response.url,
+            "content_key": _content_key(url, etag, total, last_modified),
+            "duration_seconds": None,
+        }
+    finally:
+        response.close()
+
+
+def _resolve_ytdlp(url: str, ytdlp_format: str) -> Optional[dict]:
+    """Stream URLs resolved by yt-dlp, without downloading; only plain HTTP(S) progressive streams qualify"""
+    ydl_opts = {
+        'format': ytdlp_format,
+        'quiet': True,
+        'no_warnings': True,
+        'socket_timeout': 15,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+
+    if not info or info.get("protocol") not in ("http", "https") or not info.get("url"):
+        return None
+
+    # A separate audio-only stream (DASH sources) keeps transcription from pulling the video bytes
+    audio_formats = [
+        f for f in info.get("formats") or []
+        if f.get("vcodec") == "none" and f.get("acodec") not in (None, "none")
+        and f.get("protocol") in ("http", "https") and f.get("url")
+    ]
+    audio_format = min(audio_formats, key=lambda f: f.get("abr") or 0) if audio_formats else None
+
+    return {
+        "video_url": info["url"],
+        "audio_url": audio_format["url"] if audio_format else info["url"],
+        "content_key": _content_key("ytdlp", info.get("extractor"), info.get("id"), info.get("format_id")),
+        "duration_seconds": info.get("duration"),
+    }
+
+
+def resolve(url: str, ytdlp_format: str) -> Optional[dict]:
+    """
+    Resolve a creative URL to seekable stream URLs that ffmpeg / OpenCV can read with
+    HTTP Range requests, so only the container index, the GOPs around the sampled frames
+    and (when transcribing) the audio are transferred instead of the whole file.
+
+    Returns {"video_url", "audio_url", "content_key", "duration_seconds"} or None when the
+    source cannot be read that way and should be downloaded instead. Results, including
+    negative ones, are cached per (url, format) for RESOLVE_TTL_SECONDS.
+    """
+    if not RANGE_FETCH_ENABLED:
+        return None
+
+    key = (url, ytdlp_format)
+    now = time.time()
+    with _resolved_lock:
+        cached = _resolved.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    source = None
+    try:
+        source = _resolve_direct(url) or _resolve_ytdlp(url, ytdlp_format)
+    except Exception as e:
+        logger.info(f"Range fetch not available for {url}: {str(e)}")
+
+    with _resolved_lock:
+        _resolved[key] = (now + RESOLVE_TTL_SECONDS, source)
+        for stale in [k for k, (expires_at, _) in _resolved.items() if expires_at <= now]:
+            del _resolved[stale]
+
+    if source:
+        logger.info(f"Streaming {url} with Range requests instead of downloading it")
+    return source
@@ -0,0 +1,183 @@
+import contextvars
+import functools
+import logging
+import os
+from typing import List, Optional
+
+import httpx
+
+from app.helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+REPOSITORY_MAX_CONNECTIONS = int(os.getenv("REPOSITORY_MAX_CONNECTIONS", "20"))
+REPOSITORY_TIMEOUT_SECONDS = float(os.getenv("REPOSITORY_TIMEOUT_SECONDS", "10"))
+# Over-budget query counts raise instead of logging (set in tests and staging)
+REPOSITORY_STRICT_QUERY_BUDGET = os.getenv("REPOSITORY_STRICT_QUERY_BUDGET", "false").lower() == "true"
+
+# Round-trips made in the current query_budget call
+_query_count: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("repository_query_count", default=None)
+
+
+def query_budget(max_queries: int):
+    """
+    Decorator for async handlers: count the repository round-trips of each call and
+    flag calls that made more than max_queries, with a warning or (with
+    REPOSITORY_STRICT_QUERY_BUDGET) an AssertionError, so N+1 query patterns
+    do not creep back in.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            counter = [0]
+            token = _query_count.set(counter)
+            try:
+                result = await fn(*args, **kwargs)
+            finally:
+                _query_count.reset(token)
+            if counter[0] > max_queries:
+                message = f"{fn.__qualname__} made {counter[0]} database round-trips (budget {max_queries})"
+                if REPOSITORY_STRICT_QUERY_BUDGET:
+                    raise AssertionError(message)
+                logger.warning(message)
+            return result
+        return wrapper
+    return decorator
+
+
+class Repository:
+    """
+    Async data access for the request handlers. Queries go straight to PostgREST
+    over one pooled httpx.AsyncClient, so a round-trip never blocks the event loop
+    the way the synchronous supabase client in helpers.db does. The hot queries
+    have their own typed methods; anything else can use select / update.
+    Requests authenticate with SUPABASE_KEY, or with SUPABASE_SERVICE_ROLE_KEY
+    (bypassing RLS) where the method says so.
+    """
+
+    def __init__(self, url: Optional[str] = SUPABASE_URL, key: Optional[str] = SUPABASE_KEY,
+                 max_connections: int = REPOSITORY_MAX_CONNECTIONS, timeout: float = REPOSITORY_TIMEOUT_SECONDS,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 service_key: Optional[str] = SUPABASE_SERVICE_ROLE_KEY):
+        self.base_url = f"{(url or '').rstrip('/')}/rest/v1"
+        self.key = key
+        self.service_key = service_key
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.transport = transport
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.key or "", "Authorization": f"Bearer {self.key}"},
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _send(self, method: str, path: str, params: Optional[dict] = None,
+                    json=None, prefer: Optional[str] = None, service_role: bool = False):
+        headers = {"Prefer": prefer} if prefer else {}
+        if service_role:
+            if not self.service_key:
+                raise RuntimeError("SUPABASE_SERVICE_ROLE_KEY must be set for service-role queries")
+            headers.update({"apikey": self.service_key, "Authorization": f"Bearer {self.service_key}"})
+        counter = _query_count.get()
+        if counter is not None:
+            counter[0] += 1
+        with metrics.span("db_query"):
+            response = await self.client.request(method, path, params=params, json=json, headers=headers)
+        if response.status_code >= 400:
+            logger.error(f"PostgREST {method} {path} failed with {response.status_code}: {response.text[:500]}")
+            response.raise_for_status()
+        return response.json() if response.content else None
+
+    async def select(self, table: str, columns: str = "*", filters: Optional[dict] = None,
+                     order: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        """Rows of table; filters map column to a PostgREST operator expression, e.g. {"id": "eq.5"}"""
+        params = {"select": columns, **(filters or {})}
+        if order:
+            params["order"] = order
+        if limit is not None:
+            params["limit"] = limit
+        return await self._send("GET", f"/{table}", params=params) or []
+
+    async def update(self, table: str, data: dict, filters: dict, service_role: bool = False) -> List[dict]:
+        """Update the matching rows and return them"""
+        return await self._send(
+            "PATCH", f"/{table}", params=filters, json=data, prefer="return=representation", service_role=service_role
+        ) or []
+
+    async def rpc(self, function: str, params: dict):
+        """
+        Call a Postgres function exposed by PostgREST. The functions in sql/ trust their
+        user id argument and are executable by service_role only, so calls use the service-role key.
+        """
+        return await self._send("POST", f"/rpc/{function}", json=params, service_role=True)
+
+    async def get_active_subscription(self, user_id: str) -> Optional[dict]:
+        """The user's latest active subscription (tier, status, end_date), or None; see helpers.tier"""
+        rows = await self.select(
+            "subscriptions", "tier,status,end_date",
+            {"user_id": f"eq.{user_id}", "status": "eq.active"},
+            order="created_at.desc", limit=1
+        )
+        return rows[0] if rows else None
+
+    async def get_user_counter(self, user_id: str, field: str) -> Optional[int]:
+        """Current value of a usage counter on users (e.g. pretests_count); None if the user does not exist"""
+        rows = await self.select("users", field, {"id": f"eq.{user_id}"})
+        if not rows:
+            return None
+        return rows[0].get(field) or 0
+
+    async def update_user(self, user_id: str, data: dict) -> Optional[dict]:
+        """Update a user's row and return it, or None if nothing matched (service role, like routers/users.py)"""
+        rows = await self.update("users", data, {"id": f"eq.{user_id}"}, service_role=True)
+        return rows[0] if rows else None
+
+    async def get_project(self, project_id, user_id: Optional[str] = None) -> Optional[dict]:
+        """Project by id; with user_id, only if that user owns it"""
+        filters = {"id": f"eq.{project_id}"}
+        if user_id is not None:
+            filters["user_id"] = f"eq.{user_id}"
+        rows = await self.select("projects", "*", filters)
+        return rows[0] if rows else None
+
+    async def get_creative_context(self, user_id: str, persona_ids: list, asset_ids: list) -> dict:
+        """
+        Personas, creative assets and their projects in one round-trip (sql/creative_context.sql),
+        with ownership checked in the database: {"personas": {id: row}, "assets": [rows],
+        "projects": {id: row}, "error": None}, or {"error": {"status", "code", "id"}} when a
+        row is missing (404) or belongs to someone else (403).
+        """
+        context = await self.rpc("creative_context", {
+            "p_user_id": str(user_id),
+            "p_persona_ids": sorted({int(i) for i in persona_ids}),
+            "p_asset_ids": sorted({int(i) for i in asset_ids}),
+        }) or {}
+        if context.get("error"):
+            return {"error": context["error"]}
+        return {
+            "personas": {row["id"]: row for row in context.get("personas") or []},
+            "assets": context.get("assets") or [],
+            "projects": {row["id"]: row for row in context.get("projects") or []},
+            "error": None,
+        }
+
+repository = Repository()
@@ -0,0 +1,258 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" (a table shared by the uvicorn workers on one host) or "supabase" (the
+# revoked_tokens table, shared by every host)
+REVOCATION_BACKEND = os.getenv("REVOCATION_BACKEND", "sqlite").lower()
+REVOCATION_DB_PATH = os.getenv("REVOCATION_DB_PATH", os.path.join(tempfile.gettempdir(), "creative_revocations.sqlite3"))
+REVOCATION_TABLE = "revoked_tokens"
+# How stale another worker's view of a logout may be
+REVOCATION_REFRESH_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "2"))
+# Expired revocations are purged and the filter rebuilt this often
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "3600"))
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+# Rows re-read below the sync watermark on every refresh, for inserts that commit out of id order
+REVOCATION_SYNC_OVERLAP = 64
+# Rows per request when reading revocations from Supabase; at most PostgREST's max-rows (1000 by default)
+REVOCATION_PAGE_SIZE = 1000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (k positions by double hashing one blake2b digest)"""
+
+    def __init__(self, capacity: int, error_rate: float = REVOCATION_BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SqliteRevocationStore:
+    """Revoked nonces in a local SQLite file"""
+
+    def __init__(self, db_path: str = REVOCATION_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {REVOCATION_TABLE} (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        nonce TEXT NOT NULL UNIQUE,
+                        user_id TEXT,
+                        expires_at REAL,
+                        revoked_at REAL NOT NULL
+                    )"""
+                )
+            self._initialized = True
+
+    def add(self, nonce: str, user_id: Optional[str], expires_at: Optional[float]):
+        self._ensure_initialized()
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO {REVOCATION_TABLE} (nonce, user_id, expires_at, revoked_at) VALUES (?, ?, ?, ?)",
+                (nonce, user_id, expires_at, time.time()),
+            )
+
+    def contains(self, nonce: str) -> bool:
+        self._ensure_initialized()
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT 1 FROM {REVOCATION_TABLE} WHERE nonce = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (nonce, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def since(self, after_id: int) -> List[Tuple[int, str]]:
+        """(id, nonce) of the live revocations with an id above after_id"""
+        self._ensure_initialized()
+        with self._connect() as conn:
+            return conn.execute(
+                f"""SELECT id, nonce FROM {REVOCATION_TABLE}
+                    WHERE id > ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY id""",
+                (after_id, time.time()),
+            ).fetchall()
+
+    def purge_expired(self):
+        self._ensure_initialized()
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {REVOCATION_TABLE} WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+
+class SupabaseRevocationStore:
+    """Revoked nonces in the revoked_tokens table (see models.RevokedToken)"""
+
+    @staticmethod
+    def _client():
+        from app.helpers.db import supabase
+        return supabase
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def add(self, nonce: str, user_id: Optional[str], expires_at: Optional[float]):
+        self._client().table(REVOCATION_TABLE).upsert({
+            "nonce": nonce,
+            "user_id": user_id,
+            "expires_at": datetime.fromtimestamp(expires_at, timezone.utc).isoformat() if expires_at else None,
+        }, on_conflict="nonce", ignore_duplicates=True).execute()
+
+    def contains(self, nonce: str) -> bool:
+        response = (
+            self._client().table(REVOCATION_TABLE)
+            .select("id")
+            .eq("nonce", nonce)
+            .or_(f"expires_at.is.null,expires_at.gt.{self._now()}")
+            .limit(1)
+            .execute()
+        )
+        return bool(response.data)
+
+    def since(self, after_id: int) -> List[Tuple[int, str]]:
+        """Every live revocation above after_id, read page by page (a single response is capped at max-rows)"""
+        rows, now = [], self._now()
+        while True:
+            page = (
+                self._client().table(REVOCATION_TABLE)
+                .select("id, nonce")
+                .gt("id", after_id)
+                .or_(f"expires_at.is.null,expires_at.gt.{now}")
+                .order("id")
+                .limit(REVOCATION_PAGE_SIZE)
+                .execute()
+            ).data or []
+            rows.extend((row["id"], row["nonce"]) for row in page)
+            if len(page) < REVOCATION_PAGE_SIZE:
+                return rows
+            after_id = page[-1]["id"]
+
+    def purge_expired(self):
+        self._client().table(REVOCATION_TABLE).delete().lt("expires_at", self._now()).execute()
+
+
+class RevocationList:
+    """
+    Revoked token nonces, shared between workers through the store and mirrored in an
+    in-process Bloom filter. The common case, a token that was never revoked, is
+    answered by the filter without touching the store; only filter hits (revoked
+    tokens and rare false positives) are confirmed there. The filter is topped up
+    incrementally from the store every REVOCATION_REFRESH_SECONDS, and rebuilt from
+    the live rows (dropping expired ones) every REVOCATION_REBUILD_SECONDS.
+    A revocation lives as long as the token it revokes: until its exp claim, or
+    for good when the token does not expire.
+    """
+
+    def __init__(self, store=None, refresh_seconds: float = REVOCATION_REFRESH_SECONDS,
+                 rebuild_seconds: float = REVOCATION_REBUILD_SECONDS, capacity: int = REVOCATION_BLOOM_CAPACITY):
+        if store is None:
+            store = SupabaseRevocationStore() if REVOCATION_BACKEND == "supabase" else SqliteRevocationStore()
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.capacity = capacity
+        self._filter = None
+        self._watermark = 0
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def _rebuild(self):
+        """Build a new filter from every live revocation; the filter is only swapped in once complete"""
+        self.store.purge_expired()
+        rows = self.store.since(0)
+        capacity = self.capacity
+        while capacity < 2 * len(rows):
+            capacity *= 2
+        bloom = BloomFilter(capacity)
+        for _, nonce in rows:
+            bloom.add(nonce)
+        self._filter = bloom
+        self._watermark = rows[-1][0] if rows else 0
+        self._rebuilt_at = time.monotonic()
+        logger.info(f"Revocation filter rebuilt with {len(rows)} nonces ({bloom.size // 8 // 1024}KB)")
+
+    def _top_up(self):
+        rows = self.store.since(max(0, self._watermark - REVOCATION_SYNC_OVERLAP))
+        for row_id, nonce in rows:
+            self._filter.add(nonce)
+            self._watermark = max(self._watermark, row_id)
+
+    def refresh(self, force: bool = False):
+        """Bring the filter up to date with the store; at most one thread does it at a time"""
+        now = time.monotonic()
+        if not force and self._filter is not None and now - self._refreshed_at < self.refresh_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=self._filter is None or force):
+            return
+        try:
+            if self._filter is None or now - self._rebuilt_at >= self.rebuild_seconds:
+                self._rebuild()
+            else:
+                self._top_up()
+            self._refreshed_at = now
+        except Exception as e:
+            logger.warning(f"Revocation filter refresh failed: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+
+    def revoke(self, nonce: str, user_id: Optional[str] = None, expires_at: Optional[float] = None):
+        """Revoke a token by its nonce, for every worker"""
+        self.store.add(nonce, str(user_id) if user_id is not None else None, expires_at)
+        # Under the refresh lock: setting bits is a read-modify-write that a concurrent
+        # top-up could otherwise undo, and a rebuild in progress would not see this nonce
+        with self._refresh_lock:
+            if self._filter is not None:
+                self._filter.add(nonce)
+
+    def is_revoked(self, nonce: str) -> bool:
+        self.refresh()
+        if self._filter is not None and nonce not in self._filter:
+            return False
+        try:
+            return self.store.contains(nonce)
+        except Exception as e:
+            # Fail closed: the filter says this nonce may be revoked and the store cannot tell otherwise
+            logger.error(f"Revocation store lookup failed: {str(e)}")
+            return True
+
+
+revocation_list = RevocationList()
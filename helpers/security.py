@@ -1,12 +1,15 @@
 from passlib.context import CryptContext
 from jose import jwt
 import os
+import time
 import uuid
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError
 from app.helpers.db import get_user_by_email
+from app.helpers.revocation import revocation_list
+from app.helpers.user_cache import user_cache
 
 load_dotenv()
 
@@ -14,6 +17,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 SECRET_KEY = os.getenv("JWT_SECRET")
 ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+# Unset: tokens do not expire (and neither do their revocations)
+JWT_LIFETIME_SECONDS = int(os.getenv("JWT_LIFETIME_SECONDS", "0")) or None
 
 security = HTTPBearer()
 
@@ -26,6 +31,8 @@ def create_persistent_token(email: str, user_id: int):
         "user_id": user_id,
         "nonce": nonce
     }
+    if JWT_LIFETIME_SECONDS:
+        token_data["exp"] = int(time.time()) + JWT_LIFETIME_SECONDS
     return jwt.encode(token_data, SECRET_KEY, algorithm=ALGORITHM)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -36,16 +43,15 @@ def hash_password(password: str) -> str:
     """Hash a plain password."""
     return pwd_context.hash(password)
 
-expired_tokens = set()
-
 def expire_token(token: str):
-    """Mark a token as expired by adding its nonce to the blacklist"""
+    """Mark a token as expired by revoking its nonce, for every worker"""
     try:
         # Decode token to get the nonce
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         nonce = payload.get("nonce")
         if nonce:
-            expired_tokens.add(nonce)
+            revocation_list.revoke(nonce, payload.get("user_id"), payload.get("exp"))
+            user_cache.invalidate((payload.get("user_id"), nonce))
             return True
     except JWTError:
         pass
@@ -69,7 +75,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             raise credentials_exception
             
         # Check if token is expired (nonce-based blacklisting)
-        if nonce and nonce in expired_tokens:
+        if nonce and revocation_list.is_revoked(nonce):
             raise HTTPException(
                 status_code=401,
                 detail="Token has expired",
@@ -79,8 +85,15 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
     except JWTError:
         raise credentials_exception
 
-    user = get_user_by_email(email)
-    if user is None or user["id"] != user_id:
+    user = user_cache.get((user_id, nonce), lambda: get_user_by_email(email))
+    if user is None or user["id"] != user_id or user.get("email") != email:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+
+def get_admin_user(current_user: dict = Depends(get_current_user)):
+    """Current user, required to have the admin role"""
+    if current_user.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
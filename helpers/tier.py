@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.helpers.db import supabase
+from app.helpers.repository import repository
+
+logger = logging.getLogger(__name__)
+
+# "sqlite" (shared by every process on the host, so a webhook handled by one API worker
+# invalidates the others), "memory" (per process; only safe with a single worker), or "off"
+TIER_CACHE_BACKEND = os.getenv("TIER_CACHE_BACKEND", "sqlite").lower()
+TIER_CACHE_PATH = os.getenv("TIER_CACHE_PATH", os.path.join(tempfile.gettempdir(), "creative_tier_cache.sqlite3"))
+TIER_CACHE_TTL_SECONDS = int(os.getenv("TIER_CACHE_TTL_SECONDS", "300"))
+TIER_CACHE_MEMORY_ENTRIES = int(os.getenv("TIER_CACHE_MEMORY_ENTRIES", "10000"))
+
+
+def tier_from_subscription(subscription: Optional[dict]) -> str:
+    """Lower-cased tier of the user's latest active subscription; "free" without one or once it has ended"""
+    if not subscription:
+        return "free"
+    end_date = subscription.get("end_date")
+    if end_date:
+        ends = datetime.fromisoformat(end_date.replace("Z", "+00:00"))
+        if ends.tzinfo is None:
+            ends = ends.replace(tzinfo=timezone.utc)
+        if ends <= datetime.now(timezone.utc):
+            return "free"
+    return (subscription.get("tier") or "free").lower()
+
+
+class TierService:
+    """
+    Resolves a user's subscription tier for the gated endpoints, with a TTL cache in
+    front of the subscriptions table. The Stripe webhook handlers invalidate a user's
+    entry whenever they write their subscription, so the TTL only bounds how long an
+    update made outside the webhooks can go unnoticed.
+    """
+
+    def __init__(self, backend: str = TIER_CACHE_BACKEND, ttl: int = TIER_CACHE_TTL_SECONDS,
+                 db_path: str = TIER_CACHE_PATH, max_entries: int = TIER_CACHE_MEMORY_ENTRIES):
+        self.backend = backend
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._initialized = False
+        # Bumped by every invalidation, so a lookup that raced one does not cache what it read.
+        # Per process for the memory backend; the sqlite backend keeps one per user in tier_generations.
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS tiers (
+                        user_id TEXT PRIMARY KEY,
+                        tier TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS tier_generations (
+                        user_id TEXT PRIMARY KEY,
+                        generation INTEGER NOT NULL
+                    )"""
+                )
+            self._initialized = True
+
+    def _get(self, user_id: str) -> Optional[str]:
+        now = time.time()
+        if self.backend == "memory":
+            with self._lock:
+                entry = self._entries.get(user_id)
+            return entry[0] if entry and entry[1] > now else None
+        if self.backend == "sqlite":
+            self._ensure_initialized()
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT tier FROM tiers WHERE user_id = ? AND expires_at > ?", (user_id, now)
+                ).fetchone()
+            return row[0] if row else None
+        return None
+
+    def _generation_of(self, user_id: str) -> int:
+        """Invalidation generation to pass to _save() once the tier has been read"""
+        if self.backend != "sqlite":
+            return self._generation
+        try:
+            self._ensure_initialized()
+            with self._connect() as conn:
+                row = conn.execute("SELECT generation FROM tier_generations WHERE user_id = ?", (user_id,)).fetchone()
+            return row[0] if row else 0
+        except Exception as e:
+            logger.warning(f"Tier cache lookup failed: {str(e)}")
+            return -1  # never matches, so nothing is cached
+
+    def _put(self, user_id: str, tier: str, generation: int):
+        """Cache the tier unless the user was invalidated since generation was read"""
+        expires_at = time.time() + self.ttl
+        if self.backend == "memory":
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._entries[user_id] = (tier, expires_at)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        elif self.backend == "sqlite":
+            self._ensure_initialized()
+            with self._connect() as conn:
+                conn.execute(
+                    """INSERT OR REPLACE INTO tiers (user_id, tier, expires_at)
+                       SELECT ?, ?, ?
+                       WHERE COALESCE((SELECT generation FROM tier_generations WHERE user_id = ?), 0) = ?""",
+                    (user_id, tier, expires_at, user_id, generation),
+                )
+
+    def _lookup(self, user_id: str) -> Optional[str]:
+        """_get() that counts hits / misses and treats a cache failure as a miss"""
+        try:
+            tier = self._get(user_id)
+        except Exception as e:
+            logger.warning(f"Tier cache lookup failed: {str(e)}")
+            tier = None
+        if tier is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return tier
+
+    def _save(self, user_id: str, tier: str, generation: int):
+        try:
+            self._put(user_id, tier, generation)
+        except Exception as e:
+            logger.warning(f"Tier cache write failed: {str(e)}")
+
+    def resolve(self, user_id: str) -> str:
+        """Tier for the synchronous routes"""
+        user_id = str(user_id)
+        tier = self._lookup(user_id)
+        if tier is None:
+            generation = self._generation_of(user_id)
+            response = (
+                supabase.table("subscriptions")
+                .select("tier, status, end_date")
+                .eq("user_id", user_id)
+                .eq("status", "active")
+                .order("created_at", desc=True)
+                .limit(1)
+                .execute()
+            )
+            tier = tier_from_subscription(response.data[0] if response.data else None)
+            self._save(user_id, tier, generation)
+        return tier
+
+    async def aresolve(self, user_id: str) -> str:
+        """Tier for the async routes, queried through the async repository on a miss"""
+        user_id = str(user_id)
+        tier = self._lookup(user_id)
+        if tier is None:
+            generation = self._generation_of(user_id)
+            tier = tier_from_subscription(await repository.get_active_subscription(user_id))
+            self._save(user_id, tier, generation)
+        return tier
+
+    def invalidate(self, user_id):
+        """Forget a user's tier; called after their subscription row is written"""
+        if not user_id:
+            return
+        user_id = str(user_id)
+        try:
+            if self.backend == "memory":
+                with self._lock:
+                    self._generation += 1
+                    self._entries.pop(user_id, None)
+            elif self.backend == "sqlite":
+                self._ensure_initialized()
+                with self._connect() as conn:
+                    conn.execute(
+                        """INSERT INTO tier_generations (user_id, generation) VALUES (?, 1)
+                           ON CONFLICT(user_id) DO UPDATE SET generation = generation + 1""",
+                        (user_id,),
+                    )
+                    conn.execute("DELETE FROM tiers WHERE user_id = ?", (user_id,))
+        except Exception as e:
+            logger.error(f"Failed to invalidate cached tier for user {user_id}: {str(e)}")
+
+
+tier_service = TierService()
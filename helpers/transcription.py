@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import ffmpeg
+
+from app.helpers import metrics, usage, vad
+
+logger = logging.getLogger(__name__)
+
+# Whisper API rejects uploads over 25MB
+WHISPER_MAX_BYTES = 24 * 1024 * 1024
+WHISPER_MODEL = "whisper-1"
+TRANSCRIPTION_CHUNK_SECONDS = int(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "600"))
+# Process-wide cap on concurrent Whisper uploads, shared by every service
+WHISPER_MAX_CONCURRENCY = int(os.getenv("WHISPER_MAX_CONCURRENCY", "4"))
+# How far before a nominal chunk boundary to look for a pause to cut on
+SILENCE_SEARCH_SECONDS = 30
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SECONDS = 0.3
+
+WHISPER_SEMAPHORE = threading.BoundedSemaphore(WHISPER_MAX_CONCURRENCY)
+
+_SILENCE_START = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+
+def probe_duration(audio_path: str) -> float:
+    """Duration of a media file in seconds, from the container"""
+    info = ffmpeg.probe(audio_path)
+    return float(info.get("format", {}).get("duration", 0) or 0)
+
+
+def detect_silences(audio_path: str) -> List[Tuple[float, float]]:
+    """(start, end) of every pause, from one streaming ffmpeg silencedetect pass"""
+    _, stderr = (
+        ffmpeg
+        .input(audio_path)
+        .filter("silencedetect", noise=f"{SILENCE_NOISE_DB}dB", d=SILENCE_MIN_SECONDS)
+        .output("-", format="null")
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    log = stderr.decode("utf-8", errors="ignore")
+    starts = [float(m) for m in _SILENCE_START.findall(log)]
+    ends = [float(m) for m in _SILENCE_END.findall(log)]
+    return list(zip(starts, ends))
+
+
+def plan_chunks(duration: float, silences: List[Tuple[float, float]],
+                chunk_seconds: int = TRANSCRIPTION_CHUNK_SECONDS) -> List[Tuple[float, float]]:
+    """
+    Split [0, duration] into chunks of at most chunk_seconds, moving each boundary
+    back to the middle of the latest pause within SILENCE_SEARCH_SECONDS so no word is cut.
+    """
+    chunks = []
+    start = 0.0
+    while duration - start > chunk_seconds:
+        nominal = start + chunk_seconds
+        cut = nominal
+        for silence_start, silence_end in silences:
+            middle = (silence_start + silence_end) / 2
+            if nominal - SILENCE_SEARCH_SECONDS <= middle <= nominal and middle > start:
+                cut = middle
+        chunks.append((start, cut))
+        start = cut
+    chunks.append((start, duration))
+    return chunks
+
+
+def _export_chunk(audio_path: str, start: float, end: float, chunk_path: str) -> str:
+    (
+        ffmpeg
+        .input(audio_path, ss=start, t=end - start)
+        .output(chunk_path, ac=1, ar=16000, audio_bitrate="64k", format="mp3")
+        .run(overwrite_output=True, quiet=True)
+    )
+    return chunk_path
+
+
+def _transcribe_once(client, path: str, audio_seconds: float, offset: float = 0.0) -> dict:
+    """One Whisper request, accounted once it succeeds; segment timestamps are shifted by offset"""
+    with WHISPER_SEMAPHORE:
+        started = time.perf_counter()
+        with open(path, "rb") as f:
+            response = client.audio.transcriptions.create(
+                model=WHISPER_MODEL,
+                file=f,
+                response_format="verbose_json"
+            )
+        latency = time.perf_counter() - started
+    # Billed per minute of audio sent
+    usage.record_call("transcription.whisper", WHISPER_MODEL, audio_seconds=audio_seconds, latency_seconds=latency)
+
+    segments = []
+    for segment in getattr(response, "segments", None) or []:
+        get = segment.get if isinstance(segment, dict) else lambda key: getattr(segment, key, None)
+        segments.append({
+            "start": round(float(get("start") or 0) + offset, 2),
+            "end": round(float(get("end") or 0) + offset, 2),
+            "text": (get("text") or "").strip()
+        })
+    return {"text": (response.text or "").strip(), "segments": segments}
+
+
+def transcribe(client, audio_path: str, work_dir: Optional[str] = None) -> dict:
+    """
+    Transcribe a file of any length with Whisper.
+    Long non-speech spans are cut out first (see vad.trim_for_whisper) and the rest is
+    re-encoded compactly; segment timestamps are mapped back to the original audio.
+    When the detector finds little or no speech the full audio is sent, never nothing.
+    Returns {"text": str, "segments": [{"start", "end", "text"}]}
+    """
+    with tempfile.TemporaryDirectory(dir=work_dir) as vad_dir:
+        try:
+            trimmed = vad.trim_for_whisper(audio_path, vad_dir)
+        except Exception as e:
+            logger.warning(f"Voice activity trimming failed, sending the full audio: {str(e)}")
+            return _transcribe_file(client, audio_path, work_dir)
+
+        if trimmed is None:
+            return _transcribe_file(client, audio_path, work_dir)
+
+        trimmed_path, time_map = trimmed
+        result = _transcribe_file(client, trimmed_path, vad_dir)
+
+    for segment in result["segments"]:
+        segment["start"] = round(time_map.to_original(segment["start"]), 2)
+        segment["end"] = round(time_map.to_original(segment["end"]), 2)
+    return result
+
+
+def _transcribe_file(client, audio_path: str, work_dir: Optional[str] = None) -> dict:
+    """
+    Short files go up in a single request. Long or oversized files are cut on pauses
+    into chunks that are uploaded concurrently (bounded by WHISPER_SEMAPHORE), then
+    stitched back in order with offset-corrected segment timestamps. If any chunk fails
+    the whole transcription fails, so a transcript with a hole is never returned (and stored).
+    """
+    size = os.path.getsize(audio_path)
+    duration = probe_duration(audio_path)
+    if size <= WHISPER_MAX_BYTES and duration <= TRANSCRIPTION_CHUNK_SECONDS:
+        return _transcribe_once(client, audio_path, duration)
+    if duration <= 0:
+        raise ValueError(f"Cannot chunk {audio_path} ({size} bytes): its duration is unknown")
+
+    try:
+        silences = detect_silences(audio_path)
+    except Exception as e:
+        logger.warning(f"Silence detection failed, cutting on fixed boundaries: {str(e)}")
+        silences = []
+    chunks = plan_chunks(duration, silences)
+    logger.info(f"Transcribing {duration:.0f}s of audio in {len(chunks)} chunks")
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as chunk_dir:
+        def run_chunk(idx: int, start: float, end: float) -> dict:
+            chunk_path = _export_chunk(audio_path, start, end, os.path.join(chunk_dir, f"chunk_{idx:03d}.mp3"))
+            return _transcribe_once(client, chunk_path, end - start, offset=start)
+
+        # Bound so each chunk is accounted against the caller's usage ledger and trace
+        with ThreadPoolExecutor(max_workers=min(len(chunks), WHISPER_MAX_CONCURRENCY)) as pool:
+            futures = [pool.submit(metrics.bind(run_chunk), idx, start, end) for idx, (start, end) in enumerate(chunks)]
+
+    texts, segments = [], []
+    for idx, future in enumerate(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Failed to transcribe chunk {idx + 1}/{len(chunks)}: {str(e)}")
+            raise
+        texts.append(result["text"])
+        segments.extend(result["segments"])
+
+    return {"text": " ".join(t for t in texts if t), "segments": segments}
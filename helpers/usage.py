@@ -0,0 +1,188 @@
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from app.helpers.db import supabase
+
+logger = logging.getLogger(__name__)
+
+USAGE_TABLE = "llm_usage"
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+USAGE_FLUSH_ROWS = 50
+# Rows kept while the database is unreachable; older ones are dropped first
+USAGE_MAX_BUFFERED_ROWS = 5000
+
+# USD list prices: per 1M prompt / completion tokens, per minute of transcribed audio
+MODEL_PRICES = {
+    "gpt-4o": {"prompt": 2.50, "completion": 10.00},
+    "gpt-4": {"prompt": 30.00, "completion": 60.00},
+    "whisper-1": {"audio_minute": 0.006},
+}
+
+# Who / what the OpenAI calls made in the current context (job or request) are billed to
+_ledger: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("usage_ledger", default=None)
+
+
+def start(endpoint: str, user_id=None, tier: Optional[str] = None, asset_mix: Optional[str] = None) -> dict:
+    """
+    Attribute the OpenAI calls made from here on in the current context.
+    The returned ledger collects every call, for summarize() / header().
+    """
+    ledger = {
+        "endpoint": endpoint,
+        "user_id": str(user_id) if user_id is not None else None,
+        "tier": tier,
+        "asset_mix": asset_mix,
+        "calls": [],
+    }
+    _ledger.set(ledger)
+    return ledger
+
+
+def attribute(**fields):
+    """Fill in attribution (user_id, tier, asset_mix) once it is known"""
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger.update({k: v for k, v in fields.items() if k in ("user_id", "tier", "asset_mix")})
+
+
+def asset_mix(asset_types) -> str:
+    """Compact, order-independent description of the assets in a request, e.g. 'image:2,video:1'"""
+    counts = Counter((t or "unknown").lower() for t in asset_types)
+    return ",".join(f"{t}:{n}" for t, n in sorted(counts.items()))
+
+
+def count_images(messages: list) -> dict:
+    """Number of image parts in a chat request, by detail level"""
+    counts = {"high": 0, "low": 0}
+    for message in messages or []:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                detail = (part.get("image_url") or {}).get("detail") or "auto"
+                counts["low" if detail == "low" else "high"] += 1
+    return counts
+
+
+def cost_usd(model: str, prompt_tokens: int = 0, completion_tokens: int = 0, audio_seconds: float = 0) -> float:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        # Dated snapshots (gpt-4o-2024-08-06) are billed like their family
+        prices = next((p for name, p in sorted(MODEL_PRICES.items(), key=lambda i: -len(i[0]))
+                       if model and model.startswith(name)), {})
+    return round(
+        prompt_tokens / 1e6 * prices.get("prompt", 0)
+        + completion_tokens / 1e6 * prices.get("completion", 0)
+        + audio_seconds / 60 * prices.get("audio_minute", 0),
+        6,
+    )
+
+
+class UsageRecorder:
+    """
+    Buffers one compact row per OpenAI call and writes them to the llm_usage
+    table in batches from a background thread, so accounting never adds a
+    database round trip to the request path.
+    """
+
+    def __init__(self):
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="usage-recorder", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(USAGE_FLUSH_SECONDS)
+            self._wakeup.clear()
+            self.flush()
+
+    def add(self, row: dict):
+        self._ensure_started()
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) > USAGE_MAX_BUFFERED_ROWS:
+                del self._rows[:len(self._rows) - USAGE_MAX_BUFFERED_ROWS]
+            if len(self._rows) >= USAGE_FLUSH_ROWS:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return
+        try:
+            supabase.table(USAGE_TABLE).insert(rows).execute()
+        except Exception as e:
+            logger.warning(f"Failed to store {len(rows)} usage rows, will retry: {str(e)}")
+            with self._lock:
+                self._rows[:0] = rows
+
+
+recorder = UsageRecorder()
+
+
+def record_call(call_site: str, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                audio_seconds: float = 0.0, images: Optional[dict] = None, latency_seconds: float = 0.0,
+                cached: bool = False):
+    """Account one chat / vision / Whisper call against the current ledger"""
+    ledger = _ledger.get() or {}
+    images = images or {}
+    row = {
+        "user_id": ledger.get("user_id"),
+        "tier": ledger.get("tier"),
+        "endpoint": ledger.get("endpoint") or "unattributed",
+        "asset_mix": ledger.get("asset_mix"),
+        "call_site": call_site,
+        "model": model,
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "audio_seconds": round(float(audio_seconds or 0), 2),
+        "images_high": images.get("high", 0),
+        "images_low": images.get("low", 0),
+        "cost_usd": 0.0 if cached else cost_usd(model, prompt_tokens or 0, completion_tokens or 0, audio_seconds or 0),
+        "cached": cached,
+        "latency_ms": int(latency_seconds * 1000),
+    }
+    if "calls" in ledger:
+        ledger["calls"].append(row)
+    try:
+        recorder.add(row)
+    except Exception as e:
+        logger.warning(f"Failed to buffer usage for {call_site}: {str(e)}")
+
+
+def summarize(ledger: Optional[dict]) -> dict:
+    """Totals of the calls collected by a ledger"""
+    calls = (ledger or {}).get("calls", [])
+    return {
+        "calls": len(calls),
+        "cached_calls": sum(1 for c in calls if c["cached"]),
+        "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+        "completion_tokens": sum(c["completion_tokens"] for c in calls),
+        "audio_seconds": round(sum(c["audio_seconds"] for c in calls), 2),
+        "images": sum(c["images_high"] + c["images_low"] for c in calls),
+        "cost_usd": round(sum(c["cost_usd"] for c in calls), 6),
+    }
+
+
+def header(summary: dict) -> str:
+    """X-LLM-Usage header value, for debugging a single response"""
+    return "; ".join(f"{k}={v}" for k, v in summary.items())
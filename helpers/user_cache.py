@@ -0,0 +1,112 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class _Flight:
+    """One in-progress lookup that concurrent callers for the same key wait on"""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class UserCache:
+    """
+    Bounded LRU + TTL cache of authenticated user rows, keyed by (user id, token nonce),
+    so get_current_user does not re-read the users table on every request. Concurrent
+    misses for the same key share a single lookup. Entries are dropped per token
+    (logout) or per user (profile or password changes); a lookup that raced an
+    invalidation is returned to its callers but not cached.
+    Thread-safe: get_current_user is a sync dependency and runs in the threadpool.
+    """
+
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, load: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """The cached row for key, or load() once for all concurrent callers. None results are not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0])
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return dict(flight.value) if flight.value is not None else None
+
+        try:
+            flight.value = load()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and flight.value is not None and generation == self._generation:
+                    self._store(key, flight.value)
+            flight.done.set()
+        return dict(flight.value) if flight.value is not None else None
+
+    def _store(self, key: Hashable, user: dict):
+        """Caller holds the lock"""
+        self._entries[key] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._forget_key(evicted)
+
+    def _forget_key(self, key: Hashable):
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+    def invalidate(self, key: Hashable):
+        """Drop one token's entry (logout)"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(key, None) is not None:
+                self._forget_key(key)
+
+    def invalidate_user(self, user_id):
+        """Drop every entry of a user, e.g. after their row was updated"""
+        with self._lock:
+            self._generation += 1
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+        logger.debug(f"Invalidated cached user {user_id}")
+
+
+user_cache = UserCache()
@@ -0,0 +1,158 @@
+import bisect
+import logging
+import os
+import subprocess
+from typing import List, Optional, Tuple
+
+import ffmpeg
+import numpy as np
+
+from app.helpers import acoustics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = acoustics.SAMPLE_RATE
+FRAME_SECONDS = 0.03
+# A frame is speech-like when it is this far above the noise floor (its 10th energy percentile)
+# or above an absolute speech level (steady, compressed voice-overs have no quiet frames to
+# measure the floor against), but never below SPEECH_MIN_DB...
+SPEECH_MARGIN_DB = 12.0
+SPEECH_ABSOLUTE_DB = -35.0
+SPEECH_MIN_DB = -50.0
+# ...and its zero-crossing rate is in the range of voiced / unvoiced speech (hiss and silence fall outside)
+SPEECH_MIN_ZCR = 0.01
+SPEECH_MAX_ZCR = 0.35
+# Speech spans are padded so word onsets and tails survive, and only gaps longer than this are cut
+SPEECH_PAD_SECONDS = 0.25
+MIN_GAP_SECONDS = 1.0
+# When less than this share of the audio is kept, the VAD is assumed wrong and the full audio is sent
+VAD_MIN_KEPT_FRACTION = float(os.getenv("VAD_MIN_KEPT_FRACTION", "0.1"))
+# Whisper-ready encoding of the trimmed audio
+VAD_CODEC = os.getenv("VAD_CODEC", "opus").lower()  # opus or mp3
+VAD_BITRATE = os.getenv("VAD_BITRATE", "24k")
+
+
+class TimeMap:
+    """
+    Maps times in the trimmed audio back to the original. Each kept span is
+    (trimmed start, original start, length); times past the end stay in the last span.
+    """
+
+    def __init__(self, spans: List[Tuple[float, float]]):
+        self.spans = []
+        position = 0.0
+        for start, end in spans:
+            self.spans.append((position, start, end - start))
+            position += end - start
+        self._starts = [trimmed for trimmed, _, _ in self.spans]
+        self.kept_seconds = position
+
+    def to_original(self, t: float) -> float:
+        if not self.spans:
+            return t
+        i = max(0, bisect.bisect_right(self._starts, t) - 1)
+        trimmed, original, length = self.spans[i]
+        return original + min(max(t - trimmed, 0.0), length)
+
+
+def frame_features(audio_path: str) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Per-frame energy (dBFS) and zero-crossing rate, streamed block by block; plus the sample count"""
+    frame_length = int(FRAME_SECONDS * SAMPLE_RATE)
+    energy, zcr = [], []
+    pending = np.zeros(0, dtype=np.float32)
+    total_samples = 0
+    for block in acoustics.stream_mono(audio_path):
+        total_samples += len(block)
+        buffer = np.concatenate([pending, block]) if len(pending) else block
+        n_frames = len(buffer) // frame_length
+        frames = buffer[:n_frames * frame_length].reshape(n_frames, frame_length)
+        energy.append(10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10))
+        signs = np.signbit(frames)
+        zcr.append(np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_length)
+        pending = buffer[n_frames * frame_length:].copy()
+    if not energy:
+        return np.zeros(0), np.zeros(0), total_samples
+    return np.concatenate(energy), np.concatenate(zcr), total_samples
+
+
+def speech_spans(energy_db: np.ndarray, zcr: np.ndarray) -> List[Tuple[float, float]]:
+    """(start, end) seconds of the audio worth sending to Whisper"""
+    if len(energy_db) == 0:
+        return []
+    threshold = max(min(np.percentile(energy_db, 10) + SPEECH_MARGIN_DB, SPEECH_ABSOLUTE_DB), SPEECH_MIN_DB)
+    speech = (energy_db > threshold) & (zcr >= SPEECH_MIN_ZCR) & (zcr <= SPEECH_MAX_ZCR)
+
+    # Pad every speech frame, then close gaps too short to be worth cutting
+    pad = int(round(SPEECH_PAD_SECONDS / FRAME_SECONDS))
+    if pad:
+        speech = np.convolve(speech.astype(np.int8), np.ones(2 * pad + 1, dtype=np.int8), mode="same") > 0
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    starts, ends = edges[::2], edges[1::2]
+    if len(starts) == 0:
+        return []
+    min_gap = int(round(MIN_GAP_SECONDS / FRAME_SECONDS))
+    keep = np.concatenate([[True], starts[1:] - ends[:-1] >= min_gap])
+    merged_starts = starts[keep]
+    merged_ends = np.concatenate([ends[np.flatnonzero(keep)[1:] - 1], [ends[-1]]])
+    return [(float(s * FRAME_SECONDS), float(e * FRAME_SECONDS)) for s, e in zip(merged_starts, merged_ends)]
+
+
+def _encode_spans(audio_path: str, spans: List[Tuple[float, float]], output_path: str):
+    """Re-decode the audio and pipe only the kept spans into a compact mono encoder"""
+    codec = {"codec:a": "libopus", "application": "voip"} if VAD_CODEC == "opus" else {"codec:a": "libmp3lame"}
+    args = (
+        ffmpeg
+        .input("pipe:", format="f32le", ac=1, ar=SAMPLE_RATE)
+        .output(output_path, ac=1, audio_bitrate=VAD_BITRATE, **codec)
+        .overwrite_output()
+        .compile()
+    )
+    encoder = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    bounds = [(int(s * SAMPLE_RATE), int(e * SAMPLE_RATE)) for s, e in spans]
+    try:
+        position, span = 0, 0
+        for block in acoustics.stream_mono(audio_path):
+            block_end = position + len(block)
+            while span < len(bounds) and bounds[span][0] < block_end:
+                start, end = bounds[span]
+                encoder.stdin.write(block[max(start - position, 0):min(end, block_end) - position].tobytes())
+                if end > block_end:
+                    break
+                span += 1
+            position = block_end
+        encoder.stdin.close()
+    except BaseException:
+        encoder.kill()
+        raise
+    if encoder.wait() != 0:
+        raise RuntimeError(f"ffmpeg could not encode trimmed audio (exit code {encoder.returncode})")
+
+
+def trim_for_whisper(audio_path: str, work_dir: str) -> Optional[Tuple[str, TimeMap]]:
+    """
+    Drop long non-speech spans (music beds, silences) with an energy + ZCR voice-activity
+    detector and re-encode what is left as low-bitrate mono Opus (or MP3). Returns the
+    trimmed file and the map back to original timestamps, or None when the full audio
+    should be sent instead: the detector fails open when it keeps nothing or less than
+    VAD_MIN_KEPT_FRACTION, since dropping a script costs far more than transcribing a music bed.
+    """
+    energy_db, zcr, total_samples = frame_features(audio_path)
+    duration = total_samples / SAMPLE_RATE
+    spans = speech_spans(energy_db, zcr)
+    if spans:
+        spans[-1] = (spans[-1][0], min(spans[-1][1], duration))
+    kept = sum(end - start for start, end in spans)
+    if duration <= 0 or kept < VAD_MIN_KEPT_FRACTION * duration:
+        logger.info(f"VAD kept {kept:.1f}s of {duration:.1f}s, sending the full audio")
+        return None
+
+    extension = "ogg" if VAD_CODEC == "opus" else "mp3"
+    output_path = os.path.join(work_dir, f"speech.{extension}")
+    _encode_spans(audio_path, spans, output_path)
+
+    time_map = TimeMap(spans)
+    logger.info(
+        f"VAD kept {time_map.kept_seconds:.1f}s of {duration:.1f}s in {len(spans)} spans "
+        f"({os.path.getsize(audio_path) / 1024:.0f}KB -> {os.path.getsize(output_path) / 1024:.0f}KB)"
+    )
+    return output_path, time_map
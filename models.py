@@ -266,3 +266,36 @@ class AssetMetadata(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     asset = relationship("CreativeAsset", back_populates="asset_metadata")
+
+
+class LLMUsage(Base):
+    """One OpenAI call (chat, vision or Whisper), as accounted by app.helpers.usage"""
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    user_id = Column(String, index=True)
+    tier = Column(String)
+    endpoint = Column(String, nullable=False)
+    asset_mix = Column(String)
+    call_site = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    audio_seconds = Column(Float, nullable=False, default=0)
+    images_high = Column(Integer, nullable=False, default=0)
+    images_low = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
+    cached = Column(Boolean, nullable=False, default=False)
+    latency_ms = Column(Integer)
+
+
+class RevokedToken(Base):
+    """A logged-out token's nonce, as stored by app.helpers.revocation with REVOCATION_BACKEND=supabase"""
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    nonce = Column(String, nullable=False, unique=True)
+    user_id = Column(String, index=True)
+    expires_at = Column(DateTime(timezone=True), index=True)  # the token's exp; NULL for tokens that never expire
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
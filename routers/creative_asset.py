@@ -3,6 +3,7 @@ from datetime import datetime
 from typing import List
 from app.helpers.security import get_current_user
 from app.helpers.db import supabase
+from app.helpers.tier import tier_service
 import boto3
 import uuid
 import os
@@ -62,17 +63,7 @@ def create_creative_asset(
         )
 
     # 2. Check subscription tier
-    subscription_resp = (
-        supabase.table("subscriptions")
-        .select("tier, status")
-        .eq("user_id", current_user["id"])
-        .eq("status", "active")
-        .order("created_at", desc=True)
-        .limit(1)
-        .execute()
-    )
-    
-    user_tier = subscription_resp.data[0]["tier"].lower() if subscription_resp.data else "free"
+    user_tier = tier_service.resolve(current_user["id"])
     
     if user_tier == "free" and file_url:
         raise HTTPException(
@@ -315,17 +306,7 @@ def update_creative_assets(
         )
 
     # Check subscription tier for video uploads
-    subscription_resp = (
-        supabase.table("subscriptions")
-        .select("tier, status")
-        .eq("user_id", current_user["id"])
-        .eq("status", "active")
-        .order("created_at", desc=True)
-        .limit(1)
-        .execute()
-    )
-    
-    user_tier = subscription_resp.data[0]["tier"].lower() if subscription_resp.data else "free"
+    user_tier = tier_service.resolve(current_user["id"])
     
     if user_tier == "free" and file_url:
         raise HTTPException(
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from fastapi.responses import StreamingResponse
+from app.helpers import metrics, usage
+from app.helpers.security import get_current_user
+from app.service.job_queue import job_queue, JOB_SUCCEEDED, JOB_FAILED
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+EVENT_POLL_SECONDS = 0.25
+KEEPALIVE_SECONDS = 15
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse(event: str, data, event_id: Optional[int] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def job_event_stream(job_id: str, after_id: int = 0):
+    """
+    Server-Sent Events for a job: a `stage` event whenever the pipeline moves on,
+    the job's own events (e.g. pretest `section`s) as the worker publishes them,
+    and a final `result` or `error` event once the job has finished.
+    """
+    last_stage = None
+    last_sent = time.monotonic()
+    while True:
+        job = await job_queue.aget(job_id)
+        if job is None:
+            yield _sse("error", {"status_code": 404, "detail": "Job not found"})
+            return
+
+        if job["stage"] != last_stage:
+            last_stage = job["stage"]
+            yield _sse("stage", {"stage": last_stage, "status": job["status"]})
+            last_sent = time.monotonic()
+
+        for event in await job_queue.aevents_since(job_id, after_id):
+            after_id = event["id"]
+            yield _sse(event["event"], event["data"], event_id=event["id"])
+            last_sent = time.monotonic()
+
+        if job["status"] == JOB_SUCCEEDED:
+            yield _sse("result", job["result"])
+            return
+        if job["status"] == JOB_FAILED:
+            yield _sse("error", {"status_code": job["error_status"], "detail": job["error"]})
+            return
+
+        if time.monotonic() - last_sent > KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(EVENT_POLL_SECONDS)
+
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, response: Response, current_user: dict = Depends(get_current_user)):
+    """
+    Status of a queued pretest or simulation job.
+    Reports the current stage and the time each stage was reached;
+    includes the result once the job succeeded, or the error if it failed.
+    Finished jobs also report the time spent per pipeline stage and the OpenAI
+    usage, in the body and as Server-Timing / X-LLM-Usage headers.
+    """
+    job = await job_queue.aget(job_id)
+    if not job or job["user_id"] != str(current_user["id"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    body = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "stages": [
+            {"stage": s["stage"], "seconds_since_start": round(s["at"] - job["created_at"], 2)}
+            for s in job["stages"]
+        ],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+    if job["status"] == JOB_SUCCEEDED:
+        body["result"] = job["result"]
+    elif job["status"] == JOB_FAILED:
+        body["error"] = {"status_code": job["error_status"], "detail": job["error"]}
+
+    if job["timings"]:
+        body["timings"] = metrics.summarize(job["timings"])
+        response.headers["Server-Timing"] = metrics.server_timing(job["timings"])
+    if job["usage"]:
+        body["llm_usage"] = job["usage"]
+        response.headers["X-LLM-Usage"] = usage.header(job["usage"])
+
+    return body
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    last_event_id: Optional[int] = Header(None)
+):
+    """
+    Follow a job as Server-Sent Events. Reconnecting clients send Last-Event-ID
+    and only receive the events they have not seen yet.
+    """
+    job = await job_queue.aget(job_id)
+    if not job or job["user_id"] != str(current_user["id"]):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return StreamingResponse(
+        job_event_stream(job_id, after_id=last_event_id or 0),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -1,23 +1,24 @@
 import logging
-from fastapi import Depends, APIRouter, HTTPException
+from fastapi import Depends, APIRouter, HTTPException, Response
 from fastapi.security import HTTPBearer
 from pydantic import BaseModel
 from typing import List, Optional
 import os
 import json
 import base64
-import tempfile
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from openai import AsyncOpenAI
 from app.helpers.security import get_current_user
 from app.helpers.validators import validate_required_field
 from app.helpers.db import supabase
-import cv2
-import numpy as np
+from app.helpers.repository import repository
 import yt_dlp
-import aiohttp
-from asyncio import Semaphore
+from app.helpers.media_cache import media_cache
+from app.helpers import range_fetch
+from app.helpers.media_worker import media_worker
+from app.helpers.llm_gateway import llm_gateway
+from app.helpers import image_budget, usage
+from app.helpers.blob import Blob
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,11 +26,10 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 security = HTTPBearer()
 
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 executor = ThreadPoolExecutor(max_workers=8)  # Increased workers
 
-# Semaphore to limit concurrent API calls
-API_SEMAPHORE = Semaphore(5)
+# yt-dlp format profile for video assets (also part of the media cache key)
+VIDEO_FORMAT = 'worst[ext=mp4]/worst'
 
 class MarketingAdviceRequest(BaseModel):
     text: str
@@ -48,35 +48,20 @@ class MarketingAdviceResponse(BaseModel):
     timeline: List[TimelineItem]
     testing_period: str
     assets_analyzed: Optional[dict] = None
-_aiohttp_session = None
-
-async def get_aiohttp_session():
-    """Get or create aiohttp session"""
-    global _aiohttp_session
-    if _aiohttp_session is None or _aiohttp_session.closed:
-        timeout = aiohttp.ClientTimeout(total=30)
-        _aiohttp_session = aiohttp.ClientSession(timeout=timeout)
-    return _aiohttp_session
 
 async def verify_project_ownership(project_id: int, user_id: str) -> dict:
     """Verify that the project belongs to the user and return project data"""
     try:
-        project_response = (
-            supabase.table("projects")
-            .select("*")
-            .eq("id", project_id)
-            .eq("user_id", user_id)
-            .execute()
-        )
+        project = await repository.get_project(project_id, user_id)
         
-        if not project_response.data:
+        if not project:
             logger.warning(f"Unauthorized access attempt: User {user_id} tried to access project {project_id}")
             raise HTTPException(
                 status_code=404, 
                 detail="Project not found or you don't have permission to access it"
             )
         
-        return project_response.data[0]
+        return project
         
     except HTTPException:
         raise
@@ -84,40 +69,36 @@ async def verify_project_ownership(project_id: int, user_id: str) -> dict:
         logger.error(f"Error verifying project ownership: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to verify project ownership")
 
-async def download_and_encode_image(image_url: str) -> Optional[str]:
-    """Download and base64 encode image using aiohttp"""
+async def download_and_encode_image(image_url: str) -> Optional[dict]:
+    """Download (through the shared media cache) and prepare an image_url payload, resized for the model"""
     try:
-        session = await get_aiohttp_session()
-        async with session.get(image_url) as response:
-            response.raise_for_status()
-            content = await response.read()
-            return base64.b64encode(content).decode('utf-8')
+        loop = asyncio.get_event_loop()
+        image_path, content_type = await loop.run_in_executor(executor, media_cache.fetch_http, image_url)
+        image = Blob.from_file(image_path, content_type or "image/jpeg")
+        return await loop.run_in_executor(executor, image_budget.prepare_image, image)
     except Exception as e:
         logger.error(f"Error downloading image: {str(e)}")
         return None
 
 async def transcribe_audio(audio_url: str) -> str:
-    """Download and transcribe audio file"""
+    """Download (through the shared media cache) and transcribe audio file"""
     try:
-        session = await get_aiohttp_session()
-        async with session.get(audio_url) as response:
-            response.raise_for_status()
-            content = await response.read()
-        
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-        
-        try:
-            with open(tmp_path, "rb") as f:
-                async with API_SEMAPHORE:
-                    transcript = await client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=f
-                    )
-            return transcript.text
-        finally:
-            os.unlink(tmp_path)
+        loop = asyncio.get_event_loop()
+        audio_path, _ = await loop.run_in_executor(
+            executor,
+            lambda: media_cache.fetch_http(audio_url, default_ext="mp3")
+        )
+        
+        with open(audio_path, "rb") as f:
+            audio_bytes = f.read()
+        # Bytes rather than the open file, so a retried request re-sends the whole upload
+        transcript = await llm_gateway.transcribe(
+            "live_testing.transcribe_audio",
+            model="whisper-1",
+            file=(os.path.basename(audio_path), audio_bytes),
+            response_format="verbose_json"
+        )
+        return transcript.text
     except Exception as e:
         logger.error(f"Error transcribing audio: {str(e)}")
         return ""
@@ -154,17 +135,18 @@ Provide a detailed analysis in the following JSON format:
     "recommendations": ["Specific recommendations to improve this audio ad"]
 }}"""
 
-        async with API_SEMAPHORE:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert audio marketing analyst. Provide detailed, actionable insights."},
-                    {"role": "user", "content": analysis_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3,
-                timeout=30
-            )
+        response = await llm_gateway.chat(
+            "live_testing.analyze_audio",
+            cache=True,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are an expert audio marketing analyst. Provide detailed, actionable insights."},
+                {"role": "user", "content": analysis_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            timeout=30
+        )
         
         return json.loads(response.choices[0].message.content)
     except Exception as e:
@@ -176,44 +158,13 @@ Provide a detailed analysis in the following JSON format:
             "recommendations": []
         }
 
-def extract_frames_fast(video_path: str, temp_dir: str, max_frames: int = 3) -> List[str]:
-    """Extract frames using OpenCV - optimized for speed"""
+def extract_frames_fast(video_path: str, max_frames: int = 3) -> List[str]:
+    """Decode frames in a single pass and return them base64 encoded - optimized for speed"""
     try:
-        frames_dir = os.path.join(temp_dir, "frames")
-        os.makedirs(frames_dir, exist_ok=True)
-        
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            return []
-        
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames <= 0:
-            cap.release()
-            return []
-        
-        # Extract 3 frames evenly distributed
-        frame_indices = np.linspace(0, total_frames - 1, max_frames, dtype=int)
-        
-        frames = []
-        for i, frame_idx in enumerate(frame_indices):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-            
-            if ret:
-                # Resize for faster processing
-                height, width = frame.shape[:2]
-                if width > 1280:
-                    scale = 1280 / width
-                    frame = cv2.resize(frame, None, fx=scale, fy=scale)
-                
-                frame_filename = os.path.join(frames_dir, f"frame_{i:03d}.jpg")
-                cv2.imwrite(frame_filename, frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                
-                if os.path.exists(frame_filename):
-                    frames.append(frame_filename)
-        
-        cap.release()
-        return frames
+        frames_base64, _ = media_worker.extract_frames(
+            video_path, max_frames=max_frames, max_width=1280, jpeg_quality=70
+        )
+        return frames_base64
         
     except Exception as e:
         logger.error(f"Error extracting frames: {str(e)}")
@@ -222,40 +173,34 @@ def extract_frames_fast(video_path: str, temp_dir: str, max_frames: int = 3) ->
 async def process_video_fast(video_url: str) -> tuple:
     """Process video: extract single frame only, skip transcription for speed"""
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            loop = asyncio.get_event_loop()
-            
-            # Download video
+        loop = asyncio.get_event_loop()
+        
+        # Stream the video with Range requests when possible, otherwise download it
+        # (shared media cache, same profile as SimulationService)
+        source = None
+        if not media_cache.lookup(video_url, VIDEO_FORMAT):
+            source = await loop.run_in_executor(executor, range_fetch.resolve, video_url, VIDEO_FORMAT)
+        
+        if source:
+            video_path = source["video_url"]
+        else:
             video_path = await loop.run_in_executor(
                 executor,
-                download_video_fast,
-                video_url,
-                temp_dir
+                lambda: media_cache.get_or_fetch(video_url, download_video_fast, variant=VIDEO_FORMAT)
             )
-            
-            if not video_path:
-                return "", []
-            
-            # Extract only middle frame for speed
-            frame_paths = await loop.run_in_executor(
-                executor,
-                extract_frames_fast,
-                video_path,
-                temp_dir,
-                1  # Single frame only
-            )
-            
-            # Encode frame to base64
-            frames_base64 = []
-            for frame_path in frame_paths:
-                try:
-                    with open(frame_path, 'rb') as f:
-                        frame_data = base64.b64encode(f.read()).decode('utf-8')
-                        frames_base64.append(frame_data)
-                except Exception as e:
-                    logger.error(f"Error encoding frame: {str(e)}")
-            
-            return "", frames_base64  # Skip transcript for speed
+        
+        if not video_path:
+            return "", []
+        
+        # Extract only the most representative frame for speed
+        frames_base64 = await loop.run_in_executor(
+            executor,
+            extract_frames_fast,
+            video_path,
+            1  # Single frame only
+        )
+        
+        return "", frames_base64  # Skip transcript for speed
             
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
@@ -266,7 +211,7 @@ def download_video_fast(url: str, output_dir: str) -> Optional[str]:
     try:
         output_template = os.path.join(output_dir, "video.%(ext)s")
         ydl_opts = {
-            'format': 'worst[ext=mp4]/worst',  # Use worst quality for speed
+            'format': VIDEO_FORMAT,  # Use worst quality for speed
             'outtmpl': output_template,
             'quiet': True,
             'no_warnings': True,
@@ -300,6 +245,15 @@ async def analyze_video_deeply(video_url: str, asset_id: int) -> dict:
                 "error": "frame_extraction_failed"
             }
         
+        loop = asyncio.get_event_loop()
+        frame_part = await loop.run_in_executor(executor, image_budget.prepare_image, frames[0])
+        if not frame_part:
+            return {
+                "visual_analysis": "Unable to decode frames",
+                "recommendations": ["Manual review required"],
+                "error": "frame_extraction_failed"
+            }
+
         # Simplified analysis for speed
         analysis_prompt = """Analyze this video frame in detail:
 
@@ -317,28 +271,26 @@ Provide comprehensive analysis in JSON format:
     "recommendations": ["3-5 specific, actionable recommendations"]
 }"""
 
-        async with API_SEMAPHORE:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert video marketing analyst. Provide detailed, actionable insights about video content."},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": analysis_prompt},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{frames[0]}",
-                            "detail": "high"  # Use high detail for better analysis
-                        }}
-                    ]}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3,
-                timeout=30
-            )
+        response = await llm_gateway.chat(
+            "live_testing.analyze_video",
+            cache=True,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are an expert video marketing analyst. Provide detailed, actionable insights about video content."},
+                {"role": "user", "content": [
+                    {"type": "text", "text": analysis_prompt},
+                    {"type": "image_url", "image_url": frame_part}
+                ]}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            timeout=30
+        )
         
         analysis_result = json.loads(response.choices[0].message.content)
         
         # Store the frame for later use in the prompt
-        analysis_result['frame_base64'] = frames[0] if frames else None
+        analysis_result['frame_part'] = frame_part
         
         return analysis_result
         
@@ -350,7 +302,7 @@ Provide comprehensive analysis in JSON format:
             "error": str(e)
         }
 
-async def analyze_image_deeply(image_base64: str, asset_id: int) -> dict:
+async def analyze_image_deeply(image_part: dict, asset_id: int) -> dict:
     """Deep analysis of image content"""
     try:
         analysis_prompt = """Analyze this marketing image in detail:
@@ -369,23 +321,21 @@ Provide comprehensive analysis in JSON format:
     "recommendations": ["3-5 specific, actionable recommendations"]
 }"""
 
-        async with API_SEMAPHORE:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert visual marketing analyst. Provide detailed, actionable insights."},
-                    {"role": "user", "content": [
-                        {"type": "text", "text": analysis_prompt},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}",
-                            "detail": "high"
-                        }}
-                    ]}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.3,
-                timeout=30
-            )
+        response = await llm_gateway.chat(
+            "live_testing.analyze_image",
+            cache=True,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are an expert visual marketing analyst. Provide detailed, actionable insights."},
+                {"role": "user", "content": [
+                    {"type": "text", "text": analysis_prompt},
+                    {"type": "image_url", "image_url": image_part}
+                ]}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            timeout=30
+        )
         
         return json.loads(response.choices[0].message.content)
         
@@ -493,14 +443,14 @@ async def process_asset_content_deeply(asset: dict) -> Optional[dict]:
             if not file_url:
                 return None
             
-            image_base64 = await download_and_encode_image(file_url)
-            if image_base64:
-                deep_analysis = await analyze_image_deeply(image_base64, asset_id)
+            image_part = await download_and_encode_image(file_url)
+            if image_part:
+                deep_analysis = await analyze_image_deeply(image_part, asset_id)
                 
                 return {
                     "asset_type": "image",
                     "asset_id": asset_id,
-                    "content": image_base64,
+                    "image_part": image_part,
                     "url": file_url,
                     "deep_analysis": deep_analysis
                 }
@@ -533,7 +483,7 @@ async def process_asset_content_deeply(asset: dict) -> Optional[dict]:
                 "asset_id": asset_id,
                 "url": file_url,
                 "deep_analysis": deep_analysis,
-                "frame_content": deep_analysis.get('frame_base64')  # Include frame for prompt
+                "frame_part": deep_analysis.pop('frame_part', None)  # Include frame for prompt
             }
         
         return None
@@ -689,30 +639,24 @@ IMPORTANT:
     visual_messages = []
     if processed['video_assets']:
         for idx, video in enumerate(processed['video_assets'][:2], 1):
-            if video.get('frame_content'):
+            if video.get('frame_part'):
                 visual_messages.append({
                     "role": "user",
                     "content": [
                         {"type": "text", "text": f"Video {idx} - Representative Frame:"},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{video['frame_content']}",
-                            "detail": "high"
-                        }}
+                        {"type": "image_url", "image_url": video['frame_part']}
                     ]
                 })
     
     # Add images
     if processed['image_assets']:
         for idx, image in enumerate(processed['image_assets'][:2], 1):
-            if image.get('content'):
+            if image.get('image_part'):
                 visual_messages.append({
                     "role": "user",
                     "content": [
                         {"type": "text", "text": f"Image {idx}:"},
-                        {"type": "image_url", "image_url": {
-                            "url": f"data:image/jpeg;base64,{image['content']}",
-                            "detail": "high"
-                        }}
+                        {"type": "image_url", "image_url": image['image_part']}
                     ]
                 })
     
@@ -723,9 +667,11 @@ IMPORTANT:
 @router.post("/", response_model=MarketingAdviceResponse)
 async def get_marketing_advice(
     request: MarketingAdviceRequest,
+    response: Response,
     current_user = Depends(get_current_user)
 ):
     """Get AI marketing advice with comprehensive asset analysis"""
+    ledger = usage.start("live_testing", user_id=current_user["id"])
     try:
         validate_required_field(request.text, "User text")
         
@@ -746,15 +692,16 @@ async def get_marketing_advice(
         
         messages = build_marketing_prompt_with_assets(request.text, project_data)
         
-        async with API_SEMAPHORE:
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                max_tokens=4000,
-                response_format={"type": "json_object"}
-            )
+        completion = await llm_gateway.chat(
+            "live_testing.marketing_advice",
+            model="gpt-4o",
+            messages=messages,
+            max_tokens=4000,
+            response_format={"type": "json_object"}
+        )
         
-        ai_response = json.loads(response.choices[0].message.content)
+        ai_response = json.loads(completion.choices[0].message.content)
+        response.headers["X-LLM-Usage"] = usage.header(usage.summarize(ledger))
         
         processed = project_data["processed_content"]
         assets_analyzed = {
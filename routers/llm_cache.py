@@ -0,0 +1,38 @@
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.helpers.llm_cache import llm_cache
+from app.helpers.security import get_admin_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.delete("/entries/{key}")
+def invalidate_llm_cache_entry(key: str, current_user: dict = Depends(get_admin_user)):
+    """Drop one cached chat completion, e.g. after a bad response was stored"""
+    try:
+        llm_cache.invalidate(key)
+    except Exception as e:
+        logger.error(f"Failed to invalidate LLM cache entry {key}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to invalidate LLM cache entry")
+    logger.info(f"LLM cache entry {key} invalidated by {current_user['id']}")
+    return {"invalidated": key}
+
+
+@router.delete("/entries")
+def clear_llm_cache(
+    call_site: Optional[str] = Query(None, description="only drop responses of this call site"),
+    current_user: dict = Depends(get_admin_user),
+):
+    """Drop every cached chat completion, or those of one call site (after a prompt change)"""
+    try:
+        removed = llm_cache.clear(call_site)
+    except Exception as e:
+        logger.error(f"Failed to clear LLM cache: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to clear LLM cache")
+    logger.info(f"LLM cache cleared by {current_user['id']} (call site {call_site or 'all'}): {removed} entries")
+    return {"removed": removed, "call_site": call_site}
@@ -0,0 +1,14 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter()
+
+
+@router.get("")
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint for this API process.
+    Pipeline stages that run in job workers are exported by each worker
+    on JOB_WORKER_METRICS_PORT.
+    """
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 import logging
 from app.helpers.security import get_current_user
+from app.helpers import usage
 from app.service.persona_service import PersonaService
 from typing import Optional
 from datetime import datetime
@@ -16,8 +17,9 @@ persona_service = PersonaService()
 
 
 @router.post("/create")
-def create_persona(
+async def create_persona(
     request: CreateAudienceRequest,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -27,7 +29,9 @@ def create_persona(
     try:
         input_data = request.dict()
 
-        persona = persona_service.create_persona(current_user["id"], input_data)
+        ledger = usage.start("persona", user_id=current_user["id"])
+        persona = await persona_service.create_persona(current_user["id"], input_data)
+        response.headers["X-LLM-Usage"] = usage.header(usage.summarize(ledger))
 
         return {"persona": persona}
 
@@ -1,7 +1,8 @@
 import logging
 import csv
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Response, status
+from fastapi.responses import StreamingResponse
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -9,13 +10,20 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib import colors
 from app.helpers.security import get_current_user
 from app.helpers.db import supabase
+from app.helpers.repository import repository, query_budget
+from app.helpers.quota import quota, QuotaExceeded, PRETESTS
+from app.helpers.tier import tier_service
+from app.helpers import metrics, usage
 from app.schemas.pretest import PretestRequest
 from app.service.pretest_service import PretestService
+from app.service.job_queue import job_queue, areport_stage, areport_event, JOB_QUEUED
+from app.routers.jobs import job_event_stream, SSE_HEADERS
 from openai import OpenAI
 from dotenv import load_dotenv
 import os
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 import tempfile
+import time
 from typing import Dict, Any
 
 logger = logging.getLogger(__name__)
@@ -41,6 +49,14 @@ PRETEST_LIMITS = {
     "enterprise": None 
 }
 
+# Ownership errors reported by repository.get_creative_context
+CONTEXT_ERRORS = {
+    "persona_not_found": "Persona not found",
+    "persona_not_owned": "You do not own this persona",
+    "asset_not_found": "One or more creative assets not found",
+    "asset_not_owned": "Creative asset {id} does not belong to your project",
+}
+
 
 async def generate_csv_report_with_respondents(result: Dict[str, Any], persona: Dict[str, Any]) -> str:
     """
@@ -534,7 +550,7 @@ def upload_pdf_to_supabase(pdf_path: str, user_id: str, filename: str) -> str:
             detail=f"Failed to upload PDF: {str(e)}"
         )
 
-def check_pretest_usage_limit(user_id: str, tier: str) -> tuple[bool, int, int]:
+async def check_pretest_usage_limit(user_id: str, tier: str) -> tuple[bool, int, int]:
     """Check pretest usage limit"""
     limit = PRETEST_LIMITS.get(tier.lower())
     
@@ -542,18 +558,12 @@ def check_pretest_usage_limit(user_id: str, tier: str) -> tuple[bool, int, int]:
         return True, 0, -1
     
     try:
-        user_response = (
-            supabase.table("users")
-            .select("pretests_count")
-            .eq("id", user_id)
-            .execute()
-        )
+        current_count = await repository.get_user_counter(user_id, "pretests_count")
         
-        if not user_response.data:
+        if current_count is None:
             logger.error(f"User {user_id} not found")
             return True, 0, limit
         
-        current_count = user_response.data[0].get("pretests_count", 0)
         can_proceed = current_count < limit
         
         return can_proceed, current_count, limit
@@ -565,10 +575,13 @@ def check_pretest_usage_limit(user_id: str, tier: str) -> tuple[bool, int, int]:
 @router.post("/create")
 async def create_pretest(
     request: PretestRequest,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Create and run a pretest analysis for creative content.
+    Validate and queue a pretest analysis for creative content.
+    Returns a job id immediately; the analysis runs in a job worker and its
+    progress and result are served by GET /jobs/{job_id}.
     Supports multiple creative IDs including multiple images and audio files.
     
     Report generation by tier:
@@ -585,31 +598,46 @@ async def create_pretest(
     - Agency: 200 pretests
     - Enterprise: Unlimited
     """
+    trace = metrics.start_trace("pretest")
+    job_id = await _queue_pretest(request, current_user)
+    response.headers["Server-Timing"] = metrics.server_timing(trace["spans"])
+    return {
+        "job_id": job_id,
+        "status": JOB_QUEUED,
+        "message": "Pretest queued. Poll the job status endpoint for progress and the result."
+    }
+
+
+@router.post("/create/stream")
+async def create_pretest_stream(
+    request: PretestRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Same as /create, but answers with a Server-Sent Events stream of the job:
+    `stage` events as the pipeline progresses, a `section` event
+    ({"section", "data"}) for each top-level part of the analysis as soon as
+    the model has finished writing it, and a final `result` event carrying the
+    validated, stored pretest (or an `error` event).
+    """
+    trace = metrics.start_trace("pretest")
+    job_id = await _queue_pretest(request, current_user, stream=True)
+    return StreamingResponse(
+        job_event_stream(job_id),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Job-Id": job_id, "Server-Timing": metrics.server_timing(trace["spans"])}
+    )
+
+
+@query_budget(3)  # tier lookup, the creative context and the quota reservation
+async def _queue_pretest(request: PretestRequest, current_user: dict, stream: bool = False) -> str:
+    """Validate a pretest request (usage limit, ownership, assets) and queue it; returns the job id"""
+    started = time.perf_counter()
     try:
         user_id = current_user["id"]
         
-        subscription_resp = (
-            supabase.table("subscriptions")
-            .select("tier, status")
-            .eq("user_id", user_id)
-            .eq("status", "active")
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-        
-        user_tier = subscription_resp.data[0]["tier"].lower() if subscription_resp.data else "free"
-        
-        
-        can_proceed, current_count, limit = check_pretest_usage_limit(str(user_id), user_tier)
-        
-        if not can_proceed:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Pretest limit reached. You have used {current_count} of {limit} pretests available on the {user_tier.title()} plan. Please upgrade to continue."
-            )
-        
-        logger.info(f"User {user_id} on {user_tier} plan: {current_count}/{limit if limit else 'unlimited'} pretests used")
+        user_tier = await tier_service.aresolve(user_id)
+        metrics.set_tier(user_tier)
         
         persona_id = int(request.persona_id)
         creative_ids = request.creative_ids
@@ -620,62 +648,18 @@ async def create_pretest(
                 detail="creative_ids must be a non-empty list"
             )
 
-        persona_response = (
-            supabase.table("personas")
-            .select("*")
-            .eq("id", persona_id)
-            .execute()
-        )
-        
-        if not persona_response.data:
-            raise HTTPException(status_code=404, detail="Persona not found")
-        
-        persona = persona_response.data[0]
-
-        if persona["user_id"] != user_id:
-            raise HTTPException(status_code=403, detail="You do not own this persona")
-
-        creative_assets_response = (
-            supabase.table("creative_assets")
-            .select("*")
-            .in_("id", creative_ids)
-            .execute()
-        )
-        
-        creative_assets = creative_assets_response.data if creative_assets_response.data else []
-
-        if not creative_assets or len(creative_assets) != len(creative_ids):
+        # Persona, assets and projects in one round-trip; ownership is checked in the database
+        context = await repository.get_creative_context(user_id, [persona_id], creative_ids)
+        error = context["error"]
+        if error:
             raise HTTPException(
-                status_code=404, 
-                detail="One or more creative assets not found"
+                status_code=error["status"],
+                detail=CONTEXT_ERRORS[error["code"]].format(id=error["id"])
             )
 
-        project_ids = list(set([asset["project_id"] for asset in creative_assets]))
-        projects_response = (
-            supabase.table("projects")
-            .select("id, user_id")
-            .in_("id", project_ids)
-            .execute()
-        )
-        
-        projects_map = {p["id"]: p["user_id"] for p in projects_response.data}
-        
-        for asset in creative_assets:
-            project_user_id = projects_map.get(asset["project_id"])
-            if not project_user_id or project_user_id != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"Creative asset {asset['id']} does not belong to your project"
-                )
-        project_id = creative_assets[0]["project_id"]
-        project = (
-            supabase.table("projects")
-            .select("*")
-            .eq("id", project_id)
-            .single()
-            .execute()
-        )
-        project_data = project.data
+        persona = context["personas"][persona_id]
+        creative_assets = context["assets"]
+        project_data = context["projects"][creative_assets[0]["project_id"]]
         filtered_project = {
             "name": project_data.get("name"),
             "brand": project_data.get("brand"),
@@ -771,48 +755,25 @@ async def create_pretest(
 
         logger.info(f"Prepared request_data with {len(filtered_assets)} assets")
 
-        result = await pretest_service.create_pretest(
-            user_id=str(user_id),
-            request_data=request_data,
-            user_tier=user_tier
-        )
-        
-        report_urls = {}
-        
-        if user_tier in ["starter", "professional", "agency", "enterprise"]:
-            try:
-                pdf_filename = f"pretest_{result.get('pretest_id')}.pdf"
-                pdf_path = generate_pdf_report(result, str(user_id), user_tier)
-                pdf_url = upload_pdf_to_supabase(pdf_path, str(user_id), pdf_filename)
-                report_urls["pdf"] = pdf_url
-                logger.info(f"PDF report generated and uploaded for pretest {result.get('pretest_id')}")
-            except Exception as e:
-                logger.error(f"Failed to generate/upload PDF report: {str(e)}")
-        if user_tier in ["professional", "agency", "enterprise"]:
-            try:
-                csv_filename = f"pretest_{result.get('pretest_id')}.csv"
-                # Pass both pretest result and persona data to generate respondent-level CSV
-                csv_path = await generate_csv_report_with_respondents(result, filtered_persona)
-                csv_url = upload_csv_to_supabase(csv_path, str(user_id), csv_filename)
-                report_urls["csv"] = csv_url
-                logger.info(f"CSV report generated and uploaded for pretest {result.get('pretest_id')}")
-            except Exception as e:
-                logger.error(f"Failed to generate/upload CSV report: {str(e)}")
-        
-        result["report_urls"] = report_urls
-        
+        # Check the limit and count this pretest in one atomic step; the job worker
+        # gives the pretest back if the pipeline fails
+        limit = PRETEST_LIMITS.get(user_tier)
         try:
-            supabase.table("users").update({
-                "pretests_count": current_count + 1
-            }).eq("id", user_id).execute()
-            
-            logger.info(f"Updated pretest count for user {user_id}: {current_count + 1}")
-        except Exception as e:
-            logger.error(f"Failed to update pretest count: {str(e)}")
-        
-        logger.info(f"Pretest created successfully: {result.get('pretest_id')}")
-
-        return result
+            async with quota.areservation(user_id, PRETESTS, limit) as current_count:
+                logger.info(f"User {user_id} on {user_tier} plan: {current_count}/{limit if limit else 'unlimited'} pretests used")
+                metrics.record("db_fetch", time.perf_counter() - started)
+                with metrics.span("enqueue"):
+                    return await job_queue.aenqueue("pretest", user_id, {
+                        "user_id": user_id,
+                        "user_tier": user_tier,
+                        "request_data": request_data,
+                        "stream": stream
+                    })
+        except QuotaExceeded as e:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Pretest limit reached. You have used {e.count} of {e.limit} pretests available on the {user_tier.title()} plan. Please upgrade to continue."
+            )
 
     except HTTPException:
         raise
@@ -823,6 +784,76 @@ async def create_pretest(
             detail="Failed to create pretest"
         )
 
+async def run_pretest_job(payload: dict) -> dict:
+    """
+    Run a validated pretest: analysis and reports. Its quota was reserved when it was
+    queued, and is given back here if the pipeline fails.
+    Executed by the job worker (app.service.job_worker), not in the API process.
+    """
+    try:
+        return await _run_pretest_pipeline(payload)
+    except Exception:
+        await quota.arelease(payload["user_id"], PRETESTS)
+        raise
+
+
+async def abandon_pretest_job(payload: dict):
+    """Give back the quota of a pretest that was failed without running, e.g. after its worker was lost"""
+    await quota.arelease(payload["user_id"], PRETESTS)
+
+
+async def _run_pretest_pipeline(payload: dict) -> dict:
+    user_id = payload["user_id"]
+    user_tier = payload["user_tier"]
+    request_data = payload["request_data"]
+    filtered_persona = request_data["persona"]
+    usage.attribute(asset_mix=usage.asset_mix(a.get("type") for a in request_data["creative_assets"]))
+
+    on_section = None
+    if payload.get("stream"):
+        async def on_section(section, data):
+            await areport_event("section", {"section": section, "data": data})
+
+    result = await pretest_service.create_pretest(
+        user_id=str(user_id),
+        request_data=request_data,
+        user_tier=user_tier,
+        on_section=on_section
+    )
+    
+    await areport_stage("generating_reports")
+    report_urls = {}
+    
+    if user_tier in ["starter", "professional", "agency", "enterprise"]:
+        try:
+            pdf_filename = f"pretest_{result.get('pretest_id')}.pdf"
+            with metrics.span("pdf_render"):
+                pdf_path = generate_pdf_report(result, str(user_id), user_tier)
+            with metrics.span("storage_upload"):
+                pdf_url = upload_pdf_to_supabase(pdf_path, str(user_id), pdf_filename)
+            report_urls["pdf"] = pdf_url
+            logger.info(f"PDF report generated and uploaded for pretest {result.get('pretest_id')}")
+        except Exception as e:
+            logger.error(f"Failed to generate/upload PDF report: {str(e)}")
+    if user_tier in ["professional", "agency", "enterprise"]:
+        try:
+            csv_filename = f"pretest_{result.get('pretest_id')}.csv"
+            # Pass both pretest result and persona data to generate respondent-level CSV
+            with metrics.span("csv_render"):
+                csv_path = await generate_csv_report_with_respondents(result, filtered_persona)
+            with metrics.span("storage_upload"):
+                csv_url = upload_csv_to_supabase(csv_path, str(user_id), csv_filename)
+            report_urls["csv"] = csv_url
+            logger.info(f"CSV report generated and uploaded for pretest {result.get('pretest_id')}")
+        except Exception as e:
+            logger.error(f"Failed to generate/upload CSV report: {str(e)}")
+    
+    result["report_urls"] = report_urls
+    
+    logger.info(f"Pretest created successfully: {result.get('pretest_id')}")
+
+    return result
+
 def upload_csv_to_supabase(csv_path: str, user_id: str, filename: str) -> str:
     """Upload CSV to Supabase storage"""
     try:
@@ -857,23 +888,9 @@ async def get_pretest_usage(current_user: dict = Depends(get_current_user)):
     try:
         user_id = current_user["id"]
 
-        subscription_resp = (
-            supabase.table("subscriptions")
-            .select("tier, status")
-            .eq("user_id", user_id)
-            .eq("status", "active")
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-
-        user_tier = (
-            subscription_resp.data[0]["tier"].lower()
-            if subscription_resp.data
-            else "free"
-        )
+        user_tier = await tier_service.aresolve(user_id)
 
-        can_proceed, current_count, limit = check_pretest_usage_limit(str(user_id), user_tier)
+        can_proceed, current_count, limit = await check_pretest_usage_limit(str(user_id), user_tier)
 
         if limit is None:
             return {
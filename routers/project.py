@@ -4,6 +4,8 @@ from app.helpers.security import get_current_user
 from app.schemas.project import ProjectResponse, CreateProjectRequest
 from app.helpers.validators import validate_required_field
 from app.helpers.db import supabase
+from app.helpers.tier import tier_service
+from app.helpers.quota import quota, QuotaExceeded, PROJECTS
 
 router = APIRouter()
 
@@ -21,25 +23,7 @@ def get_user_current_plan(user_id: str) -> str:
     Get the user's current active subscription plan.
     Returns 'free' if no active subscription found.
     """
-    response = (
-        supabase.table("subscriptions")
-        .select("tier, end_date, status")
-        .eq("user_id", user_id)
-        .order("start_date", desc=True)
-        .limit(1)
-        .execute()
-    )
-
-    if not response.data:
-        return "free"
-
-    sub = response.data[0]
-    
-    # Check if subscription is still active
-    end_date = datetime.fromisoformat(sub["end_date"].replace("Z", ""))
-    is_active = end_date > datetime.utcnow() and sub.get("status") == "active"
-
-    return sub["tier"] if is_active else "free"
+    return tier_service.resolve(user_id)
 
 
 def reset_projects_count(user_id: str):
@@ -50,13 +34,8 @@ def reset_projects_count(user_id: str):
     print(f"🔄 Resetting projects_count for user {user_id}")
     
     try:
-        result = supabase.table("users") \
-            .update({"projects_count": 0}) \
-            .eq("id", user_id) \
-            .execute()
-        
+        quota.reset(user_id, PROJECTS)
         print(f"✅ Counter reset successful")
-        print(f"   Rows affected: {len(result.data) if result.data else 0}")
     except Exception as e:
         print(f"❌ Error resetting projects_count: {str(e)}")
         raise
@@ -85,40 +64,6 @@ def get_projects_count(user_id: str) -> int:
         return 0
 
 
-def increment_projects_created(user_id: str) -> int:
-    """
-    Increment the lifetime projects created counter.
-    Returns the new count.
-    """
-    # Get current count
-    current_count = get_projects_count(user_id)
-    new_count = current_count + 1
-    
-    print(f"🔢 Incrementing projects_count for user {user_id}")
-    print(f"   Current count: {current_count}")
-    print(f"   New count: {new_count}")
-    
-    # Update the counter
-    try:
-        result = supabase.table("users") \
-            .update({"projects_count": new_count}) \
-            .eq("id", user_id) \
-            .execute()
-        
-        print(f"✅ Update result: {result.data}")
-        
-        if not result.data:
-            print(f"⚠️ WARNING: No rows updated for user {user_id}")
-            # Verify the user exists
-            user_check = supabase.table("users").select("id").eq("id", user_id).execute()
-            print(f"   User exists: {bool(user_check.data)}")
-    except Exception as e:
-        print(f"❌ Error updating projects_count: {str(e)}")
-        raise
-    
-    return new_count
-
-
 def check_project_limit(user_id: str, current_plan: str) -> tuple[bool, int, int]:
     """
     Check if user has reached their LIFETIME project creation limit.
@@ -153,65 +98,27 @@ def create_project(
     try:
         user_id = current_user["id"]
         
-        # 🔒 Check user's subscription plan and LIFETIME project limit
         current_plan = get_user_current_plan(user_id)
-        can_create, projects_created, limit = check_project_limit(user_id, current_plan)
-        
-        if not can_create:
-            limit_text = "unlimited" if limit == float('inf') else str(limit)
+        limit = PROJECT_LIMITS.get(current_plan, 5)  # Default to free plan limit
+
+        # 🔒 Check the LIFETIME project limit and count this project in one atomic step;
+        # the count is given back if the project is not created
+        try:
+            with quota.reservation(user_id, PROJECTS, None if limit == float('inf') else limit) as new_count:
+                created_project = _insert_project(user_id, request)
+        except QuotaExceeded as e:
             raise HTTPException(
                 status_code=403,
                 detail={
                     "message": f"Lifetime project limit reached for {current_plan} plan",
                     "current_plan": current_plan,
-                    "projects_created_lifetime": projects_created,
-                    "plan_limit": limit_text,
+                    "projects_created_lifetime": e.count,
+                    "plan_limit": str(limit),
                     "upgrade_required": True,
                     "note": "This limit counts all projects ever created, even if deleted"
                 }
             )
         
-        # 🔎 Check if project with same name already exists for this user
-        existing_project = supabase.table("projects") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .eq("name", request.name) \
-            .execute()
-
-        if existing_project.data and len(existing_project.data) > 0:
-            raise HTTPException(
-                status_code=400,
-                detail=f"A project with the name '{request.name}' already exists for this user"
-            )
-
-        # Prepare project data
-        project_data = {
-            "user_id": user_id,
-            "name": request.name,
-            "brand": request.brand,
-            "product": request.product,
-            "product_service_type": request.product_service_type,
-            "category": request.category,
-            "market_maturity": request.market_maturity,
-            "campaign_objective": request.campaign_objective,
-            "value_propositions": request.value_propositions,
-            "media_channels": request.media_channels,
-            "kpis": request.kpis,
-            "kpi_target": request.kpi_target,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat(),
-        }
-
-        response = supabase.table("projects").insert(project_data).execute()
-
-        if not response.data:
-            raise HTTPException(status_code=400, detail="Failed to create project")
-
-        # ✨ INCREMENT the lifetime counter AFTER successful creation
-        new_count = increment_projects_created(user_id)
-
-        created_project = response.data[0]
-        
         # 📊 Get updated project limits after creation
         limit_text = "unlimited" if limit == float('inf') else limit
         remaining = "unlimited" if limit == float('inf') else max(0, limit - new_count)
@@ -236,6 +143,47 @@ def create_project(
         )
 
 
+def _insert_project(user_id: str, request: CreateProjectRequest) -> dict:
+    """Insert the project row and return it; raises HTTPException on a duplicate name or a failed insert"""
+    # 🔎 Check if project with same name already exists for this user
+    existing_project = supabase.table("projects") \
+        .select("id") \
+        .eq("user_id", user_id) \
+        .eq("name", request.name) \
+        .execute()
+
+    if existing_project.data and len(existing_project.data) > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A project with the name '{request.name}' already exists for this user"
+        )
+
+    # Prepare project data
+    project_data = {
+        "user_id": user_id,
+        "name": request.name,
+        "brand": request.brand,
+        "product": request.product,
+        "product_service_type": request.product_service_type,
+        "category": request.category,
+        "market_maturity": request.market_maturity,
+        "campaign_objective": request.campaign_objective,
+        "value_propositions": request.value_propositions,
+        "media_channels": request.media_channels,
+        "kpis": request.kpis,
+        "kpi_target": request.kpi_target,
+        "created_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+
+    response = supabase.table("projects").insert(project_data).execute()
+
+    if not response.data:
+        raise HTTPException(status_code=400, detail="Failed to create project")
+
+    return response.data[0]
+
+
 # Optional: Add an endpoint to check project limits
 @router.get("/projects/limits")
 def get_project_limits(current_user: dict = Depends(get_current_user)):
@@ -695,7 +695,7 @@
 #             except Exception as e:
 #                 logger.warning(f"Failed to clean up temporary CSV file: {str(e)}")
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Response, status
 from fastapi.security import HTTPBearer
 import logging
 import os
@@ -712,14 +712,27 @@ from reportlab.platypus import (
 )
 from app.helpers.security import get_current_user
 from app.service.simulation_service import SimulationService
+from app.service.job_queue import job_queue, areport_stage, JOB_QUEUED
 from app.helpers.db import supabase
+from app.helpers.repository import repository, query_budget
+from app.helpers.tier import tier_service
+from app.helpers import metrics, usage
 import csv
+import time
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 security = HTTPBearer()
 simulation_service = SimulationService()
 
+# Ownership errors reported by repository.get_creative_context
+CONTEXT_ERRORS = {
+    "persona_not_found": "One or more personas not found",
+    "persona_not_owned": "You do not own one or more personas",
+    "asset_not_found": "One or more creative assets not found",
+    "asset_not_owned": "Creative asset {id} does not belong to your project",
+}
+
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -1315,28 +1328,15 @@ def upload_csv_to_supabase(csv_path: str, user_id: str, filename: str) -> str:
         raise
 
 @router.post("/")
-async def create_simulation(request: dict, current_user: dict = Depends(get_current_user)):
-  
-    pdf_temp_path = None
-    csv_temp_path = None
-    
+@query_budget(2)  # tier lookup and the creative context
+async def create_simulation(request: dict, response: Response, current_user: dict = Depends(get_current_user)):
+    """Validate and queue an A/B simulation; progress and result are served by GET /jobs/{job_id}"""
+    trace = metrics.start_trace("simulation")
+    started = time.perf_counter()
     try:
         user_id = current_user["id"]
-        subscription_resp = (
-            supabase.table("subscriptions")
-            .select("tier, status")
-            .eq("user_id", user_id)
-            .eq("status", "active")
-            .order("created_at", desc=True)
-            .limit(1)
-            .execute()
-        )
-
-        user_tier = (
-            subscription_resp.data[0]["tier"].lower()
-            if subscription_resp.data
-            else "free"
-        )
+        user_tier = await tier_service.aresolve(user_id)
+        metrics.set_tier(user_tier)
 
         if user_tier == "free":
             raise HTTPException(
@@ -1355,41 +1355,34 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
                     status_code=status.HTTP_400_BAD_REQUEST,
                     detail=f"{name} missing required fields: {', '.join(missing)}"
                 )
-        persona_a_id = variant_a["persona_id"]
-        persona_b_id = variant_b["persona_id"]
-
-        response_a = supabase.table("personas").select("*").eq("id", persona_a_id).execute()
-        response_b = supabase.table("personas").select("*").eq("id", persona_b_id).execute()
-
-        if not response_a.data or not response_b.data:
-            raise HTTPException(status_code=404, detail="One or more personas not found")
-
-        persona_a = response_a.data[0]
-        persona_b = response_b.data[0]
-
-        if persona_a["user_id"] != user_id or persona_b["user_id"] != user_id:
-            raise HTTPException(status_code=403, detail="You do not own one or more personas")
+        try:
+            persona_a_id = int(variant_a["persona_id"])
+            persona_b_id = int(variant_b["persona_id"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="persona_id must be an integer")
 
-        creative_ids_a = variant_a["creative_ids"]
-        creative_ids_b = variant_b["creative_ids"]
+        try:
+            creative_ids_a = [int(i) for i in variant_a["creative_ids"]]
+            creative_ids_b = [int(i) for i in variant_b["creative_ids"]]
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="creative_ids must be a list of integers")
         all_ids = list(set(creative_ids_a + creative_ids_b))
 
-        creative_assets_response = supabase.table("creative_assets").select("*").in_("id", all_ids).execute()
-        creative_assets = creative_assets_response.data or []
+        # Personas, assets and projects in one round-trip; ownership is checked in the database
+        context = await repository.get_creative_context(user_id, [persona_a_id, persona_b_id], all_ids)
+        error = context["error"]
+        if error:
+            raise HTTPException(
+                status_code=error["status"],
+                detail=CONTEXT_ERRORS[error["code"]].format(id=error["id"])
+            )
 
-        if len(creative_assets) != len(all_ids):
-            raise HTTPException(status_code=404, detail="One or more creative assets not found")
-
-        for asset in creative_assets:
-            project_resp = supabase.table("projects").select("user_id").eq("id", asset["project_id"]).execute()
-            if not project_resp.data or project_resp.data[0]["user_id"] != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"Creative asset {asset['id']} does not belong to your project"
-                )
-        project_ids = list(set([asset["project_id"] for asset in creative_assets]))
-        projects_response = supabase.table("projects").select("*").in_("id", project_ids).execute()
-        projects_data = {p["id"]: p for p in projects_response.data} if projects_response.data else {}
+        persona_a = context["personas"].get(persona_a_id)
+        persona_b = context["personas"].get(persona_b_id)
+        if persona_a is None or persona_b is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=CONTEXT_ERRORS["persona_not_found"])
+        creative_assets = context["assets"]
+        projects_data = context["projects"]
 
         for asset in creative_assets:
             if asset["project_id"] not in projects_data:
@@ -1501,6 +1494,53 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
 
         logger.info(f"Prepared request_data with {len(filtered_assets_a)} assets for variant A and {len(filtered_assets_b)} assets for variant B")
 
+        metrics.record("db_fetch", time.perf_counter() - started)
+        with metrics.span("enqueue"):
+            job_id = await job_queue.aenqueue("simulation", user_id, {
+                "user_id": user_id,
+                "user_tier": user_tier,
+                "request_data": request_data,
+                "variant_a": variant_a,
+                "variant_b": variant_b
+            })
+
+        response.headers["Server-Timing"] = metrics.server_timing(trace["spans"])
+        return {
+            "job_id": job_id,
+            "status": JOB_QUEUED,
+            "message": "Simulation queued. Poll the job status endpoint for progress and the result."
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in create_simulation: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error during simulation: {str(e)}"
+        )
+
+
+async def run_simulation_job(payload: dict) -> dict:
+    """
+    Run a validated A/B simulation: analysis, PDF/CSV reports and uploads.
+    Executed by the job worker (app.service.job_worker), not in the API process.
+    """
+    user_id = payload["user_id"]
+    user_tier = payload["user_tier"]
+    request_data = payload["request_data"]
+    variant_a = payload["variant_a"]
+    variant_b = payload["variant_b"]
+    usage.attribute(asset_mix=usage.asset_mix(
+        a.get("type")
+        for variant in ("variant_a", "variant_b")
+        for a in request_data.get(variant, {}).get("creative_assets", [])
+    ))
+
+    pdf_temp_path = None
+    csv_temp_path = None
+    
+    try:
         result = await simulation_service.create_simulation(
             user_id=str(user_id),
             request=request_data,
@@ -1508,15 +1548,18 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
         )
         print("Simulation result:", result)
 
+        await areport_stage("generating_reports")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         pdf_filename = f"simulation_report_{user_id}_{timestamp}.pdf"
         with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.pdf') as tmp_file:
             pdf_temp_path = tmp_file.name
         
-        create_enhanced_pdf(result, variant_a, variant_b, user_id, user_tier, pdf_temp_path)
+        with metrics.span("pdf_render"):
+            create_enhanced_pdf(result, variant_a, variant_b, user_id, user_tier, pdf_temp_path)
         logger.info(f"PDF report generated temporarily: {pdf_temp_path}")
         
-        pdf_url = upload_pdf_to_supabase(pdf_temp_path, str(user_id), pdf_filename)
+        with metrics.span("storage_upload"):
+            pdf_url = upload_pdf_to_supabase(pdf_temp_path, str(user_id), pdf_filename)
         
         csv_url = None
         if user_tier.lower() not in ["starter", "free"]:
@@ -1524,10 +1567,12 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
             with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv') as tmp_file:
                 csv_temp_path = tmp_file.name
             
-            create_simulation_csv(result, variant_a, variant_b, csv_temp_path, user_tier)
+            with metrics.span("csv_render"):
+                create_simulation_csv(result, variant_a, variant_b, csv_temp_path, user_tier)
             logger.info(f"CSV report generated temporarily: {csv_temp_path}")
             
-            csv_url = upload_csv_to_supabase(csv_temp_path, str(user_id), csv_filename)
+            with metrics.span("storage_upload"):
+                csv_url = upload_csv_to_supabase(csv_temp_path, str(user_id), csv_filename)
         else:
             logger.info(f"CSV generation skipped for {user_tier} tier user")
         
@@ -1541,14 +1586,6 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
         
         return response_data
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in create_simulation: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Internal server error during simulation: {str(e)}"
-        )
     finally:
         if pdf_temp_path and os.path.exists(pdf_temp_path):
             try:
@@ -1562,4 +1599,4 @@ async def create_simulation(request: dict, current_user: dict = Depends(get_curr
                 os.remove(csv_temp_path)
                 logger.info(f"Cleaned up temporary CSV: {csv_temp_path}")
             except Exception as e:
-                logger.warning(f"Failed to clean up temporary CSV file: {str(e)}")
\ No newline at end of file
+                logger.warning(f"Failed to clean up temporary CSV file: {str(e)}")
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from app.helpers.security import get_current_user
 from app.helpers.db import supabase
+from app.helpers.tier import tier_service
+from app.helpers.quota import quota, PRETESTS
 from datetime import datetime, timedelta
+import asyncio
 import os
 import stripe
 from pydantic import BaseModel, field_validator
@@ -156,25 +159,21 @@ async def stripe_webhook(request: Request):
     print(f"📥 Received Stripe event: {event['type']}")
     print(f"📄 Event ID: {event.get('id', 'N/A')}")
 
-    # Handle successful checkout
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        handle_checkout_completed(session)
-
-    # Handle subscription updates (plan changes, renewals)
-    elif event["type"] == "customer.subscription.updated":
-        subscription = event["data"]["object"]
-        handle_subscription_updated(subscription)
-
-    # Handle subscription deletion/cancellation
-    elif event["type"] == "customer.subscription.deleted":
-        subscription = event["data"]["object"]
-        handle_subscription_deleted(subscription)
-
-    # Handle failed payments
-    elif event["type"] == "invoice.payment_failed":
-        invoice = event["data"]["object"]
-        handle_payment_failed(invoice)
+    handlers = {
+        # Successful checkout
+        "checkout.session.completed": handle_checkout_completed,
+        # Subscription updates (plan changes, renewals)
+        "customer.subscription.updated": handle_subscription_updated,
+        # Subscription deletion/cancellation
+        "customer.subscription.deleted": handle_subscription_deleted,
+        # Failed payments
+        "invoice.payment_failed": handle_payment_failed,
+    }
+    handler = handlers.get(event["type"])
+    if handler is not None:
+        # The handlers make blocking Stripe and Supabase calls; keep them off the event loop
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, handler, event["data"]["object"])
 
     return {"status": "success"}
 
@@ -182,16 +181,19 @@ from app.routers.project import reset_projects_count
 def reset_pretests_count(user_id):
     """Reset the pretests counter for a user to 0"""
     try:
-        result = supabase.table("users").update({
-            "pretests_count": 0
-        }).eq("id", user_id).execute()
+        quota.reset(user_id, PRETESTS)
         print(f"✅ Reset pretests_count to 0 for user {user_id}")
-        return result
     except Exception as e:
         print(f"❌ Error resetting pretests_count: {str(e)}")
         raise
 
 
+def invalidate_tiers(rows):
+    """Drop the cached tier of every user whose subscription row was just written"""
+    for user_id in {row.get("user_id") for row in rows or []}:
+        tier_service.invalidate(user_id)
+
+
 def handle_checkout_completed(session):
     """Process completed checkout session"""
     try:
@@ -284,6 +286,7 @@ def handle_checkout_completed(session):
             print(f"   Rows inserted: {len(result.data)}")
             if result.data:
                 print(f"   New record: {result.data[0]}")
+        tier_service.invalidate(user_id)
         
         # 🔄 RESET COUNTERS when user purchases a subscription
         if plan != "free":
@@ -360,6 +363,7 @@ def handle_subscription_updated(subscription):
             print(f"   {key}: {value}")
         
         result = supabase.table("subscriptions").update(update_data).eq("stripe_subscription_id", subscription_id).execute()
+        invalidate_tiers(result.data)
         
         print(f"✅ UPDATE SUCCESS")
         print(f"   Rows affected: {len(result.data)}")
@@ -410,6 +414,7 @@ def handle_subscription_deleted(subscription):
             "status": "cancelled",
             "auto_renew": False
         }).eq("stripe_subscription_id", subscription_id).execute()
+        invalidate_tiers(result.data)
         
         print(f"✅ CANCELLATION SUCCESS")
         print(f"   Rows affected: {len(result.data)}")
@@ -447,6 +452,7 @@ def handle_payment_failed(invoice):
                 "status": "past_due",
                 "auto_renew": False
             }).eq("stripe_subscription_id", subscription_id).execute()
+            invalidate_tiers(result.data)
             
             print(f"✅ MARKED AS PAST_DUE")
             print(f"   Rows affected: {len(result.data)}")
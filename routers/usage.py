@@ -0,0 +1,77 @@
+import logging
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.helpers.db import supabase
+from app.helpers.security import get_admin_user
+from app.helpers.usage import USAGE_TABLE
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+GROUP_BY_FIELDS = ("user_id", "tier", "endpoint", "call_site", "model", "asset_mix", "day")
+PAGE_SIZE = 1000
+
+
+def _fetch_rows(since: str) -> list:
+    rows, offset = [], 0
+    while True:
+        page = (
+            supabase.table(USAGE_TABLE)
+            .select("*")
+            .gte("created_at", since)
+            .order("id")
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute()
+        ).data or []
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+        offset += PAGE_SIZE
+
+
+@router.get("/summary")
+def get_usage_summary(
+    since_days: int = Query(30, ge=1, le=366),
+    group_by: str = Query("user_id"),
+    current_user: dict = Depends(get_admin_user),
+):
+    """OpenAI token, audio and cost totals over the last since_days, grouped by one attribution field"""
+    if group_by not in GROUP_BY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY_FIELDS)}")
+
+    since = (datetime.now(timezone.utc) - timedelta(days=since_days)).isoformat()
+    try:
+        rows = _fetch_rows(since)
+    except Exception as e:
+        logger.error(f"Failed to load usage rows: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to load usage")
+
+    groups = {}
+    for row in rows:
+        key = (row.get("created_at") or "")[:10] if group_by == "day" else row.get(group_by)
+        group = groups.setdefault(key, {
+            group_by: key, "calls": 0, "cached_calls": 0, "prompt_tokens": 0,
+            "completion_tokens": 0, "audio_seconds": 0.0, "images": 0, "cost_usd": 0.0,
+        })
+        group["calls"] += 1
+        group["cached_calls"] += 1 if row.get("cached") else 0
+        group["prompt_tokens"] += row.get("prompt_tokens") or 0
+        group["completion_tokens"] += row.get("completion_tokens") or 0
+        group["audio_seconds"] += row.get("audio_seconds") or 0
+        group["images"] += (row.get("images_high") or 0) + (row.get("images_low") or 0)
+        group["cost_usd"] += row.get("cost_usd") or 0
+
+    summary = sorted(groups.values(), key=lambda g: g["cost_usd"], reverse=True)
+    for group in summary:
+        group["audio_seconds"] = round(group["audio_seconds"], 2)
+        group["cost_usd"] = round(group["cost_usd"], 4)
+
+    return {
+        "since": since,
+        "group_by": group_by,
+        "total_cost_usd": round(sum(g["cost_usd"] for g in summary), 4),
+        "groups": summary,
+    }
@@ -16,6 +16,8 @@ from fastapi.responses import HTMLResponse
 from supabase import create_client
 
 from app.helpers.security import get_current_user, verify_password, hash_password
+from app.helpers.repository import repository
+from app.helpers.user_cache import user_cache
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -150,7 +152,10 @@ async def update_profile(
             file_extension = os.path.splitext(avatar.filename)[1] if avatar.filename else '.jpg'
             filename = f"user_{current_user['id']}_avatar{file_extension}"
 
-            upload_response = supabase.storage.from_(BUCKET_NAME).upload(
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None,
+                supabase.storage.from_(BUCKET_NAME).upload,
                 filename,
                 file_bytes,
                 {
@@ -169,17 +174,12 @@ async def update_profile(
         raise HTTPException(status_code=400, detail="No fields provided to update")
 
     try:
-        response = (
-            supabase.table("users")
-            .update(update_data)
-            .eq("id", current_user["id"])
-            .execute()
-        )
+        updated_user = await repository.update_user(current_user["id"], update_data)
+        user_cache.invalidate_user(current_user["id"])
 
-        if not response.data:
+        if not updated_user:
             raise HTTPException(status_code=400, detail="Failed to update profile")
 
-        updated_user = response.data[0]
         execution_time = round(time.time() - start_time, 2)
 
         return {
@@ -227,6 +227,7 @@ async def request_password_update(
                 .eq("id", current_user["id"])
                 .execute()
             )
+            user_cache.invalidate_user(current_user["id"])
             
             if not response.data:
                 raise HTTPException(status_code=400, detail="Failed to update password")
@@ -306,6 +307,7 @@ async def approve_password_change(token: str) -> HTMLResponse:
             .eq("id", user["id"])
             .execute()
         )
+        user_cache.invalidate_user(user["id"])
         
         if not update_response.data:
             return HTMLResponse(content=_get_error_html("Update Failed", "Failed to update password. Please try again."), status_code=400)
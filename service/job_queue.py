@@ -0,0 +1,327 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(tempfile.gettempdir(), "creative_jobs.sqlite3"))
+# A running job whose worker has not heartbeated for this long is considered lost
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+JOB_EVENT_RETENTION_SECONDS = 24 * 3600
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# Set by the worker while a job runs, so pipeline code can report progress without knowing about jobs
+_current_job_id: ContextVar[Optional[str]] = ContextVar("current_job_id", default=None)
+
+
+class JobQueue:
+    """
+    Dependency-free job queue backed by SQLite (WAL), shared by the API process
+    (enqueue / status) and any number of worker processes on the same host (claim / update).
+    Claiming uses BEGIN IMMEDIATE so two workers never pick the same job.
+    """
+
+    def __init__(self, db_path: str = JOB_QUEUE_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_initialized(self):
+        if self._initialized:
+            return
+        with self._lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        user_id TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        stage TEXT,
+                        stages TEXT NOT NULL DEFAULT '[]',
+                        payload TEXT NOT NULL,
+                        result TEXT,
+                        error TEXT,
+                        error_status INTEGER,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        worker_id TEXT,
+                        created_at REAL NOT NULL,
+                        started_at REAL,
+                        heartbeat_at REAL,
+                        finished_at REAL,
+                        timings TEXT,
+                        usage TEXT
+                    )"""
+                )
+                for column in ("timings", "usage"):
+                    try:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+                    except sqlite3.OperationalError:
+                        pass  # queue created with the column already
+                conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+                conn.execute(
+                    """CREATE TABLE IF NOT EXISTS job_events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        job_id TEXT NOT NULL,
+                        event TEXT NOT NULL,
+                        data TEXT NOT NULL,
+                        created_at REAL NOT NULL
+                    )"""
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id)")
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def _execute(self, sql: str, params: tuple = ()):
+        self._ensure_initialized()
+        conn = self._connect()
+        try:
+            conn.execute(sql, params)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"] or "[]")
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["timings"] = json.loads(job["timings"]) if job.get("timings") else []
+        job["usage"] = json.loads(job["usage"]) if job.get("usage") else None
+        return job
+
+    # ----------------- API side -----------------
+
+    def enqueue(self, kind: str, user_id: str, payload: dict) -> str:
+        """Queue a job and return its id"""
+        job_id = str(uuid.uuid4())
+        self._execute(
+            """INSERT INTO jobs (id, kind, user_id, status, stage, payload, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (job_id, kind, str(user_id), JOB_QUEUED, JOB_QUEUED, json.dumps(payload, default=str), time.time()),
+        )
+        logger.info(f"Queued {kind} job {job_id} for user {user_id}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._ensure_initialized()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._to_dict(row) if row else None
+
+    # The a-prefixed variants run the sqlite work in the default executor, so a
+    # write lock held by the workers (timeout=30) never stalls the API's event loop
+
+    async def _offload(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def aenqueue(self, kind: str, user_id: str, payload: dict) -> str:
+        return await self._offload(self.enqueue, kind, user_id, payload)
+
+    async def aget(self, job_id: str) -> Optional[dict]:
+        return await self._offload(self.get, job_id)
+
+    async def aevents_since(self, job_id: str, after_id: int = 0) -> list:
+        return await self._offload(self.events_since, job_id, after_id)
+
+    # ----------------- Worker side -----------------
+
+    def claim(self, worker_id: str, kinds: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """Atomically take the oldest queued job (optionally of the given kinds)"""
+        self._ensure_initialized()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            sql = "SELECT id FROM jobs WHERE status = ?"
+            params = [JOB_QUEUED]
+            if kinds:
+                kinds = list(kinds)
+                sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params.extend(kinds)
+            row = conn.execute(sql + " ORDER BY created_at LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                """UPDATE jobs SET status = ?, stage = ?, worker_id = ?, attempts = attempts + 1,
+                   started_at = ?, heartbeat_at = ? WHERE id = ?""",
+                (JOB_RUNNING, "started", worker_id, now, now, row["id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._to_dict(job)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def set_stage(self, job_id: str, stage: str):
+        """Record the pipeline stage a running job has reached"""
+        self._ensure_initialized()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None:
+                now = time.time()
+                stages = json.loads(row["stages"] or "[]")
+                stages.append({"stage": stage, "at": now})
+                conn.execute(
+                    "UPDATE jobs SET stage = ?, stages = ?, heartbeat_at = ? WHERE id = ?",
+                    (stage, json.dumps(stages), now, job_id),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def add_event(self, job_id: str, event: str, data: dict):
+        """Append a partial result for clients streaming the job (see routers.jobs)"""
+        self._execute(
+            "INSERT INTO job_events (job_id, event, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, event, json.dumps(data, default=str), time.time()),
+        )
+
+    def events_since(self, job_id: str, after_id: int = 0) -> list:
+        """Events of a job with an id greater than after_id, oldest first"""
+        self._ensure_initialized()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, event, data FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+                (job_id, after_id),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"id": row["id"], "event": row["event"], "data": json.loads(row["data"])} for row in rows]
+
+    def heartbeat(self, job_id: str):
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def complete(self, job_id: str, result: dict, timings: Optional[list] = None, usage: Optional[dict] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, stage = ?, result = ?, timings = ?, usage = ?, finished_at = ? WHERE id = ?",
+            (JOB_SUCCEEDED, "done", json.dumps(result, default=str), json.dumps(timings or []),
+             json.dumps(usage) if usage else None, time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str, error_status: int = 500, timings: Optional[list] = None,
+             usage: Optional[dict] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, error_status = ?, timings = ?, usage = ?, finished_at = ? WHERE id = ?",
+            (JOB_FAILED, error, error_status, json.dumps(timings or []),
+             json.dumps(usage) if usage else None, time.time(), job_id),
+        )
+
+    def requeue_stale(self, stale_seconds: int = JOB_STALE_SECONDS) -> list:
+        """
+        Put jobs of dead workers back in the queue, or fail them once they ran out of attempts.
+        Returns the jobs failed here, so the worker can undo what queueing them reserved.
+        """
+        self._ensure_initialized()
+        cutoff = time.time() - stale_seconds
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            failed_jobs = [
+                self._to_dict(row) for row in conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                    (JOB_RUNNING, cutoff, JOB_MAX_ATTEMPTS),
+                ).fetchall()
+            ]
+            conn.executemany(
+                """UPDATE jobs SET status = ?, error = ?, error_status = 500, finished_at = ?
+                   WHERE id = ?""",
+                [(JOB_FAILED, "Worker lost while running the job", time.time(), job["id"]) for job in failed_jobs],
+            )
+            requeued = conn.execute(
+                """UPDATE jobs SET status = ?, stage = ?, worker_id = NULL
+                   WHERE status = ? AND heartbeat_at < ?""",
+                (JOB_QUEUED, JOB_QUEUED, JOB_RUNNING, cutoff),
+            ).rowcount
+            # Partial results are only useful while someone may still be streaming the job
+            conn.execute(
+                "DELETE FROM job_events WHERE created_at < ?", (time.time() - JOB_EVENT_RETENTION_SECONDS,)
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if failed_jobs or requeued:
+            logger.warning(f"Stale jobs: {requeued} requeued, {len(failed_jobs)} failed")
+        return failed_jobs
+
+
+job_queue = JobQueue()
+
+
+def report_stage(stage: str):
+    """Record progress for the job running in the current context; no-op outside a job"""
+    job_id = _current_job_id.get()
+    if job_id is None:
+        return
+    try:
+        job_queue.set_stage(job_id, stage)
+    except Exception as e:
+        logger.warning(f"Failed to record stage {stage} for job {job_id}: {str(e)}")
+
+
+async def areport_stage(stage: str):
+    """report_stage() for async pipeline code: the sqlite write runs in the default executor"""
+    job_id = _current_job_id.get()
+    if job_id is None:
+        return
+    try:
+        await job_queue._offload(job_queue.set_stage, job_id, stage)
+    except Exception as e:
+        logger.warning(f"Failed to record stage {stage} for job {job_id}: {str(e)}")
+
+
+def report_event(event: str, data: dict):
+    """Publish a partial result for the job running in the current context; no-op outside a job"""
+    job_id = _current_job_id.get()
+    if job_id is None:
+        return
+    try:
+        job_queue.add_event(job_id, event, data)
+    except Exception as e:
+        logger.warning(f"Failed to record {event} event for job {job_id}: {str(e)}")
+
+
+async def areport_event(event: str, data: dict):
+    """report_event() for async pipeline code: the sqlite write runs in the default executor"""
+    job_id = _current_job_id.get()
+    if job_id is None:
+        return
+    try:
+        await job_queue._offload(job_queue.add_event, job_id, event, data)
+    except Exception as e:
+        logger.warning(f"Failed to record {event} event for job {job_id}: {str(e)}")
@@ -0,0 +1,132 @@
+"""
+Job worker process for the pretest and simulation pipelines.
+
+Run one or more of these next to the API (same host, same JOB_QUEUE_PATH):
+    python -m app.service.job_worker
+"""
+import asyncio
+import functools
+import logging
+import os
+import socket
+import time
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from prometheus_client import start_http_server
+
+from app.helpers import metrics, usage
+from app.service.job_queue import job_queue, _current_job_id
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+# Prometheus scrape port for this worker; give each worker on a host its own
+JOB_WORKER_METRICS_PORT = int(os.getenv("JOB_WORKER_METRICS_PORT", "0"))
+HEARTBEAT_SECONDS = 15
+STALE_CHECK_SECONDS = 60
+
+
+def _handlers() -> dict:
+    # Imported lazily so the queue module stays importable from the routers
+    from app.routers.pretest import run_pretest_job
+    from app.routers.simulate import run_simulation_job
+    return {
+        "pretest": run_pretest_job,
+        "simulation": run_simulation_job,
+    }
+
+
+def _abandon_handlers() -> dict:
+    """Per kind: undo what queueing a job reserved, for jobs failed without running to the end"""
+    from app.routers.pretest import abandon_pretest_job
+    return {
+        "pretest": abandon_pretest_job,
+    }
+
+
+async def _abandon_stale_jobs(abandon_handlers: dict):
+    for job in await _db(job_queue.requeue_stale):
+        handler = abandon_handlers.get(job["kind"])
+        if handler is None:
+            continue
+        try:
+            await handler(job["payload"])
+        except Exception as e:
+            logger.error(f"Failed to clean up lost job {job['id']}: {str(e)}")
+
+
+async def _db(fn, *args, **kwargs):
+    """Run a job_queue call in the default executor: a sqlite lock wait must not stall the jobs sharing this loop"""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+async def _heartbeat(job_id: str):
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        try:
+            await _db(job_queue.heartbeat, job_id)
+        except Exception as e:
+            logger.warning(f"Heartbeat failed for job {job_id}: {str(e)}")
+
+
+async def _execute(job: dict, handler):
+    job_id = job["id"]
+    _current_job_id.set(job_id)
+    trace = metrics.start_trace(job["kind"], job["payload"].get("user_tier"))
+    ledger = usage.start(job["kind"], job["user_id"], job["payload"].get("user_tier"))
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    started = time.time()
+    try:
+        result = await handler(job["payload"])
+        await _db(job_queue.complete, job_id, result, trace["spans"], usage.summarize(ledger))
+        logger.info(f"Job {job_id} ({job['kind']}) succeeded in {time.time() - started:.1f}s")
+    except HTTPException as e:
+        logger.warning(f"Job {job_id} ({job['kind']}) failed: {e.detail}")
+        await _db(job_queue.fail, job_id, str(e.detail), e.status_code, trace["spans"], usage.summarize(ledger))
+    except Exception as e:
+        logger.error(f"Job {job_id} ({job['kind']}) crashed: {str(e)}", exc_info=True)
+        await _db(job_queue.fail, job_id, str(e), timings=trace["spans"], usage=usage.summarize(ledger))
+    finally:
+        heartbeat.cancel()
+
+
+async def run_worker(concurrency: int = JOB_WORKER_CONCURRENCY):
+    handlers = _handlers()
+    abandon_handlers = _abandon_handlers()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    running = set()
+    last_stale_check = 0.0
+    logger.info(f"Job worker {worker_id} started (concurrency={concurrency})")
+
+    while True:
+        if time.time() - last_stale_check > STALE_CHECK_SECONDS:
+            await _abandon_stale_jobs(abandon_handlers)
+            last_stale_check = time.time()
+
+        job = None
+        if len(running) < concurrency:
+            job = await _db(job_queue.claim, worker_id, kinds=list(handlers.keys()))
+
+        if job is None:
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+            continue
+
+        logger.info(f"Worker {worker_id} picked up {job['kind']} job {job['id']} (attempt {job['attempts']})")
+        task = asyncio.create_task(_execute(job, handlers[job["kind"]]))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    if JOB_WORKER_METRICS_PORT:
+        start_http_server(JOB_WORKER_METRICS_PORT)
+        logger.info(f"Serving Prometheus metrics on port {JOB_WORKER_METRICS_PORT}")
+    asyncio.run(run_worker())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
-from openai import OpenAI
 import json
 import logging
 from typing import Dict, Any
 from dotenv import load_dotenv
 import os
 from datetime import datetime
+from app.helpers.llm_gateway import llm_gateway
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -15,9 +15,8 @@ class PersonaService:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY not found in .env file")
-        self.openai_client = OpenAI(api_key=api_key)
     
-    def create_persona(self, user_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def create_persona(self, user_id: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generate persona data, insights, and reach all in one AI call"""
 
         missing_fields = []
@@ -113,7 +112,9 @@ class PersonaService:
             """
 
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await llm_gateway.chat(
+                "persona.create",
+                cache=True,
                 model="gpt-4",
                 messages=[
                     {
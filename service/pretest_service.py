@@ -1,4 +1,4 @@
-from typing import List, Optional, Tuple
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
 import json
 import uuid
 from datetime import datetime
@@ -7,19 +7,34 @@ from openai import OpenAI
 import os
 import base64
 import requests
-import cv2
-import ffmpeg
 import yt_dlp
 import tempfile
-import librosa
-import numpy as np
 import asyncio
+import time
 import concurrent.futures
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
+from app.helpers.media_cache import media_cache
+from app.helpers.artifact_store import artifact_store
+from app.helpers import acoustics, frame_decoder, range_fetch, transcription
+from app.helpers.media_worker import media_worker
+from app.helpers.llm_gateway import llm_gateway
+from app.helpers import image_budget, metrics
+from app.helpers.blob import Blob
+from app.helpers.json_stream import TopLevelSectionParser
+from app.service.job_queue import areport_stage
 
 logger = logging.getLogger(__name__)
 
+# yt-dlp format profile for video creatives (also part of the media cache key)
+VIDEO_FORMAT = 'best[ext=mp4]/best'
+
+# Bump a version when an extractor's output changes so stored artifacts are recomputed
+EXTRACTOR_VERSIONS = {
+    "frames": "2",
+    "transcript": "1",
+    "acoustics": "2",
+}
+
 class PretestService:
     def __init__(self):
         self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -32,10 +47,17 @@ class PretestService:
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
 
-    async def _analyze_multi_asset_campaign(self, persona: dict, creative_assets: dict, request_body: dict, project: dict) -> dict:
-        """Campaign analysis with support for multiple images and audio files"""
+    async def _analyze_multi_asset_campaign(self, persona: dict, creative_assets: dict, request_body: dict, project: dict,
+                                            on_section: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> dict:
+        """
+        Campaign analysis with support for multiple images and audio files.
+        When on_section is given the model output is streamed and each top-level
+        section is passed to it as soon as it is complete.
+        """
         try:
             user_tier = request_body.get("user_tier", "free")
+            image_parts = await self._prepare_image_parts(creative_assets, user_tier)
+            prompt_started = time.perf_counter()
             include_creative_director = user_tier in ["professional", "agency", "enterprise"]
             persona_age = f"{persona.get('age_min', '25')}-{persona.get('age_max', '45')}"
             persona_gender = persona.get('gender', 'all genders')
@@ -95,29 +117,18 @@ class PretestService:
             
             # Add image assets
             for idx, img_asset in enumerate(creative_assets.get("image_assets", [])):
-                if img_asset.get("content"):
-                    img_content = img_asset['content'].strip().replace('\n', '').replace('\r', '')
-                    
-                    try:
-                        base64.b64decode(img_content[:100])
-                        
-                        img_size_mb = len(img_content) * 3 / 4 / (1024 * 1024)
-                        if img_size_mb > 15:
-                            logger.warning(f"Image {idx + 1} is large ({img_size_mb:.2f}MB), may cause issues")
-                        
+                if img_asset.get("image_blob"):
+                    image_part = image_parts.get(("image", idx))
+                    if image_part:
                         messages.append({
                             "role": "user",
                             "content": [
                                 {"type": "text", "text": f"IMAGE ASSET #{idx + 1} (ID: {img_asset['asset_id']}): Analyze this advertising creative. Identify the ACTUAL product/brand shown."},
-                                {"type": "image_url", "image_url": {
-                                    "url": f"data:image/jpeg;base64,{img_content}",
-                                    "detail": "high"
-                                }}
+                                {"type": "image_url", "image_url": image_part}
                             ]
                         })
-                        
-                    except Exception as img_error:
-                        logger.error(f"Invalid image content for asset {idx + 1}: {str(img_error)}")
+                    else:
+                        logger.error(f"Invalid image content for asset {idx + 1}")
                         messages.append({
                             "role": "user",
                             "content": f"IMAGE ASSET #{idx + 1} (ID: {img_asset['asset_id']}): [Image could not be processed]"
@@ -126,6 +137,7 @@ class PretestService:
             for video_idx, video_asset in enumerate(creative_assets.get("video_assets", [])):
                 duration = video_asset.get('duration_seconds', 0)
                 frames_base64 = video_asset.get('frames_base64', [])
+                frame_timestamps = video_asset.get('frame_timestamps', [])
                 
                 # Add transcript and metadata first
                 video_content = f"VIDEO ASSET #{video_idx + 1} (ID: {video_asset['asset_id']}):\n"
@@ -150,10 +162,16 @@ class PretestService:
                 if frames_base64:
                     logger.info(f"Adding {len(frames_base64)} video frames to analysis (duration: {duration}s)")
                     
-                    for frame_idx, frame_base64 in enumerate(frames_base64):
+                    for frame_idx in range(len(frames_base64)):
                         try:
-                            # Calculate approximate timestamp
-                            if duration > 0 and len(frames_base64) > 1:
+                            image_part = image_parts.get(("frame", video_idx, frame_idx))
+                            if not image_part:
+                                continue
+
+                            # Use the decoded frame position, or approximate it for older artifacts
+                            if frame_idx < len(frame_timestamps):
+                                frame_timestamp = frame_timestamps[frame_idx]
+                            elif duration > 0 and len(frames_base64) > 1:
                                 frame_timestamp = (frame_idx / (len(frames_base64) - 1)) * duration
                             else:
                                 frame_timestamp = 0
@@ -167,10 +185,7 @@ class PretestService:
                                     },
                                     {
                                         "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{frame_base64}",
-                                            "detail": "high"
-                                        }
+                                        "image_url": image_part
                                     }
                                 ]
                             })
@@ -196,46 +211,48 @@ class PretestService:
             
             logger.info(f"Sending request to OpenAI with {len(messages)} messages (including video frames)")
             
+            metrics.record("prompt_build", time.perf_counter() - prompt_started)
+
             # Call OpenAI API
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.openai_client.chat.completions.create(
-                    model="gpt-4o",  # gpt-4o supports vision
-                    messages=messages,
-                    max_tokens=7000,
-                    temperature=0.3,
-                    response_format={"type": "json_object"}
+            completion_request = {
+                "model": "gpt-4o",  # gpt-4o supports vision
+                "messages": messages,
+                "max_tokens": 7000,
+                "temperature": 0.3,
+                "response_format": {"type": "json_object"}
+            }
+
+            if on_section is not None:
+                message_content = await self._stream_campaign_analysis(completion_request, user_tier, on_section)
+            else:
+                response = await llm_gateway.chat(
+                    "pretest.multi_asset_campaign",
+                    cache=True,
+                    cache_tier=user_tier,
+                    **completion_request
                 )
-            )
-        
-            if not response or not response.choices:
-                logger.error("Empty response from OpenAI API")
-                return self._get_error_response(user_tier, include_creative_director)
             
-            message = response.choices[0].message
-            
-            if message.refusal:
-                logger.error(f"OpenAI API refused the request: {message.refusal}")
-                return self._get_error_response(user_tier, include_creative_director)
-            
-            message_content = message.content
+                if not response or not response.choices:
+                    logger.error("Empty response from OpenAI API")
+                    return self._get_error_response(user_tier, include_creative_director)
+                
+                message = response.choices[0].message
+                
+                if message.refusal:
+                    logger.error(f"OpenAI API refused the request: {message.refusal}")
+                    return self._get_error_response(user_tier, include_creative_director)
+                
+                message_content = message.content
+
             if message_content is None:
                 logger.error("API returned None content")
                 return self._get_error_response(user_tier, include_creative_director)
             
+            validation_started = time.perf_counter()
             ai_response = message_content.strip()
             
             try:
-                parsed_json = json.loads(ai_response)
-                def normalize_keys(obj):
-                    if isinstance(obj, dict):
-                        return {k.lower().replace('-', '_'): normalize_keys(v) for k, v in obj.items()}
-                    elif isinstance(obj, list):
-                        return [normalize_keys(item) for item in obj]
-                    return obj
-                
-                parsed_json = normalize_keys(parsed_json)
+                parsed_json = self._normalize_keys(json.loads(ai_response))
                 
             except json.JSONDecodeError as je:
                 logger.error(f"JSON parse error: {str(je)}")
@@ -311,6 +328,7 @@ class PretestService:
                 else:
                     result["creative_director_analysis"] = parsed_json["creative_director_analysis"]
             
+            metrics.record("validation", time.perf_counter() - validation_started)
             return result
             
         except Exception as e:
@@ -318,6 +336,37 @@ class PretestService:
             return self._get_error_response(user_tier, include_creative_director)
 
 
+    async def _stream_campaign_analysis(self, completion_request: dict, user_tier: str, on_section) -> Optional[str]:
+        """
+        Stream the campaign analysis and hand each top-level section to await on_section(key, value)
+        as soon as the model closes it. Returns the full response text for the regular
+        parse / validation path, or None when nothing was generated.
+        """
+        parser = TopLevelSectionParser()
+        parts = []
+        async for delta in llm_gateway.chat_stream(
+            "pretest.multi_asset_campaign",
+            cache=True,
+            cache_tier=user_tier,
+            **completion_request
+        ):
+            parts.append(delta)
+            for key, value in parser.feed(delta):
+                try:
+                    await on_section(key.lower().replace('-', '_'), self._normalize_keys(value))
+                except Exception as e:
+                    logger.warning(f"Failed to publish streamed section {key}: {str(e)}")
+        logger.info(f"Streamed {parser.sections_emitted} analysis sections")
+        return "".join(parts) or None
+
+    @staticmethod
+    def _normalize_keys(obj):
+        if isinstance(obj, dict):
+            return {k.lower().replace('-', '_'): PretestService._normalize_keys(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [PretestService._normalize_keys(item) for item in obj]
+        return obj
+
     def _get_error_response(self, user_tier: str, include_creative_director: bool) -> dict:
         """Return a structured error response"""
         base_response = {
@@ -393,101 +442,69 @@ class PretestService:
     def _extract_video_metadata(self, video_path: str) -> dict:
         """Extract video metadata including duration"""
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                logger.error(f"Could not open video: {video_path}")
-                return {"duration_seconds": 0, "fps": 0, "total_frames": 0}
-            
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            duration = total_frames / fps if fps > 0 else 0
-            
-            cap.release()
-            
-            logger.info(f"Video metadata: {duration}s, {fps} fps, {total_frames} frames")
-            
-            return {
-                "duration_seconds": round(duration, 2),
-                "fps": round(fps, 2),
-                "total_frames": total_frames
-            }
+            metadata = media_worker.probe(video_path)
+            logger.info(f"Video metadata: {metadata['duration_seconds']}s, {metadata['fps']} fps, {metadata['total_frames']} frames")
+            return metadata
         except Exception as e:
             logger.error(f"Error extracting video metadata: {str(e)}")
-            return {"duration_seconds": 0, "fps": 0, "total_frames": 0}
+            return dict(frame_decoder.EMPTY_METADATA)
 
     def _extract_frames_with_base64(self, video_path: str, max_frames: int = 8) -> Tuple[List[str], dict]:
         """
         Extract frames and return as base64 strings immediately
-        This avoids the tempfile cleanup issue
+        Most distinct, non-degenerate frames, encoded in memory
         """
         try:
-            # Extract metadata
-            metadata = self._extract_video_metadata(video_path)
-            
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                logger.error("Could not open video for frame extraction")
-                return [], metadata
-            
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if total_frames <= 0:
-                cap.release()
-                logger.error("Video has no frames")
-                return [], metadata
-            
-            # Calculate frame indices
-            frame_indices = np.linspace(0, total_frames - 1, max_frames, dtype=int)
-            
-            frames_base64 = []
-            for i, frame_idx in enumerate(frame_indices):
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
-                
-                if ret:
-                    # Encode frame to JPEG in memory
-                    success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    
-                    if success:
-                        # Convert to base64 immediately
-                        frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                        frames_base64.append(frame_base64)
-                        logger.debug(f"Encoded frame {i+1}/{max_frames} ({len(frame_base64)} chars)")
-                    else:
-                        logger.warning(f"Failed to encode frame {i+1}")
-                else:
-                    logger.warning(f"Failed to read frame at index {frame_idx}")
-            
-            cap.release()
+            with metrics.span("frame_extraction"):
+                frames_base64, metadata = media_worker.extract_frames(
+                    video_path, max_frames=max_frames, jpeg_quality=70
+                )
+            if not frames_base64:
+                logger.error("No frames decoded from video")
             
             logger.info(f"Successfully extracted and encoded {len(frames_base64)} frames")
             return frames_base64, metadata
             
         except Exception as e:
             logger.error(f"Error extracting frames: {str(e)}", exc_info=True)
-            return [], {"duration_seconds": 0, "fps": 0, "total_frames": 0}
+            return [], dict(frame_decoder.EMPTY_METADATA)
 
-    def _process_video(self, video_url: str) -> Tuple[str, List[str], dict]:
+    def _process_video(self, video_url: str, asset_id=None) -> Tuple[str, List[str], dict]:
         """
-        Process video: download, extract transcript, extract frames as base64
+        Process video: download (or stream), extract transcript, extract frames as base64
         Returns: (transcript, frames_base64_list, metadata)
         """
         try:
             with tempfile.TemporaryDirectory() as temp_dir:
-                # Download video
-                video_path = self._download_video(video_url, temp_dir)
+                video_path, audio_path, content_hash = self._locate_video(video_url, temp_dir)
                 if not video_path:
                     logger.error("Video download failed")
                     return "", [], {"duration_seconds": 0, "fps": 0, "total_frames": 0}
                 
-                logger.info(f"Video downloaded to {video_path}")
+                logger.info(f"Reading video from {video_path}")
+                
+                if not range_fetch.is_remote(video_path):
+                    try:
+                        transcript, frames_base64, metadata = self._ingest_local_video(video_path, asset_id, content_hash, temp_dir)
+                        logger.info(f"Video processed: transcript={len(transcript)} chars, "
+                                  f"frames={len(frames_base64)}, duration={metadata.get('duration_seconds')}s")
+                        return transcript, frames_base64, metadata
+                    except Exception as e:
+                        logger.warning(f"Single-pass ingest failed, extracting audio and frames separately: {str(e)}")
                 
-                # Process in parallel
+                # Streamed sources (or a failed ingest): seek to the sampled frames and extract
+                # the audio in parallel, reusing stored artifacts for unchanged content
                 with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
                     transcript_future = executor.submit(
-                        self._extract_and_transcribe, video_path, temp_dir
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "pretest_transcript", EXTRACTOR_VERSIONS["transcript"],
+                        lambda: self._extract_and_transcribe(audio_path, temp_dir)
                     )
                     frames_future = executor.submit(
-                        self._extract_frames_with_base64, video_path, max_frames=8
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "pretest_frames", EXTRACTOR_VERSIONS["frames"],
+                        lambda: self._extract_frames_with_base64(video_path, max_frames=8),
+                        lambda result: bool(result[0])
                     )
                     
                     transcript = transcript_future.result()
@@ -502,11 +519,66 @@ class PretestService:
             logger.error(f"Error processing video: {str(e)}", exc_info=True)
             return "", [], {"duration_seconds": 0, "fps": 0, "total_frames": 0}
 
+    def _ingest_local_video(self, video_path: str, asset_id, content_hash: str, temp_dir: str) -> Tuple[str, List[str], dict]:
+        """
+        Transcript, frames and metadata of a downloaded video from one ffmpeg pass
+        (see media_worker.ingest_video). Whisper starts as soon as the audio track is written,
+        while frames are still being selected. Stored artifacts skip the work they cover.
+        """
+        transcript = artifact_store.lookup(asset_id, content_hash, "pretest_transcript", EXTRACTOR_VERSIONS["transcript"])
+        frames_artifact = artifact_store.lookup(asset_id, content_hash, "pretest_frames", EXTRACTOR_VERSIONS["frames"])
+        if transcript is not None and frames_artifact:
+            return transcript, frames_artifact[0], frames_artifact[1]
+        if frames_artifact:
+            # Frames are stored; only the audio is missing
+            transcript = self._extract_and_transcribe(video_path, temp_dir)
+            if transcript:
+                artifact_store.save(asset_id, content_hash, "pretest_transcript", EXTRACTOR_VERSIONS["transcript"], transcript)
+            return transcript, frames_artifact[0], frames_artifact[1]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as whisper_executor:
+            transcript_futures = []
+            with metrics.span("ingest"):
+                frames_base64, metadata = media_worker.ingest_video(
+                    video_path,
+                    audio_path=os.path.join(temp_dir, "audio.mp3") if transcript is None else None,
+                    max_frames=8,
+                    on_audio=lambda audio_path: transcript_futures.append(
+                        whisper_executor.submit(metrics.bind(self._transcribe_audio_sync), audio_path, temp_dir)
+                    ),
+                )
+            if frames_base64:
+                artifact_store.save(asset_id, content_hash, "pretest_frames", EXTRACTOR_VERSIONS["frames"], [frames_base64, metadata])
+            if transcript is None:
+                transcript = transcript_futures[0].result() if transcript_futures else ""
+                if transcript:
+                    artifact_store.save(asset_id, content_hash, "pretest_transcript", EXTRACTOR_VERSIONS["transcript"], transcript)
+        return transcript, frames_base64, metadata
+
+    def _locate_video(self, video_url: str, temp_dir: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        Where to read the video and its audio from, plus the content key for the artifact store.
+        Sources that are not cached yet and support HTTP Range requests are streamed
+        (index + sampled GOPs + audio) instead of downloaded in full.
+        """
+        if not media_cache.lookup(video_url, VIDEO_FORMAT):
+            with metrics.span("probe"):
+                source = range_fetch.resolve(video_url, VIDEO_FORMAT)
+            if source:
+                return source["video_url"], source["audio_url"], source["content_key"]
+        
+        with metrics.span("download"):
+            video_path = self._download_video(video_url, temp_dir)
+        if not video_path:
+            return None, None, None
+        return video_path, video_path, media_cache.digest_for(video_path)
+
     async def _process_single_asset(self, index: int, asset: dict) -> Optional[dict]:
         """Process a single asset asynchronously"""
         try:
             asset_type = asset.get("type", "").lower()
             asset_id = asset.get("id")
+            metrics.set_asset_type(asset_type or "unknown")
             
             if asset_type == "text":
                 return {
@@ -522,13 +594,13 @@ class PretestService:
                 if not file_url:
                     return None
                 
-                image_content = await self._download_image_content_async(file_url)
-                if image_content:
+                image_blob = await self._download_image_content_async(file_url)
+                if image_blob:
                     return {
                         "asset_type": "image",
                         "asset_id": asset_id,
                         "index": index,
-                        "content": image_content,
+                        "image_blob": image_blob,
                         "url": file_url
                     }
                     
@@ -542,7 +614,7 @@ class PretestService:
                 
                 loop = asyncio.get_event_loop()
                 transcript, frames_base64, metadata = await loop.run_in_executor(
-                    self.executor, self._process_video, file_url
+                    self.executor, metrics.bind(self._process_video), file_url, asset_id
                 )
                 
                 duration = metadata.get("duration_seconds", 0)
@@ -559,6 +631,7 @@ class PretestService:
                     "frames_base64": frames_base64,  # Now base64 strings, not file paths
                     "duration_seconds": duration,
                     "fps": metadata.get("fps", 0),
+                    "frame_timestamps": metadata.get("frame_timestamps", []),
                     "total_frames": metadata.get("total_frames", 0),
                     "url": file_url
                 }
@@ -570,7 +643,7 @@ class PretestService:
                 
                 loop = asyncio.get_event_loop()
                 audio_analysis = await loop.run_in_executor(
-                    self.executor, self._process_audio_sync, file_url
+                    self.executor, metrics.bind(self._process_audio_sync), file_url, asset_id
                 )
                 return {
                     "asset_type": "audio",
@@ -587,8 +660,12 @@ class PretestService:
             logger.error(f"Error processing asset {index} (type: {asset.get('type')}): {str(e)}", exc_info=True)
             return None
           
-    async def create_pretest(self, user_id: str, request_data: dict, user_tier) -> dict:
-        """Create and run a pretest analysis with parallel processing for multiple assets"""
+    async def create_pretest(self, user_id: str, request_data: dict, user_tier,
+                             on_section: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> dict:
+        """
+        Create and run a pretest analysis with parallel processing for multiple assets.
+        on_section receives analysis sections while the model is still generating.
+        """
         try:
             start_time = datetime.now()
             pretest_id = str(uuid.uuid4())
@@ -596,7 +673,7 @@ class PretestService:
             request_data["user_tier"] = user_tier
             print("request body", request_data["project"])
             project = request_data["project"]
-            analysis_result = await self._generate_multi_asset_analysis_parallel(request_data, project)
+            analysis_result = await self._generate_multi_asset_analysis_parallel(request_data, project, on_section)
             
             processing_time = (datetime.now() - start_time).total_seconds()
             
@@ -644,7 +721,8 @@ class PretestService:
             logger.error(f"Error in create_pretest: {str(e)}")
             raise e
     
-    async def _generate_multi_asset_analysis_parallel(self, request_data: dict, project : dict) -> dict:
+    async def _generate_multi_asset_analysis_parallel(self, request_data: dict, project : dict,
+                                                      on_section: Optional[Callable[[str, Any], Awaitable[None]]] = None) -> dict:
         """Generate AI analysis with parallel processing - OPTIMIZED"""
         try:
             persona = request_data.get("persona", {})
@@ -652,6 +730,7 @@ class PretestService:
             request_body = request_data.get("request_body", {})
             
             request_body["user_tier"] = request_data.get("user_tier", "free")
+            await areport_stage("processing_media")
             asset_tasks = [self._process_single_asset(i, asset) for i, asset in enumerate(creative_assets)]
             processed_results = await asyncio.gather(*asset_tasks, return_exceptions=True)
             processed_content = {
@@ -675,11 +754,13 @@ class PretestService:
                        f"{len(processed_content['video_assets'])} videos, "
                        f"{len(processed_content['audio_assets'])} audio")
             print("type of project", type(project))
+            await areport_stage("analyzing")
             return await self._analyze_multi_asset_campaign(
                 persona=persona,
                 creative_assets=processed_content,
                 request_body=request_body,
-                project=project
+                project=project,
+                on_section=on_section
             )
             
         except Exception as e:
@@ -1205,54 +1286,72 @@ class PretestService:
 
         return prompt
 
-    async def _download_image_content_async(self, image_url: str) -> Optional[dict]:
-        """Returns dict with 'content' and 'mime_type'"""
+    async def _prepare_image_parts(self, creative_assets: dict, user_tier: str) -> dict:
+        """
+        image_url payloads keyed by ("image", idx) / ("frame", video_idx, frame_idx), resized and
+        re-encoded with their detail level chosen within the tier's image-token budget
+        """
+        keys, images, priorities = [], [], []
+        for idx, img_asset in enumerate(creative_assets.get("image_assets", [])):
+            if img_asset.get("image_blob"):
+                keys.append(("image", idx))
+                images.append(img_asset["image_blob"])
+                priorities.append(image_budget.PRIORITY_IMAGE)
+        video_seconds = 0.0
+        for video_idx, video_asset in enumerate(creative_assets.get("video_assets", [])):
+            video_seconds += video_asset.get("duration_seconds") or 0
+            for frame_idx, frame_base64 in enumerate(video_asset.get("frames_base64", [])):
+                keys.append(("frame", video_idx, frame_idx))
+                images.append(frame_base64)
+                priorities.append(image_budget.PRIORITY_FRAME)
+        if not images:
+            return {}
+
+        asset_count = sum(len(assets) for assets in creative_assets.values())
+        loop = asyncio.get_event_loop()
+        parts = await loop.run_in_executor(
+            self.executor, metrics.bind(image_budget.prepare_images),
+            images, priorities, user_tier, asset_count, video_seconds
+        )
+        return dict(zip(keys, parts))
+
+    async def _download_image_content_async(self, image_url: str) -> Optional[Blob]:
+        """The downloaded image, unencoded; resizing and encoding happen in _prepare_image_parts"""
         try:
             loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                self.executor, self._download_image_sync, image_url
-            )
-            if response:
-                content, mime_type = response
-                encoded = base64.b64encode(content).decode('utf-8')
-                return {"content": encoded, "mime_type": mime_type}
-            return None
+            with metrics.span("download"):
+                content = await loop.run_in_executor(
+                    self.executor, metrics.bind(self._download_image_sync), image_url
+                )
+            return content or None
         except Exception as e:
             logger.error(f"Error downloading image: {e}")
             return None
 
-    def _download_image_sync(self, image_url: str) -> Optional[Tuple[bytes, str]]:
-        """Returns (content, mime_type)"""
-        response = self.session.get(image_url, timeout=15)
-        response.raise_for_status()
-        
-        content_type = response.headers.get('content-type', 'image/jpeg')
-        
-        # Resize if too large
-        content = response.content
-        if len(content) > 15 * 1024 * 1024:  # 15MB
-            from PIL import Image
-            from io import BytesIO
-            
-            img = Image.open(BytesIO(content))
-            img.thumbnail((2048, 2048))  # Max dimension
-            
-            buffer = BytesIO()
-            img.save(buffer, format='JPEG', quality=85)
-            content = buffer.getvalue()
-            content_type = 'image/jpeg'
-        
-        return content, content_type
-    def _process_audio_sync(self, audio_url: str) -> dict:
+    def _download_image_sync(self, image_url: str) -> Optional[Blob]:
+        image_path, content_type = media_cache.fetch_http(image_url, session=self.session, timeout=15)
+        return Blob.from_file(image_path, content_type or 'image/jpeg')
+    def _process_audio_sync(self, audio_url: str, asset_id=None) -> dict:
         """Synchronous audio processing - OPTIMIZED"""
         try:
             with tempfile.TemporaryDirectory() as temp_dir:
-                audio_path = self._download_audio(audio_url, temp_dir)
+                with metrics.span("download"):
+                    audio_path = self._download_audio(audio_url, temp_dir)
                 if not audio_path:
                     return {"transcript": "", "acoustic_features": {}}
+                content_hash = media_cache.digest_for(audio_path)
                 with concurrent.futures.ThreadPoolExecutor(max_workers=2) as local_executor:
-                    transcript_future = local_executor.submit(self._transcribe_audio_sync, audio_path)
-                    acoustic_future = local_executor.submit(self._analyze_audio_acoustics_optimized, audio_path)
+                    transcript_future = local_executor.submit(
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "pretest_transcript", EXTRACTOR_VERSIONS["transcript"],
+                        lambda: self._transcribe_audio_sync(audio_path)
+                    )
+                    acoustic_future = local_executor.submit(
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "pretest_acoustics", EXTRACTOR_VERSIONS["acoustics"],
+                        lambda: self._analyze_audio_acoustics_optimized(audio_path),
+                        lambda features: features.get("duration_seconds", 0) > 0
+                    )
                     
                     transcript = transcript_future.result()
                     acoustic_features = acoustic_future.result()
@@ -1265,166 +1364,74 @@ class PretestService:
             logger.error(f"Error processing audio: {str(e)}")
             return {"transcript": "", "acoustic_features": {}}
 
-    def _transcribe_audio_sync(self, audio_path: str) -> str:
-        """Synchronous audio transcription"""
+    def _transcribe_audio_sync(self, audio_path: str, temp_dir: Optional[str] = None) -> str:
+        """Synchronous audio transcription (chunked and parallel for long audio)"""
         try:
-            with open(audio_path, "rb") as f:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=f
-                )
-            return transcript.text
+            with metrics.span("whisper"):
+                return transcription.transcribe(self.openai_client, audio_path, temp_dir)["text"]
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
             return ""
 
-    @lru_cache(maxsize=128)
     def _analyze_audio_acoustics_optimized(self, audio_path: str) -> dict:
-        """Optimized acoustic analysis with caching"""
+        """Acoustic analysis in the media worker process pool (results are persisted by the artifact store)"""
         try:
-            y, sr = librosa.load(audio_path, sr=16000, mono=True)
-            duration = len(y) / sr
-            
-            features = {
-                "duration_seconds": float(duration),
-                "sample_rate": int(sr),
-                "total_samples": len(y)
-            }
-            
-            try:
-                hop_length = 2048
-                tempo, _ = librosa.beat.beat_track(y=y, sr=sr, hop_length=hop_length)
-                features["tempo_bpm"] = float(tempo)
-                
-                rms = librosa.feature.rms(y=y, hop_length=hop_length)[0]
-                features["average_energy"] = float(np.mean(rms))
-                features["energy_variance"] = float(np.var(rms))
-                
-                spectral_centroids = librosa.feature.spectral_centroid(
-                    y=y, sr=sr, hop_length=hop_length
-                )[0]
-                features["spectral_centroid_mean"] = float(np.mean(spectral_centroids))
-                
-                zcr = librosa.feature.zero_crossing_rate(y, hop_length=hop_length)[0]
-                features["zero_crossing_rate"] = float(np.mean(zcr))
-                
-                energy_threshold = np.mean(rms) * 0.1
-                silent_frames = rms < energy_threshold
-                features["silence_ratio"] = float(np.mean(silent_frames))
-                
-                silence_changes = np.diff(silent_frames.astype(int))
-                features["estimated_pause_count"] = int(np.sum(silence_changes == 1))
-                
-            except Exception as feat_e:
-                logger.error(f"Error extracting features: {feat_e}")
-                default_features = {
-                    "tempo_bpm": 0, "average_energy": 0, "energy_variance": 0,
-                    "spectral_centroid_mean": 0, "zero_crossing_rate": 0,
-                    "silence_ratio": 0, "estimated_pause_count": 0
-                }
-                features.update(default_features)
-            
-            return features
-            
+            with metrics.span("acoustic_analysis"):
+                return media_worker.acoustic_features(audio_path)
         except Exception as e:
             logger.error(f"Error analyzing audio acoustics: {str(e)}")
-            return {
-                "duration_seconds": 0, "sample_rate": 0, "total_samples": 0,
-                "tempo_bpm": 0, "average_energy": 0, "energy_variance": 0,
-                "silence_ratio": 0, "estimated_pause_count": 0
-            }
+            return dict(acoustics.EMPTY_FEATURES)
 
-    def _extract_frames_optimized(self, video_path: str, temp_dir: str, max_frames: int = 10) -> List[str]:
-        """Optimized frame extraction - REDUCED frame count"""
-        try:
-            frames_dir = os.path.join(temp_dir, "frames")
-            os.makedirs(frames_dir, exist_ok=True)
-            
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                return []
-            
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if total_frames <= 0:
-                cap.release()
-                return []
-            frame_indices = np.linspace(0, total_frames - 1, max_frames, dtype=int)
-            
-            frames = []
-            for i, frame_idx in enumerate(frame_indices):
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
-                
-                if ret:
-                    frame_filename = os.path.join(frames_dir, f"frame_{i:03d}.jpg")
-                    success = cv2.imwrite(
-                        frame_filename, frame, 
-                        [cv2.IMWRITE_JPEG_QUALITY, 60]
-                    )
-                    
-                    if success and os.path.exists(frame_filename):
-                        frames.append(frame_filename)
-            
-            cap.release()
-            return frames
-            
-        except Exception as e:
-            logger.error(f"Error extracting frames: {str(e)}")
-            return []
-    
     def _download_audio(self, url: str, output_dir: str) -> Optional[str]:
         """Download audio file from URL - OPTIMIZED with session"""
         try:
-            response = self.session.get(url, timeout=20)
-            response.raise_for_status()
-            
-            content_type = response.headers.get('content-type', '')
-            if 'audio/mpeg' in content_type or 'audio/mp3' in content_type:
-                ext = 'mp3'
-            elif 'audio/wav' in content_type:
-                ext = 'wav'
-            elif 'audio/mp4' in content_type or 'audio/m4a' in content_type:
-                ext = 'm4a'
-            else:
-                ext = 'mp3'
-            
-            audio_path = os.path.join(output_dir, f"audio.{ext}")
-            with open(audio_path, 'wb') as f:
-                f.write(response.content)
+            audio_path, _ = media_cache.fetch_http(url, session=self.session, timeout=20, default_ext="mp3")
             
             return audio_path if os.path.exists(audio_path) else None
             
         except Exception as e:
             logger.error(f"Error downloading audio: {str(e)}")
             try:
-                output_template = os.path.join(output_dir, "audio.%(ext)s")
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'outtmpl': output_template,
-                    'extract_flat': False,
-                    'quiet': True,
-                    'no_warnings': True
-                }
-                
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    filename = ydl.prepare_filename(info)
-                    actual_filename = filename.replace('.%(ext)s', f".{info['ext']}")
-                    
-                    if os.path.exists(actual_filename):
-                        return actual_filename
-                        
-                return None
+                return media_cache.get_or_fetch(url, self._ytdlp_download_audio, variant="bestaudio/best")
             except Exception as fallback_e:
                 logger.error(f"Fallback audio download failed: {fallback_e}")
                 return None
 
+    def _ytdlp_download_audio(self, url: str, output_dir: str) -> Optional[str]:
+        """Fallback audio download through yt-dlp for non-direct URLs"""
+        output_template = os.path.join(output_dir, "audio.%(ext)s")
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'outtmpl': output_template,
+            'extract_flat': False,
+            'quiet': True,
+            'no_warnings': True
+        }
+        
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            filename = ydl.prepare_filename(info)
+            actual_filename = filename.replace('.%(ext)s', f".{info['ext']}")
+            
+            if os.path.exists(actual_filename):
+                return actual_filename
+                
+        return None
+
     def _download_video(self, url: str, output_dir: str) -> Optional[str]:
+        """Return a local path for the video, served from the shared media cache when possible"""
+        try:
+            return media_cache.get_or_fetch(url, self._ytdlp_download_video, variant=VIDEO_FORMAT)
+        except Exception as e:
+            logger.error(f"Error downloading video: {str(e)}")
+            return None
+
+    def _ytdlp_download_video(self, url: str, output_dir: str) -> Optional[str]:
         """Download video using yt-dlp - OPTIMIZED"""
         try:
             output_template = os.path.join(output_dir, "video.%(ext)s")
             ydl_opts = {
-                'format': 'best[ext=mp4]/best',
+                'format': VIDEO_FORMAT,
                 'outtmpl': output_template,
                 'quiet': True,
                 'no_warnings': True
@@ -1451,21 +1458,11 @@ class PretestService:
     def _extract_and_transcribe(self, video_path: str, temp_dir: str) -> str:
         """Extract audio and transcribe - OPTIMIZED"""
         try:
-            audio_path = os.path.join(temp_dir, "audio.wav")
-            (
-                ffmpeg
-                .input(video_path)
-                .output(audio_path, ac=1, ar=16000, **{'loglevel': 'error'})
-                .run(overwrite_output=True, quiet=True)
-            )
+            with metrics.span("audio_extraction"):
+                audio_path = media_worker.extract_audio(video_path, os.path.join(temp_dir, "audio.wav"))
             
             if os.path.exists(audio_path):
-                with open(audio_path, "rb") as f:
-                    transcript = self.openai_client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=f
-                    )
-                return transcript.text
+                return self._transcribe_audio_sync(audio_path, temp_dir)
             return ""
             
         except Exception as e:
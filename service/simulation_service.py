@@ -6,19 +6,33 @@ import logging
 from openai import OpenAI
 import os
 import base64
-import requests
-import cv2
-import ffmpeg
 import yt_dlp
 import tempfile
-import librosa
-import numpy as np
 import asyncio
+import time
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
+from app.helpers.media_cache import media_cache
+from app.helpers.artifact_store import artifact_store
+from app.helpers import range_fetch, transcription
+from app.helpers.media_worker import media_worker
+from app.helpers.llm_gateway import llm_gateway
+from app.helpers import image_budget, metrics
+from app.helpers.blob import Blob
+from app.service.job_queue import areport_stage
 
 logger = logging.getLogger(__name__)
 
+# yt-dlp format profile for video creatives (also part of the media cache key)
+VIDEO_FORMAT = 'worst[ext=mp4]/worst'
+
+# Bump a version when an extractor's output changes so stored artifacts are recomputed
+EXTRACTOR_VERSIONS = {
+    "frames": "2",
+    "transcript": "1",
+    "acoustics": "2",
+}
+
 
 class SimulationService:
     def __init__(self):
@@ -39,6 +53,7 @@ class SimulationService:
             else:
                 request_data = request
             
+            await areport_stage("processing_media")
             variant_a_task = self._process_variant_assets("variant_a", request_data['variant_a'])
             variant_b_task = self._process_variant_assets("variant_b", request_data['variant_b'])
             
@@ -54,6 +69,7 @@ class SimulationService:
                 logger.error(f"Variant B processing failed: {variant_b_data}")
                 raise Exception(f"Variant B processing failed: {variant_b_data}")
             
+            await areport_stage("analyzing")
             analysis_result = await self._generate_comparative_analysis(
                 variant_a_data, variant_b_data, request_data, user_tier
             )
@@ -112,20 +128,21 @@ class SimulationService:
         """Process a single creative asset"""
         try:
             asset_type = asset.get('type', '').upper()
+            metrics.set_asset_type(asset_type.lower() or "unknown")
             
             if asset_type == "IMAGE" and asset.get('file_url'):
-                image_content = await self._download_image_content_async(asset['file_url'])
+                image_blob = await self._download_image_content_async(asset['file_url'])
                 return {
                     "id": asset.get('id'),
                     "type": "image",
-                    "content": image_content,
+                    "image_blob": image_blob,
                     "url": asset['file_url']
                 }
                 
             elif asset_type == "VIDEO" and asset.get('file_url'):
                 loop = asyncio.get_event_loop()
                 transcript, sample_frames, duration = await loop.run_in_executor(
-                    self.executor, self._process_video_sync, asset['file_url']
+                    self.executor, metrics.bind(self._process_video_sync), asset['file_url'], asset.get('id')
                 )
                 return {
                     "id": asset.get('id'),
@@ -139,7 +156,7 @@ class SimulationService:
             elif asset_type == "AUDIO" and asset.get('file_url'):
                 loop = asyncio.get_event_loop()
                 audio_analysis = await loop.run_in_executor(
-                    self.executor, self._process_audio_sync, asset['file_url']
+                    self.executor, metrics.bind(self._process_audio_sync), asset['file_url'], asset.get('id')
                 )
                 return {
                     "id": asset.get('id'),
@@ -173,7 +190,8 @@ class SimulationService:
     ) -> Dict[str, Any]:
         """Generate AI-powered comparative analysis with 3 perspectives and extended metrics"""
         try:
-           
+            image_parts = await self._prepare_image_parts(variant_a, variant_b, user_tier)
+            prompt_started = time.perf_counter()
             prompt = self._build_comparative_prompt(variant_a, variant_b, user_tier, request_data)
             
             messages = [
@@ -200,44 +218,48 @@ Your analysis must:
                 {"role": "user", "content": prompt}
             ]
             
+            parts = iter(image_parts)
             for variant_name, variant_data in [("Variant A", variant_a), ("Variant B", variant_b)]:
                 for asset in variant_data.get("processed_assets", []):
-                    if asset.get("type") == "image" and asset.get("content"):
-                        messages.append({
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": f"Visual asset from {variant_name}:"},
-                                {"type": "image_url", "image_url": {
-                                    "url": f"data:image/jpeg;base64,{asset['content']}",
-                                    "detail": "high"
-                                }}
-                            ]
-                        })
-                    
-                    elif asset.get("type") == "video" and asset.get("sample_frames"):
-                        for idx, frame_base64 in enumerate(asset['sample_frames']):
+                    if asset.get("type") == "image" and asset.get("image_blob"):
+                        image_part = next(parts)
+                        if image_part:
                             messages.append({
                                 "role": "user",
                                 "content": [
-                                    {"type": "text", "text": f"Video frame {idx+1} from {variant_name}:"},
-                                    {"type": "image_url", "image_url": {
-                                        "url": f"data:image/jpeg;base64,{frame_base64}",
-                                        "detail": "low"
-                                    }}
+                                    {"type": "text", "text": f"Visual asset from {variant_name}:"},
+                                    {"type": "image_url", "image_url": image_part}
                                 ]
                             })
+                    
+                    elif asset.get("type") == "video" and asset.get("sample_frames"):
+                        for idx in range(len(asset['sample_frames'])):
+                            image_part = next(parts)
+                            if image_part:
+                                messages.append({
+                                    "role": "user",
+                                    "content": [
+                                        {"type": "text", "text": f"Video frame {idx+1} from {variant_name}:"},
+                                        {"type": "image_url", "image_url": image_part}
+                                    ]
+                                })
             
-            response = self.openai_client.chat.completions.create(
+            metrics.record("prompt_build", time.perf_counter() - prompt_started)
+            response = await llm_gateway.chat(
+                "simulation.comparative_analysis",
+                cache=True,
+                cache_tier=user_tier,
                 model="gpt-4o",
                 messages=messages,
                 response_format={"type": "json_object"}
             )
             
-            ai_response = response.choices[0].message.content.strip()
-            parsed_json = json.loads(ai_response)
-            print("AI Response JSON:", parsed_json)
-            
-            return self._validate_response(parsed_json, user_tier)
+            with metrics.span("validation"):
+                ai_response = response.choices[0].message.content.strip()
+                parsed_json = json.loads(ai_response)
+                print("AI Response JSON:", parsed_json)
+                
+                return self._validate_response(parsed_json, user_tier)
             
         except Exception as e:
             logger.error(f"Error in comparative analysis: {str(e)}")
@@ -749,38 +771,71 @@ Your analysis must:
         
         return parsed_json
     
-    async def _download_image_content_async(self, image_url: str) -> Optional[str]:
+    async def _prepare_image_parts(self, variant_a: Dict[str, Any], variant_b: Dict[str, Any], user_tier: str) -> List[Optional[dict]]:
+        """
+        image_url payloads for every image and video frame of both variants, in message order,
+        resized and re-encoded with their detail level chosen within the tier's image-token budget
+        """
+        images, priorities = [], []
+        asset_count, video_seconds = 0, 0.0
+        for variant_data in (variant_a, variant_b):
+            for asset in variant_data.get("processed_assets", []):
+                asset_count += 1
+                if asset.get("type") == "image" and asset.get("image_blob"):
+                    images.append(asset["image_blob"])
+                    priorities.append(image_budget.PRIORITY_IMAGE)
+                elif asset.get("type") == "video" and asset.get("sample_frames"):
+                    video_seconds += asset.get("duration_seconds") or 0
+                    images.extend(asset["sample_frames"])
+                    priorities.extend([image_budget.PRIORITY_FRAME] * len(asset["sample_frames"]))
+        if not images:
+            return []
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, metrics.bind(image_budget.prepare_images),
+            images, priorities, user_tier, asset_count, video_seconds
+        )
+
+    async def _download_image_content_async(self, image_url: str) -> Optional[Blob]:
         try:
             loop = asyncio.get_event_loop()
-            content = await loop.run_in_executor(
-                self.executor, self._download_image_sync, image_url
-            )
-            if content:
-                return base64.b64encode(content).decode('utf-8')
-            return None
+            with metrics.span("download"):
+                content = await loop.run_in_executor(
+                    self.executor, metrics.bind(self._download_image_sync), image_url
+                )
+            return content or None
         except Exception as e:
             logger.error(f"Error downloading image from {image_url}: {str(e)}")
             raise e
 
-    def _download_image_sync(self, image_url: str) -> Optional[bytes]:
+    def _download_image_sync(self, image_url: str) -> Optional[Blob]:
         try:
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
-            return response.content
+            image_path, content_type = media_cache.fetch_http(image_url, timeout=30)
+            return Blob.from_file(image_path, content_type or "image/jpeg")
         except Exception as e:
             logger.error(f"Sync download failed for {image_url}: {str(e)}")
             raise e
 
-    def _process_audio_sync(self, audio_url: str) -> dict:
+    def _process_audio_sync(self, audio_url: str, asset_id=None) -> dict:
         try:
             with tempfile.TemporaryDirectory() as temp_dir:
-                audio_path = self._download_audio(audio_url, temp_dir)
+                with metrics.span("download"):
+                    audio_path = self._download_audio(audio_url, temp_dir)
                 if not audio_path:
                     raise Exception("Failed to download audio")
                 
+                content_hash = media_cache.digest_for(audio_path)
                 with concurrent.futures.ThreadPoolExecutor(max_workers=2) as local_executor:
-                    transcript_future = local_executor.submit(self._transcribe_audio_sync, audio_path)
-                    acoustic_future = local_executor.submit(self._analyze_audio_acoustics, audio_path)
+                    transcript_future = local_executor.submit(
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "simulation_transcript", EXTRACTOR_VERSIONS["transcript"],
+                        lambda: self._transcribe_audio_sync(audio_path)
+                    )
+                    acoustic_future = local_executor.submit(
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "simulation_acoustics", EXTRACTOR_VERSIONS["acoustics"],
+                        lambda: self._analyze_audio_acoustics(audio_path)
+                    )
                     
                     transcript = transcript_future.result()
                     acoustic_features = acoustic_future.result()
@@ -793,74 +848,147 @@ Your analysis must:
             logger.error(f"Error processing audio: {str(e)}")
             raise e
 
-    def _transcribe_audio_sync(self, audio_path: str) -> str:
+    def _transcribe_audio_sync(self, audio_path: str, temp_dir: Optional[str] = None) -> str:
         try:
-            with open(audio_path, "rb") as f:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=f
-                )
-            return transcript.text
+            with metrics.span("whisper"):
+                return transcription.transcribe(self.openai_client, audio_path, temp_dir)["text"]
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
             raise e
 
     def _analyze_audio_acoustics(self, audio_path: str) -> dict:
         try:
-            y, sr = librosa.load(audio_path, sr=22050, mono=True)
-            duration = len(y) / sr
-            
-            return {
-                "duration_seconds": float(duration),
-                "sample_rate": int(sr),
-                "average_energy": float(np.mean(librosa.feature.rms(y=y)[0]))
-            }
+            with metrics.span("acoustic_analysis"):
+                return media_worker.acoustic_features(audio_path)
         except Exception as e:
             logger.error(f"Error analyzing audio acoustics: {str(e)}")
             raise e
 
-    def _process_video_sync(self, video_url: str) -> tuple:
+    def _process_video_sync(self, video_url: str, asset_id=None) -> tuple:
         """OPTIMIZED: Process video with smart frame sampling"""
         try:
             with tempfile.TemporaryDirectory() as temp_dir:
-                video_path = self._download_video(video_url, temp_dir)
+                video_path, audio_path, content_hash = self._locate_video(video_url, temp_dir)
                 if not video_path:
                     raise Exception("Failed to download video")
                 
-                # Get video duration
-                cap = cv2.VideoCapture(video_path)
-                if not cap.isOpened():
-                    raise Exception("Cannot open video file for duration check")
-                
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                duration = frame_count / fps if fps > 0 else 0
-                cap.release()
+                if not range_fetch.is_remote(video_path):
+                    try:
+                        return self._ingest_local_video(video_path, asset_id, content_hash, temp_dir)
+                    except Exception as e:
+                        logger.warning(f"Single-pass ingest failed, extracting audio and frames separately: {str(e)}")
                 
-                # Process audio extraction and transcription in parallel with frame extraction
+                # Streamed sources (or a failed ingest): audio extraction and transcription in parallel
+                # with frame extraction, reusing stored artifacts for unchanged content
                 with concurrent.futures.ThreadPoolExecutor(max_workers=2) as local_executor:
                     transcript_future = local_executor.submit(
-                        self._extract_and_transcribe, video_path, temp_dir
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "simulation_transcript", EXTRACTOR_VERSIONS["transcript"],
+                        lambda: self._extract_and_transcribe(audio_path, temp_dir)
                     )
                     frames_future = local_executor.submit(
-                        self._extract_smart_frames, video_path, max_frames=5
+                        metrics.bind(artifact_store.get_or_compute),
+                        asset_id, content_hash, "simulation_frames", EXTRACTOR_VERSIONS["frames"],
+                        lambda: self._extract_frames_and_duration(video_path),
+                        lambda result: bool(result["frames"])
                     )
                     
                     transcript = transcript_future.result()
-                    sample_frames = frames_future.result()
+                    frames_artifact = frames_future.result()
                 
-                return transcript, sample_frames, duration
+                return transcript, frames_artifact["frames"], frames_artifact["duration_seconds"]
         except Exception as e:
             logger.error(f"Error processing video: {str(e)}")
             raise e
+
+    def _ingest_local_video(self, video_path: str, asset_id, content_hash: str, temp_dir: str) -> tuple:
+        """
+        (transcript, frames, duration) of a downloaded video from one ffmpeg pass
+        (see media_worker.ingest_video). Whisper starts as soon as the audio track is written,
+        while frames are still being selected. Stored artifacts skip the work they cover.
+        """
+        transcript = artifact_store.lookup(asset_id, content_hash, "simulation_transcript", EXTRACTOR_VERSIONS["transcript"])
+        frames_artifact = artifact_store.lookup(asset_id, content_hash, "simulation_frames", EXTRACTOR_VERSIONS["frames"])
+        if transcript is not None and frames_artifact:
+            return transcript, frames_artifact["frames"], frames_artifact["duration_seconds"]
+        if frames_artifact:
+            # Frames are stored; only the audio is missing
+            transcript = self._extract_and_transcribe(video_path, temp_dir)
+            if transcript:
+                artifact_store.save(asset_id, content_hash, "simulation_transcript", EXTRACTOR_VERSIONS["transcript"], transcript)
+            return transcript, frames_artifact["frames"], frames_artifact["duration_seconds"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as whisper_executor:
+            transcript_futures = []
+            with metrics.span("ingest"):
+                sample_frames, metadata = media_worker.ingest_video(
+                    video_path,
+                    audio_path=os.path.join(temp_dir, "audio.mp3") if transcript is None else None,
+                    max_frames=5,
+                    max_width=800,
+                    on_audio=lambda audio_path: transcript_futures.append(
+                        whisper_executor.submit(metrics.bind(self._transcribe_audio_sync), audio_path, temp_dir)
+                    ),
+                )
+            logger.info(f"Extracted {len(sample_frames)} representative frames from video")
+            if sample_frames:
+                artifact_store.save(asset_id, content_hash, "simulation_frames", EXTRACTOR_VERSIONS["frames"], {
+                    "frames": sample_frames,
+                    "duration_seconds": metadata["duration_seconds"]
+                })
+            if transcript is None:
+                transcript = ""
+                if transcript_futures:
+                    try:
+                        transcript = transcript_futures[0].result()
+                    except Exception:
+                        logger.warning("Returning empty transcript due to error")
+                if transcript:
+                    artifact_store.save(asset_id, content_hash, "simulation_transcript", EXTRACTOR_VERSIONS["transcript"], transcript)
+        return transcript, sample_frames, metadata["duration_seconds"]
+
+    def _locate_video(self, video_url: str, temp_dir: str) -> tuple:
+        """
+        (video path or URL, audio path or URL, content key) for a video creative.
+        Sources that are not cached yet and support HTTP Range requests are streamed
+        (index + sampled GOPs + audio) instead of downloaded in full.
+        """
+        if not media_cache.lookup(video_url, VIDEO_FORMAT):
+            with metrics.span("probe"):
+                source = range_fetch.resolve(video_url, VIDEO_FORMAT)
+            if source:
+                return source["video_url"], source["audio_url"], source["content_key"]
+        
+        with metrics.span("download"):
+            video_path = self._download_video(video_url, temp_dir)
+        if not video_path:
+            return None, None, None
+        return video_path, video_path, media_cache.digest_for(video_path)
+
+    def _extract_frames_and_duration(self, video_path: str) -> dict:
+        """Video duration plus the most distinct frames, stored together as one artifact"""
+        with metrics.span("frame_extraction"):
+            sample_frames, metadata = media_worker.extract_frames(
+                video_path, max_frames=5, max_width=800, jpeg_quality=70
+            )
+        logger.info(f"Extracted {len(sample_frames)} representative frames from video")
+        return {
+            "frames": sample_frames,
+            "duration_seconds": metadata["duration_seconds"]
+        }
+
     def _download_video(self, url: str, output_dir: str) -> Optional[str]:
+        """Return a local path for the video, served from the shared media cache when possible"""
+        return media_cache.get_or_fetch(url, self._ytdlp_download_video, variant=VIDEO_FORMAT)
+
+    def _ytdlp_download_video(self, url: str, output_dir: str) -> Optional[str]:
         """OPTIMIZED: Faster video download with better format selection"""
         try:
             output_template = os.path.join(output_dir, "video.%(ext)s")
 
             ydl_opts = {
                 # Prioritize formats with lower file size for faster download
-                'format': 'worst[ext=mp4]/worst',  # Use lower quality for faster processing
+                'format': VIDEO_FORMAT,  # Use lower quality for faster processing
                 'outtmpl': output_template,
                 'merge_output_format': 'mp4',
                 'quiet': True,  # Reduce logging overhead
@@ -899,21 +1027,7 @@ Your analysis must:
 
     def _download_audio(self, url: str, output_dir: str) -> Optional[str]:
         try:
-            response = requests.get(url, timeout=30, stream=True)
-            response.raise_for_status()
-            
-            content_type = response.headers.get('content-type', '')
-            if 'audio/mpeg' in content_type:
-                ext = 'mp3'
-            elif 'audio/wav' in content_type:
-                ext = 'wav'
-            else:
-                ext = 'mp3'
-            
-            audio_path = os.path.join(output_dir, f"audio.{ext}")
-            with open(audio_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            audio_path, _ = media_cache.fetch_http(url, timeout=30, default_ext="mp3")
             
             if os.path.exists(audio_path):
                 return audio_path
@@ -925,115 +1039,23 @@ Your analysis must:
 
     def _extract_and_transcribe(self, video_path: str, temp_dir: str) -> str:
         """
-        OPTIMIZED: Extract audio and transcribe with chunking for large files
-        Whisper API has a 25MB file size limit
+        OPTIMIZED: Extract audio and transcribe; long files are chunked on pauses
+        and transcribed in parallel (Whisper API has a 25MB file size limit)
         """
         try:
-            audio_path = os.path.join(temp_dir, "audio.mp3")
-            (
-                ffmpeg
-                .input(video_path)
-                .output(
-                    audio_path, 
-                    ac=1,  # Mono
-                    ar=16000,  # 16kHz sample rate
-                    audio_bitrate='64k',  # Compressed bitrate
-                    format='mp3'
+            # Mono, 16kHz, compressed bitrate
+            with metrics.span("audio_extraction"):
+                audio_path = media_worker.extract_audio(
+                    video_path, os.path.join(temp_dir, "audio.mp3"), bitrate='64k'
                 )
-                .run(overwrite_output=True, quiet=True, capture_stderr=True)
-            )
-            if not os.path.exists(audio_path):
-                raise Exception("Audio extraction failed")
             file_size = os.path.getsize(audio_path) / (1024 * 1024)  # Size in MB
             logger.info(f"Extracted audio file size: {file_size:.2f}MB")
-            if file_size > 24:
-                return self._transcribe_large_audio(audio_path, temp_dir)
-            else:
-                return self._transcribe_audio_sync(audio_path)
+            return self._transcribe_audio_sync(audio_path, temp_dir)
             
         except Exception as e:
             logger.warning("Returning empty transcript due to error")
             return ""
     
-    def _transcribe_large_audio(self, audio_path: str, temp_dir: str) -> str:
-        try:
-            from pydub import AudioSegment
-            audio = AudioSegment.from_file(audio_path)
-            chunk_length_ms = 10 * 60 * 1000
-            chunks = []
-            for i in range(0, len(audio), chunk_length_ms):
-                chunk = audio[i:i + chunk_length_ms]
-                chunk_path = os.path.join(temp_dir, f"chunk_{i}.mp3")
-                chunk.export(chunk_path, format="mp3", bitrate="64k")
-                chunks.append(chunk_path)
-            
-            logger.info(f"Split audio into {len(chunks)} chunks")
-            transcripts = []
-            for idx, chunk_path in enumerate(chunks):
-                try:
-                    transcript = self._transcribe_audio_sync(chunk_path)
-                    transcripts.append(transcript)
-                    logger.info(f"Transcribed chunk {idx + 1}/{len(chunks)}")
-                except Exception as e:
-                    logger.warning(f"Failed to transcribe chunk {idx + 1}: {str(e)}")
-                    continue
-            full_transcript = " ".join(transcripts)
-            return full_transcript
-            
-        except ImportError:
-            logger.error("pydub not installed, cannot chunk large audio files")
-            # Fallback: try to transcribe anyway
-            try:
-                return self._transcribe_audio_sync(audio_path)
-            except:
-                return ""
-        except Exception as e:
-            logger.error(f"Error transcribing large audio: {str(e)}")
-            return ""
-
-    def _extract_smart_frames(self, video_path: str, max_frames: int = 5) -> List[str]:
-        try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                raise Exception("Cannot open video file")
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if total_frames <= max_frames:
-                frame_positions = list(range(total_frames))
-            else:
-                frame_positions = [
-                    0,  
-                    total_frames // 4,  # 25%
-                    total_frames // 2,  # 50% (middle)
-                    (3 * total_frames) // 4,  # 75%
-                    total_frames - 1  # Last frame
-                ]
-            encoded_frames = []
-            for pos in frame_positions:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, pos)
-                ret, frame = cap.read()
-                if ret:
-                    # Resize frame to reduce size (max width 800px)
-                    height, width = frame.shape[:2]
-                    if width > 800:
-                        ratio = 800 / width
-                        new_width = 800
-                        new_height = int(height * ratio)
-                        frame = cv2.resize(frame, (new_width, new_height))
-                    
-                    success, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    if success:
-                        frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                        encoded_frames.append(frame_base64)
-            
-            cap.release()
-            
-            logger.info(f"Extracted {len(encoded_frames)} representative frames from video")
-            return encoded_frames
-            
-        except Exception as e:
-            logger.error(f"Error extracting frames: {str(e)}")
-            raise e
-
     async def close(self):
         """Clean up resources"""
         self.executor.shutdown(wait=True)
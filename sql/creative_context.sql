@@ -0,0 +1,79 @@
+-- Personas, creative assets and the projects that own them, fetched and
+-- ownership-checked in one round-trip. Called through PostgREST as
+-- POST /rest/v1/rpc/creative_context by app.helpers.repository, authenticated
+-- with SUPABASE_SERVICE_ROLE_KEY (execution is granted to service_role only).
+--
+-- Returns {"personas": [...], "assets": [...], "projects": [...]} when every
+-- requested row exists and belongs to p_user_id, otherwise
+-- {"error": {"status": 404 | 403, "code": ..., "id": <offending id>}} and no rows.
+
+create or replace function public.creative_context(
+    p_user_id uuid,
+    p_persona_ids bigint[],
+    p_asset_ids bigint[]
+)
+returns jsonb
+language plpgsql
+stable
+security definer
+set search_path = public
+as $$
+declare
+    v_id bigint;
+begin
+    select wanted.id into v_id
+    from unnest(p_persona_ids) as wanted(id)
+    where not exists (select 1 from personas p where p.id = wanted.id)
+    limit 1;
+    if found then
+        return jsonb_build_object('error', jsonb_build_object('status', 404, 'code', 'persona_not_found', 'id', v_id));
+    end if;
+
+    select p.id into v_id
+    from personas p
+    where p.id = any(p_persona_ids) and p.user_id is distinct from p_user_id
+    limit 1;
+    if found then
+        return jsonb_build_object('error', jsonb_build_object('status', 403, 'code', 'persona_not_owned', 'id', v_id));
+    end if;
+
+    select wanted.id into v_id
+    from unnest(p_asset_ids) as wanted(id)
+    where not exists (select 1 from creative_assets a where a.id = wanted.id)
+    limit 1;
+    if found then
+        return jsonb_build_object('error', jsonb_build_object('status', 404, 'code', 'asset_not_found', 'id', v_id));
+    end if;
+
+    select a.id into v_id
+    from creative_assets a
+    left join projects pr on pr.id = a.project_id
+    where a.id = any(p_asset_ids) and pr.user_id is distinct from p_user_id
+    limit 1;
+    if found then
+        return jsonb_build_object('error', jsonb_build_object('status', 403, 'code', 'asset_not_owned', 'id', v_id));
+    end if;
+
+    return jsonb_build_object(
+        'personas', (
+            select coalesce(jsonb_agg(to_jsonb(p)), '[]'::jsonb)
+            from personas p
+            where p.id = any(p_persona_ids)
+        ),
+        'assets', (
+            select coalesce(jsonb_agg(to_jsonb(a) order by a.id), '[]'::jsonb)
+            from creative_assets a
+            where a.id = any(p_asset_ids)
+        ),
+        'projects', (
+            select coalesce(jsonb_agg(to_jsonb(pr)), '[]'::jsonb)
+            from projects pr
+            where pr.id in (select a.project_id from creative_assets a where a.id = any(p_asset_ids))
+        )
+    );
+end;
+$$;
+
+-- The function trusts p_user_id, so only the backend's service role may call it
+revoke execute on function public.creative_context(uuid, bigint[], bigint[]) from public, anon, authenticated;
+grant execute on function public.creative_context(uuid, bigint[], bigint[]) to service_role;
@@ -0,0 +1,88 @@
+-- Usage quotas kept on users (pretests_count, projects_count), changed atomically in
+-- one round-trip. Called through PostgREST (POST /rest/v1/rpc/<function>) by
+-- app.helpers.quota, authenticated with SUPABASE_SERVICE_ROLE_KEY (execution is
+-- granted to service_role only).
+
+-- Count one more use if the counter is under p_limit (no limit when NULL).
+-- Returns {"granted": true, "count": <new count>} or {"granted": false, "count": <current count>}.
+-- A user without a users row is let through uncounted, as before the quota moved here:
+-- {"granted": true, "count": 0, "user_found": false}.
+-- The row lock taken by the UPDATE serialises concurrent reservations, so none is lost
+-- and the limit cannot be overshot.
+create or replace function public.reserve_quota(p_user_id uuid, p_counter text, p_limit integer)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_count integer;
+begin
+    if p_counter not in ('pretests_count', 'projects_count') then
+        raise exception 'Unknown quota counter %', p_counter;
+    end if;
+
+    execute format(
+        'update users set %1$I = coalesce(%1$I, 0) + 1
+         where id = $1 and ($2::integer is null or coalesce(%1$I, 0) < $2::integer)
+         returning %1$I',
+        p_counter
+    ) into v_count using p_user_id, p_limit;
+    if v_count is not null then
+        return jsonb_build_object('granted', true, 'count', v_count);
+    end if;
+
+    execute format('select coalesce(%1$I, 0) from users where id = $1', p_counter)
+        into v_count using p_user_id;
+    if not found then
+        return jsonb_build_object('granted', true, 'count', 0, 'user_found', false);
+    end if;
+    return jsonb_build_object('granted', false, 'count', v_count);
+end;
+$$;
+
+-- Give back a reservation whose work failed. Returns the new count.
+create or replace function public.release_quota(p_user_id uuid, p_counter text)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_count integer;
+begin
+    if p_counter not in ('pretests_count', 'projects_count') then
+        raise exception 'Unknown quota counter %', p_counter;
+    end if;
+
+    execute format(
+        'update users set %1$I = greatest(coalesce(%1$I, 0) - 1, 0) where id = $1 returning %1$I',
+        p_counter
+    ) into v_count using p_user_id;
+    return coalesce(v_count, 0);
+end;
+$$;
+
+-- Start a counter over, e.g. when the user buys or changes plan.
+create or replace function public.reset_quota(p_user_id uuid, p_counter text)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if p_counter not in ('pretests_count', 'projects_count') then
+        raise exception 'Unknown quota counter %', p_counter;
+    end if;
+
+    execute format('update users set %I = 0 where id = $1', p_counter) using p_user_id;
+end;
+$$;
+
+-- The functions trust p_user_id, so only the backend's service role may call them
+revoke execute on function public.reserve_quota(uuid, text, integer) from public, anon, authenticated;
+revoke execute on function public.release_quota(uuid, text) from public, anon, authenticated;
+revoke execute on function public.reset_quota(uuid, text) from public, anon, authenticated;
+grant execute on function public.reserve_quota(uuid, text, integer) to service_role;
+grant execute on function public.release_quota(uuid, text) to service_role;
+grant execute on function public.reset_quota(uuid, text) to service_role;
@@ -0,0 +1,132 @@
+"""
+Database round-trips made by the queueing handlers, counted against a Repository
+backed by httpx.MockTransport. A change that adds a query to a request (an N+1
+lookup, a second ownership check) fails here, and in strict mode query_budget
+itself raises.
+
+Run from the repository (conftest.py registers it as the app package):
+    python -m pytest tests
+"""
+import asyncio
+import os
+
+# The clients created at import time refuse to start without these; nothing is sent to them
+os.environ.setdefault("SUPABASE_URL", "http://postgrest.invalid")
+os.environ.setdefault("SUPABASE_KEY", "test.anon.key")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test.service.key")
+os.environ.setdefault("OPENAI_API_KEY", "test-openai-key")
+
+import httpx
+import pytest
+from fastapi import HTTPException, Response
+
+from app.helpers import quota as quota_module
+from app.helpers import repository as repository_module
+from app.helpers import tier as tier_module
+from app.helpers.repository import Repository, query_budget
+from app.helpers.tier import TierService
+from app.routers import pretest, simulate
+from app.schemas.pretest import PretestRequest
+from app.service.job_queue import JobQueue
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+CREATIVE_CONTEXT = {
+    "personas": [{"id": 1, "audience_type": "B2C"}, {"id": 2, "audience_type": "B2B"}],
+    "assets": [
+        {"id": 10, "type": "text", "project_id": 7, "file_url": None, "ad_copy": "Buy now"},
+        {"id": 11, "type": "image", "project_id": 7, "file_url": "https://cdn.invalid/a.png"},
+    ],
+    "projects": [{"id": 7, "user_id": USER_ID, "name": "Launch"}],
+}
+
+
+class PostgREST:
+    """Answers the handlers' queries and records each round-trip as (method, path)"""
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/rest/v1")
+        self.requests.append((request.method, path))
+        if path == "/subscriptions":
+            return httpx.Response(200, json=[{"tier": "pro", "status": "active", "end_date": None}])
+        if path == "/rpc/creative_context":
+            return httpx.Response(200, json=CREATIVE_CONTEXT)
+        if path == "/rpc/reserve_quota":
+            return httpx.Response(200, json={"granted": True, "count": 1})
+        return httpx.Response(404, json={"message": f"unexpected {request.method} {path}"})
+
+
+@pytest.fixture
+def postgrest(monkeypatch, tmp_path):
+    server = PostgREST()
+    repository = Repository(
+        "http://postgrest.invalid", "anon-key", transport=httpx.MockTransport(server), service_key="service-key"
+    )
+    for module in (tier_module, quota_module, pretest, simulate):
+        monkeypatch.setattr(module, "repository", repository)
+    # No tier cache, so the tier lookup is a round-trip on every request
+    tier_service = TierService(backend="off")
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    for module in (pretest, simulate):
+        monkeypatch.setattr(module, "tier_service", tier_service)
+        monkeypatch.setattr(module, "job_queue", job_queue)
+    monkeypatch.setattr(repository_module, "REPOSITORY_STRICT_QUERY_BUDGET", True)
+    return server
+
+
+def test_queue_pretest_round_trips(postgrest):
+    request = PretestRequest(
+        persona_id="1", channels=["meta"], creative_ids=[10, 11],
+        headline="Headline", title="Title", description="Description",
+    )
+
+    job_id = asyncio.run(pretest._queue_pretest(request, {"id": USER_ID}))
+
+    assert job_id
+    assert postgrest.requests == [
+        ("GET", "/subscriptions"),
+        ("POST", "/rpc/creative_context"),
+        ("POST", "/rpc/reserve_quota"),
+    ]
+
+
+def test_create_simulation_round_trips(postgrest):
+    variant = {"headline": "Headline", "title": "Title", "description": "Description"}
+    request = {
+        "variant_a": {**variant, "persona_id": 1, "creative_ids": [10]},
+        "variant_b": {**variant, "persona_id": 2, "creative_ids": [11]},
+    }
+
+    body = asyncio.run(simulate.create_simulation(request, Response(), {"id": USER_ID}))
+
+    assert body["job_id"]
+    assert postgrest.requests == [
+        ("GET", "/subscriptions"),
+        ("POST", "/rpc/creative_context"),
+    ]
+
+
+def test_create_simulation_rejects_non_numeric_persona_id(postgrest):
+    variant = {"headline": "Headline", "title": "Title", "description": "Description", "creative_ids": [10]}
+    request = {"variant_a": {**variant, "persona_id": "abc"}, "variant_b": {**variant, "persona_id": 2}}
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(simulate.create_simulation(request, Response(), {"id": USER_ID}))
+
+    assert error.value.status_code == 400
+    assert postgrest.requests == [("GET", "/subscriptions")]
+
+
+def test_query_budget_raises_over_budget_in_strict_mode(postgrest):
+    repository = pretest.repository
+
+    @query_budget(1)
+    async def lookup_twice():
+        await repository.select("subscriptions")
+        await repository.select("subscriptions")
+
+    with pytest.raises(AssertionError, match="made 2 database round-trips"):
+        asyncio.run(lookup_twice())